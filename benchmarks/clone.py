@@ -0,0 +1,145 @@
+"""Offline benchmarks of ``ebrains-clone`` against a local stand-in KG
+
+The stand-in (see ``kg_standin``) serves a synthetic dataset, hence the
+numbers are repeatable and require no network access, or EBRAINS account.
+Besides the end-to-end runtime of a clone, the principal stages are timed
+individually: the version query, the file listings, the registration of
+files, and saving a version.
+
+These are asv benchmarks, but they can also be run directly for a quick
+report::
+
+    python -m benchmarks.clone --versions 5 --files 10000
+"""
+
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+import warnings
+
+from datalad import cfg as dlcfg
+
+from .kg_standin import StandInKG
+
+
+class _StandInBenchmark:
+    params = ([1, 5], [100, 10000])
+    param_names = ['versions', 'files']
+    # every sample needs a fresh setup, e.g., an empty dataset
+    number = 1
+    repeat = 3
+    timeout = 600
+
+    def setup(self, versions, files):
+        self.kg = StandInKG(versions=versions, files=files).start()
+        self.tmpdir = Path(tempfile.mkdtemp(prefix='datalad_ebrains_bench'))
+        self._env = patch.dict(os.environ, {'KG_AUTH_TOKEN': 'bench'})
+        self._env.start()
+        self._overrides = {
+            'datalad.ebrains.kg-host': self.kg.host,
+            # we want to measure the queries
+            'datalad.ebrains.kg-cache': 'no',
+        }
+        for k, v in self._overrides.items():
+            dlcfg.set(k, v, scope='override')
+        warnings.simplefilter('ignore')
+        from datalad_ebrains.fairgraph_query import FairGraphQuery
+        self.fq = FairGraphQuery()
+
+    def teardown(self, versions, files):
+        for k in self._overrides:
+            dlcfg.unset(k, scope='override')
+        self._env.stop()
+        self.kg.stop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _get_versions(self):
+        return self.fq.get_dataset_versions_from_id(self.kg.dataset_id)[1]
+
+    def _get_listings(self, versions):
+        return [list(self.fq.get_file_records(None, v)) for v in versions]
+
+    def _create_ds(self, versions):
+        from datalad.api import Dataset
+        return self.fq.create_ds(
+            Dataset(self.tmpdir / 'ds'), versions[0], self.kg.dataset_id)
+
+
+class Clone(_StandInBenchmark):
+    def time_clone(self, versions, files):
+        from datalad.api import ebrains_clone
+        ebrains_clone(
+            self.kg.dataset_id,
+            self.tmpdir / 'clone',
+            result_renderer='disabled',
+        )
+
+
+class Stages(_StandInBenchmark):
+    def setup(self, versions, files):
+        super().setup(versions, files)
+        # the inputs of the later stages
+        self.versions = self._get_versions()
+        self.listings = self._get_listings(self.versions)
+        self.ds = self._create_ds(self.versions)
+
+    def time_version_query(self, versions, files):
+        self._get_versions()
+
+    def time_file_listing(self, versions, files):
+        self._get_listings(self.versions)
+
+    def time_registration(self, versions, files):
+        # the first version, all files are new
+        for res in self.fq.import_files(
+                self.ds, self.versions[0], self.listings[0]):
+            pass
+
+
+class Save(_StandInBenchmark):
+    def setup(self, versions, files):
+        super().setup(versions, files)
+        self.versions = self._get_versions()
+        self.ds = self._create_ds(self.versions)
+        for res in self.fq.import_files(
+                self.ds, self.versions[0],
+                self._get_listings(self.versions[:1])[0]):
+            pass
+
+    def time_save(self, versions, files):
+        for res in self.fq.save_ds_version(self.ds, self.versions[0]):
+            pass
+
+
+def _report(versions, files):
+    stages = Stages()
+    stages.setup(versions, files)
+    try:
+        for name in ('version_query', 'file_listing', 'registration'):
+            start = time.perf_counter()
+            getattr(stages, f'time_{name}')(versions, files)
+            print(f'{name:>16}: {time.perf_counter() - start:8.3f}s')
+    finally:
+        stages.teardown(versions, files)
+    for cls, name in ((Save, 'save'), (Clone, 'clone')):
+        bench = cls()
+        bench.setup(versions, files)
+        try:
+            start = time.perf_counter()
+            getattr(bench, f'time_{name}')(versions, files)
+            print(f'{name:>16}: {time.perf_counter() - start:8.3f}s')
+        finally:
+            bench.teardown(versions, files)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--versions', type=int, default=3)
+    parser.add_argument('--files', type=int, default=1000)
+    args = parser.parse_args()
+    print(f'{args.versions} versions, {args.files} files')
+    _report(args.versions, args.files)
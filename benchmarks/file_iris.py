@@ -0,0 +1,75 @@
+"""Benchmarks for deriving download URLs and file names from file IRIs
+
+This is done for every file of every imported version, hence it matters
+for datasets with millions of files. The fast implementation is timed
+against the reference implementation that parses every IRI.
+
+These are asv benchmarks, but they can also be run directly for a quick
+report::
+
+    python -m benchmarks.file_iris --files 1000000
+"""
+
+import time
+
+from datalad_ebrains.file_iris import (
+    _file_iri_to_url,
+    _get_fname_dataproxy_v1_bucket,
+    get_url_and_name_getter,
+)
+
+REPOSITORY_IRI = \
+    'https://data-proxy.ebrains.eu/api/v1/public/buckets/d-0a1b2c3d'
+
+
+def _get_iris(n):
+    # a BIDS-like layout, with some names that need quoting
+    return [
+        f'{REPOSITORY_IRI}/sub-{i // 100:05d}/'
+        f'{"anat" if i % 2 else "func"}/'
+        f'sub-{i // 100:05d}_run-{i % 100:02d}'
+        f'{" (copy)" if i % 10 == 0 else ""}.nii.gz'
+        for i in range(n)
+    ]
+
+
+def _reference(iri):
+    return _file_iri_to_url(iri), str(_get_fname_dataproxy_v1_bucket(iri))
+
+
+class FileIRIs:
+    params = [1_000_000]
+    param_names = ['files']
+    timeout = 600
+
+    def setup(self, files):
+        self.iris = _get_iris(files)
+
+    def time_fast(self, files):
+        get_url_and_name = get_url_and_name_getter(REPOSITORY_IRI)
+        for iri in self.iris:
+            get_url_and_name(iri)
+
+    def time_reference(self, files):
+        for iri in self.iris:
+            _reference(iri)
+
+
+def _report(files):
+    iris = _get_iris(files)
+    for name, get_url_and_name in (
+            ('fast', get_url_and_name_getter(REPOSITORY_IRI)),
+            ('reference', _reference)):
+        start = time.perf_counter()
+        for iri in iris:
+            get_url_and_name(iri)
+        print(f'{name:>16}: {time.perf_counter() - start:8.3f}s')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--files', type=int, default=1_000_000)
+    args = parser.parse_args()
+    print(f'{args.files} files')
+    _report(args.files)
@@ -0,0 +1,36 @@
+"""Benchmarks for the cost of importing the extension
+
+``datalad`` imports the modules of all commands of an extension to build
+its command line interface, hence this cost is paid by any ``datalad``
+call, including ``--help`` and tab completion.
+"""
+
+
+class Imports:
+    # import time varies a lot
+    repeat = 10
+
+    def timeraw_import_clone(self):
+        # runs in a fresh interpreter, nothing is imported yet
+        return 'import datalad_ebrains.clone'
+
+    def timeraw_import_command_suite(self):
+        return 'import datalad_ebrains.clone, datalad_ebrains.bulk_clone, ' \
+            'datalad_ebrains.authenticate'
+
+    def track_heavy_modules_imported(self):
+        # number of expensive modules that an import of the command
+        # modules pulls in, must be zero
+        import subprocess
+        import sys
+        return int(subprocess.run(
+            [sys.executable, '-c',
+             'import sys, datalad_ebrains.clone, datalad_ebrains.bulk_clone,'
+             ' datalad_ebrains.authenticate;'
+             'print(sum(m.split(".")[0] in ("fairgraph", "kg_core")'
+             ' or m == "datalad_ebrains._version" for m in sys.modules))'],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout)
+    track_heavy_modules_imported.unit = 'modules'
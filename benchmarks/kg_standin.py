@@ -0,0 +1,390 @@
+"""Local stand-in for the EBRAINS Knowledge Graph API
+
+Serves a synthetic EBRAINS dataset with a configurable number of versions
+and files, via the subset of the KG API (v3-beta) that is used by
+``ebrains-clone``: retrieval of individual instances, and (dynamic) queries.
+Queries are evaluated generically against the synthetic instances, hence
+the stand-in works with whatever queries fairgraph generates.
+
+Usage::
+
+    with StandInKG(versions=5, files=1000) as kg:
+        # kg.host is 'localhost:<port>', contacted via plain HTTP
+        ...
+
+Command line::
+
+    python -m benchmarks.kg_standin --versions 5 --files 1000
+"""
+
+import hashlib
+import json
+import re
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+import uuid
+
+from datalad_ebrains.tests.utils import (
+    JSONRequestHandler,
+    get_host,
+    start_server,
+    stop_server,
+)
+
+
+# the namespace of all KG instance IDs, independent of the host
+ID_NAMESPACE = 'https://kg.ebrains.eu/api/instances/'
+SPACE_PROP = 'https://core.kg.ebrains.eu/vocab/meta/space'
+
+
+def _get_vocab():
+    """Return the type and property namespaces of the openMINDS version
+    that the installed fairgraph speaks"""
+    import fairgraph.openminds.core as omcore
+    type_ = omcore.File.type_
+    if isinstance(type_, (list, tuple)):
+        type_ = type_[0]
+    context = omcore.File.context
+    props = context.get('@vocab') or context.get('vocab')
+    return type_.rsplit('/', 1)[0] + '/', props
+
+
+class StandInKG:
+    """Synthetic KG dataset, served from a local HTTP server
+
+    Each of the ``versions`` dataset versions has its own file repository
+    (a data-proxy bucket) with ``files`` files. Consecutive versions share
+    most files, a fraction of ``changes`` is modified, and as many are added.
+    A fraction of ``unchanged`` versions only changes metadata, and shares
+    the file repository of the previous version. All identifiers are
+    derived from ``seed``, hence the served metadata are identical across
+    runs.
+    """
+    def __init__(self, versions=3, files=100, *, changes=0.1, unchanged=0.0,
+                 seed='bench', dirs=10):
+        self.types, self.props = _get_vocab()
+        self._seed = seed
+        self.instances = {}
+        # reverse links: (prop, target @id) -> [source @id]
+        self._reverse = {}
+        self._build(versions, files, changes, unchanged, dirs)
+        self._server = None
+
+    @property
+    def host(self):
+        return get_host(self._server)
+
+    def start(self):
+        self._server = start_server(
+            type('_Handler', (_Handler,), dict(kg=self)))
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            stop_server(self._server)
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    #
+    # synthetic metadata
+    #
+    def _uuid(self, *parts):
+        # UUIDs are deterministic, but must look like version 4
+        digest = hashlib.sha256(
+            '/'.join((self._seed,) + parts).encode()).digest()
+        return str(uuid.UUID(bytes=digest[:16], version=4))
+
+    def _add(self, type_, uuid_, **props):
+        doc = {
+            '@id': ID_NAMESPACE + uuid_,
+            '@type': [self.types + type_],
+            # the KG reports instances without this as not (fully) accessible
+            'http://schema.org/identifier': [ID_NAMESPACE + uuid_],
+            SPACE_PROP: 'dataset',
+        }
+        for k, v in props.items():
+            doc[self.props + k] = v
+        self.instances[doc['@id']] = doc
+        for k, v in props.items():
+            for link in v if isinstance(v, list) else [v]:
+                if isinstance(link, dict) and set(link) == {'@id'}:
+                    self._reverse.setdefault(
+                        (self.props + k, link['@id']), []).append(
+                            doc['@id'])
+        return doc
+
+    def _build(self, nversions, nfiles, changes, unchanged, ndirs):
+        self.dataset_id = self._uuid('dataset')
+        self.version_ids = []
+        # name -> (md5sum, size) of the current version
+        files = {}
+        next_file = 0
+        nchanges = int(nfiles * changes)
+        repo = None
+        for v in range(nversions):
+            digest = hashlib.sha256(
+                f'{self._seed}/unchanged/{v}'.encode()).digest()
+            if repo and int.from_bytes(digest[:4], 'big') / 2 ** 32 \
+                    < unchanged:
+                self._add_version(v, repo)
+                continue
+            if not files:
+                new = nfiles
+            else:
+                # modify some existing files, and add as many
+                for name in sorted(files)[:nchanges]:
+                    files[name] = self._get_content(name, v)
+                new = nchanges
+            for i in range(next_file, next_file + new):
+                name = f'dir{i % ndirs}/file{i}.dat'
+                files[name] = self._get_content(name, v)
+            next_file += new
+            repo_uuid = self._uuid('repo', str(v))
+            bucket = f'https://data-proxy.ebrains.eu/api/v1/public/buckets/' \
+                f'd-{repo_uuid}'
+            repo = self._add(
+                'FileRepository', repo_uuid,
+                IRI=bucket,
+                name=f'd-{repo_uuid}',
+            )
+            for name, (md5sum, size) in files.items():
+                self._add(
+                    'File', self._uuid('file', str(v), name),
+                    IRI=f'{bucket}/{name}',
+                    name=name.rsplit('/', 1)[-1],
+                    hash={
+                        '@type': [self.types + 'Hash'],
+                        self.props + 'algorithm': 'MD5',
+                        self.props + 'digest': md5sum,
+                    },
+                    storageSize={
+                        '@type': [self.types + 'QuantitativeValue'],
+                        self.props + 'value': size,
+                    },
+                    fileRepository={'@id': repo['@id']},
+                )
+            self._add_version(v, repo)
+        self._add(
+            'Dataset', self.dataset_id,
+            fullName='Synthetic dataset',
+            hasVersion=[{'@id': ID_NAMESPACE + v} for v in self.version_ids],
+        )
+
+    def _add_version(self, v, repo):
+        version_uuid = self._uuid('version', str(v))
+        self._add(
+            'DatasetVersion', version_uuid,
+            fullName=f'Synthetic dataset v{v + 1}',
+            versionIdentifier=f'v{v + 1}',
+            versionInnovation=f'Version {v + 1} of a synthetic dataset'
+            if v else 'This is the first version of this dataset.',
+            releaseDate=f'{2020 + v // 12}-{v % 12 + 1:02d}-01',
+            repository={'@id': repo['@id']},
+        )
+        self.version_ids.append(version_uuid)
+
+    def _get_content(self, name, version):
+        md5sum = hashlib.md5(f'{name}@{version}'.encode()).hexdigest()
+        return md5sum, 1000 + int(md5sum[:4], 16)
+
+    #
+    # query evaluation
+    #
+    def query(self, query, params):
+        """Return all records matching a KG query, and their total count"""
+        type_ = query['meta']['type']
+        instance_id = params.get('instanceId')
+        records = []
+        for doc in self.instances.values():
+            if type_ not in doc['@type']:
+                continue
+            if instance_id and doc['@id'] != ID_NAMESPACE + instance_id:
+                continue
+            rec = self._project(
+                doc, query['structure'], params, query.get('@context', {}))
+            if rec is not None:
+                records.append(rec)
+        for item in query['structure']:
+            if item.get('sort'):
+                key = _get_output_key(item, query.get('@context', {}))
+                records.sort(key=lambda r: str(r.get(key)))
+                break
+        return records
+
+    def _project(self, doc, structure, params, context):
+        rec = {}
+        for item in structure:
+            values = self._follow(doc, item['path'])
+            if 'structure' in item:
+                values = [
+                    v for v in (
+                        self._project(v, item['structure'], params, context)
+                        for v in values if isinstance(v, dict))
+                    if v is not None
+                ]
+            filt = item.get('filter')
+            if filt:
+                if 'value' in filt:
+                    value = filt['value']
+                else:
+                    value = params.get(filt.get('parameter'))
+                if value is not None or filt['op'] == 'IS_EMPTY':
+                    values = [
+                        v for v in values
+                        if _match(filt['op'], v, value)
+                    ]
+                    if not values and filt['op'] != 'IS_EMPTY':
+                        return None
+            if item.get('required') and not values:
+                return None
+            key = _get_output_key(item, context)
+            if key == '@type':
+                rec[key] = values
+            elif not values:
+                rec[key] = None
+            elif len(values) == 1 or item.get('singleValue'):
+                rec[key] = values[0]
+            else:
+                rec[key] = values
+        return rec
+
+    def _follow(self, doc, path):
+        values = [doc]
+        for step in path if isinstance(path, list) else [path]:
+            values = [
+                v for d in values if isinstance(d, dict)
+                for v in self._step(d, step)
+            ]
+        return values
+
+    def _step(self, doc, step):
+        if step in ('@id', '@type'):
+            v = doc.get(step)
+            return v if isinstance(v, list) else [v] if v else []
+        if isinstance(step, dict):
+            prop = step['@id']
+            if step.get('reverse'):
+                values = [
+                    self.instances[i]
+                    for i in self._reverse.get((prop, doc.get('@id')), [])
+                ]
+            else:
+                values = self._step(doc, prop)
+            types = step.get('typeFilter')
+            if types:
+                types = {
+                    t['@id'] if isinstance(t, dict) else t
+                    for t in (types if isinstance(types, list) else [types])
+                }
+                values = [v for v in values
+                          if types.intersection(v.get('@type', []))]
+            return values
+        values = doc.get(step)
+        if values is None:
+            return []
+        return [
+            # links are followed into the linked instance, if it exists
+            self.instances.get(v['@id'], v)
+            if isinstance(v, dict) and set(v) == {'@id'} else v
+            for v in (values if isinstance(values, list) else [values])
+        ]
+
+
+def _get_output_key(item, context):
+    key = item.get('propertyName')
+    if key:
+        # compact IRIs are expanded with the query context
+        prefix, _, name = key.partition(':')
+        if name and isinstance(context.get(prefix), str):
+            return context[prefix] + name
+        return key
+    path = item['path']
+    return path if isinstance(path, str) else '@id'
+
+
+def _match(op, value, ref):
+    value = '' if value is None else str(value)
+    if op == 'EQUALS':
+        return value == str(ref)
+    elif op == 'CONTAINS':
+        return str(ref).lower() in value.lower()
+    elif op == 'STARTS_WITH':
+        return value.startswith(str(ref))
+    elif op == 'ENDS_WITH':
+        return value.endswith(str(ref))
+    elif op == 'REGEX':
+        return re.search(str(ref), value) is not None
+    elif op == 'IS_EMPTY':
+        return not value
+    raise NotImplementedError(f'Unsupported filter operation {op}')
+
+
+class _Handler(JSONRequestHandler):
+    # set by StandInKG.start()
+    kg = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path
+        if path.endswith('/users/authorization/tokenEndpoint'):
+            self.respond(200, dict(data=dict(
+                endpoint=f'http://{self.kg.host}/token')))
+        elif path.endswith('/users/me'):
+            self.respond(200, dict(data={
+                '@id': ID_NAMESPACE + 'benchmark-user',
+                'http://schema.org/name': 'Benchmark user',
+            }))
+        elif '/instances/' in path:
+            doc = self.kg.instances.get(
+                ID_NAMESPACE + path.rsplit('/', 1)[-1])
+            if doc is None:
+                self.respond(404, dict(error=dict(code=404)))
+            else:
+                self.respond(200, dict(data=doc))
+        else:
+            self.respond(404, dict(error=dict(code=404)))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        payload = self.read_body()
+        if not url.path.endswith('/queries'):
+            self.respond(404, dict(error=dict(code=404)))
+            return
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        records = self.kg.query(json.loads(payload), params)
+        start = int(params.get('from', 0))
+        size = params.get('size')
+        page = records[start:start + int(size)] if size else records[start:]
+        self.respond(200, dict(
+            data=page,
+            total=len(records),
+            size=len(page),
+            **{'from': start},
+        ))
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--versions', type=int, default=3)
+    parser.add_argument('--files', type=int, default=100)
+    args = parser.parse_args()
+    with StandInKG(versions=args.versions, files=args.files) as kg:
+        print(f'Serving dataset {kg.dataset_id} at {kg.host}, versions:')
+        for v in kg.version_ids:
+            print(f'  {v}')
+        print("Use with: datalad -c datalad.ebrains.kg-host="
+              f"{kg.host} ebrains-clone {kg.dataset_id}")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
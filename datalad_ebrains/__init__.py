@@ -11,12 +11,236 @@ command_suite = (
     [
         ('datalad_ebrains.clone', 'Clone',
          'ebrains-clone', 'ebrains_clone'),
+        ('datalad_ebrains.bulk_clone', 'BulkClone',
+         'ebrains-bulk-clone', 'ebrains_bulk_clone'),
         ('datalad_ebrains.authenticate', 'Authenticate',
          'ebrains-authenticate', 'ebrains_authenticate')
     ]
 )
 
 
-from . import _version
-__version__ = _version.get_versions()['version']
-del _version
+# register configuration items of this extension in datalad-core
+from datalad.support.extensions import register_config  # noqa: E402
+
+from datalad_next.constraints import (  # noqa: E402
+    EnsureBool,
+    EnsureChoice,
+    EnsureInt,
+    EnsureRange,
+    EnsureStr,
+)
+
+register_config(
+    'datalad.ebrains.kg-cache',
+    'Cache EBRAINS Knowledge Graph query responses on disk?',
+    description='If enabled, responses to metadata queries performed by '
+    '``ebrains-clone`` are stored in a persistent on-disk cache and reused '
+    'by subsequent runs (for the same user identity). Disable to bypass '
+    'the cache entirely, and always query the Knowledge Graph.',
+    type=EnsureBool(),
+    default=True,
+    dialog='yesno',
+)
+register_config(
+    'datalad.ebrains.kg-cache-ttl',
+    'Maximum age of cached Knowledge Graph responses (in seconds)',
+    description='Cached responses older than this are ignored and '
+    'replaced by a fresh query result.',
+    type=EnsureInt() & EnsureRange(min=0),
+    default=7 * 24 * 3600,
+    dialog='question',
+)
+register_config(
+    'datalad.ebrains.kg-cache-maxsize',
+    'Maximum size of the Knowledge Graph response cache (in MB)',
+    description='When the cache grows beyond this size, the least recently '
+    'used entries are evicted.',
+    type=EnsureInt() & EnsureRange(min=0),
+    default=1024,
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.kg-host',
+    'Host name of the EBRAINS Knowledge Graph API',
+    description='Only needs to be changed for testing and benchmarking, '
+    'e.g., against a local stand-in of the Knowledge Graph. Host names '
+    'starting with ``localhost`` are contacted via plain HTTP.',
+    type=EnsureStr(),
+    default='core.kg.ebrains.eu',
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.credential',
+    'Name of the DataLad credential with an EBRAINS access token',
+    description='``ebrains-authenticate`` stores access and refresh token '
+    'in DataLad\'s credential system under this name (and the name with '
+    'a ``-refresh`` suffix). Unless the ``KG_AUTH_TOKEN`` environment '
+    'variable is set, ``ebrains-clone`` uses the stored token, and renews '
+    'it automatically before it expires.',
+    type=EnsureStr(),
+    default='ebrains',
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.max-requests',
+    'Maximum number of concurrent Knowledge Graph requests',
+    description='Independent queries (e.g., for the pages of a file '
+    'listing) are performed in parallel, with at most this many requests '
+    'running at the same time. The limit applies to the whole process, '
+    'i.e., to all prefetched listings, and all datasets of a bulk clone '
+    'together.',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=4,
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.http-pool-size',
+    'Number of HTTP connections to keep alive for Knowledge Graph requests',
+    description='All Knowledge Graph requests share a pool of persistent '
+    'connections, such that connection setup and TLS handshakes are not '
+    'repeated for every request. This should be at least as large as the '
+    'number of concurrent requests (``datalad.ebrains.max-requests``). '
+    'Connection reuse is reported in the debug log.',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=16,
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.prefetch-versions',
+    'Number of dataset versions to prefetch file listings for',
+    description='While the files of one dataset version are registered '
+    'and saved, the file listings of up to this many subsequent versions '
+    'are retrieved in the background. Each prefetched listing is held '
+    'in memory until it is processed. Set to 0 to disable prefetching.',
+    type=EnsureInt() & EnsureRange(min=0),
+    default=2,
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.parallel-pages',
+    'Retrieve pages of large file listings in parallel?',
+    description='If enabled, the total number of files in a file '
+    'repository is determined first, and subsequent pages of the file '
+    'listing are then retrieved concurrently (subject to '
+    '``datalad.ebrains.max-requests``). Records are still processed in '
+    'listing order.',
+    type=EnsureBool(),
+    default=True,
+    dialog='yesno',
+)
+
+register_config(
+    'datalad.ebrains.listing-batch-size',
+    'Maximum number of file repositories to list with a single query',
+    description='Each Knowledge Graph query takes substantial time, '
+    'regardless of the number of records it returns. With a batch size '
+    'larger than 1, the files of the file repositories of up to this many '
+    'consecutive dataset versions are listed with a single query, and '
+    'split by version afterwards. All listings of a batch are held in '
+    'memory until they are processed.',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=1,
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.spill-threshold',
+    'Maximum number of file records of a version to hold in memory',
+    description='The file records of versions with more files are stored '
+    "in a temporary database in the dataset's .git directory while the "
+    'version is imported. This bounds the memory needed for very large '
+    'file listings, at the expense of some speed. Such versions are '
+    "registered with the 'batch' backend, regardless of "
+    'datalad.ebrains.register-backend, except on adjusted branches, where '
+    "only 'addurls' is supported, and memory is not bounded.",
+    type=EnsureInt() & EnsureRange(min=1),
+    default=1000000,
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.page-size',
+    'Initial number of records per page of a file listing query',
+    description='The page size adapts to the measured throughput of '
+    'requests: it grows while throughput improves and shrinks after '
+    'failed requests. Chosen sizes are reported in the debug log.',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=10000,
+    dialog='question',
+)
+register_config(
+    'datalad.ebrains.max-page-size',
+    'Maximum number of records per page of a file listing query',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=100000,
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.register-backend',
+    'Implementation used for registering annexed files',
+    description="'addurls' registers files via DataLad's ``addurls`` "
+    "command. 'batch' streams annex keys and URLs through long-running "
+    'git-annex batch processes, and stages all symlinks at once, which is '
+    "substantially faster for large file listings. 'batch' is not "
+    "supported on adjusted branches (e.g., on crippled filesystems), "
+    "'addurls' is used in this case.",
+    type=EnsureChoice('addurls', 'batch'),
+    default='addurls',
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.shard-threshold',
+    'Number of files of a top-level directory to import it as a subdataset',
+    description='Any top-level directory with at least this many files in '
+    'a dataset version is imported as a subdataset, which keeps the index '
+    'and trees of each repository small. A directory that has become a '
+    'subdataset remains one in later versions. Set to 1 to import all '
+    'top-level directories as subdatasets, and to 0 to not create any '
+    "subdatasets. Subdatasets are not supported by the 'fast-import' "
+    'engine, all versions are imported in the worktree.',
+    type=EnsureInt() & EnsureRange(min=0),
+    default=0,
+    dialog='question',
+)
+register_config(
+    'datalad.ebrains.shard-jobs',
+    'Maximum number of subdatasets to import concurrently',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=4,
+    dialog='question',
+)
+
+register_config(
+    'datalad.ebrains.engine',
+    'Implementation used for building the version history of a new clone',
+    description="'datalad' builds each version in the worktree, registers "
+    "its files, and saves it. 'fast-import' writes the commits of all "
+    "versions in a single 'git fast-import' stream, without touching the "
+    'worktree until the end, which is substantially faster for datasets '
+    'with many versions. Both produce identical commits. '
+    "'fast-import' is only used for new clones (not with --update), and "
+    'not on adjusted branches (e.g., on crippled filesystems).',
+    type=EnsureChoice('datalad', 'fast-import'),
+    default='datalad',
+    dialog='question',
+)
+
+
+def __getattr__(name):
+    # the version is determined on first access only. In a development
+    # checkout this involves calling Git, which is too expensive for every
+    # import of the command suite
+    if name == '__version__':
+        from ._version import get_versions
+        global __version__
+        __version__ = get_versions()['version']
+        return __version__
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,225 @@
+"""Bulk registration of annexed files with known keys and URLs
+
+This is an alternative to ``addurls`` for the case where annex key, URL, and
+file name are known for every file upfront. Instead of processing one file
+at a time, all records are streamed through long-running git-annex batch
+processes, and the resulting symlinks are staged with a single
+``git update-index`` call.
+"""
+
+from collections.abc import Collection
+from itertools import islice
+import json
+import logging
+import os
+from pathlib import PurePath
+import subprocess
+from threading import Thread
+
+from datalad_next.commands import get_status_dict
+from datalad_next.exceptions import CapturedException
+
+
+lgr = logging.getLogger('datalad.ext.ebrains.annex_batch')
+
+
+def register_files(ds, frecs):
+    """Register files given by ``frecs`` in dataset ``ds``
+
+    Records are ``FileRecord``s, with the fields ``url``, ``name``,
+    ``md5sum``, and ``size``. Annex keys are determined exactly like
+    ``addurls(key='et:MD5-s{size}--{md5sum}')`` would (i.e., as MD5E keys
+    with git-annex's choice of file name extension). The dataset must
+    not be on an adjusted/managed branch, because symlinks are created
+    directly.
+
+    Yields a result record for each registered file.
+    """
+    with _BatchProcess(
+            ['git', 'annex', 'registerurl', '--batch'],
+            ds.path) as registerurl, \
+            _BatchProcess(
+                ['git', 'update-index', '--add', '-z', '--stdin'],
+                ds.path) as update_index:
+        for r, ek in iter_annex_keys(ds, frecs):
+            fpath = ds.pathobj / r.name
+            try:
+                if isinstance(ek, Exception):
+                    raise ek
+                key = ek['key']
+                registerurl.write(f"{key} {r.url}\n")
+                fpath.parent.mkdir(parents=True, exist_ok=True)
+                os.symlink(get_symlink_target(r.name, ek), fpath)
+                update_index.write(f"{_posix(r.name)}\0")
+            except Exception as e:
+                yield get_status_dict(
+                    action='addurls',
+                    ds=ds,
+                    type='file',
+                    path=str(fpath),
+                    status='error',
+                    exception=CapturedException(e),
+                )
+                continue
+            yield get_status_dict(
+                action='addurls',
+                ds=ds,
+                type='file',
+                path=str(fpath),
+                key=key,
+                status='ok',
+                message='registered URL',
+            )
+    yield from get_batch_errors(ds, registerurl, update_index)
+
+
+def iter_annex_keys(ds, frecs):
+    """Yield each record in ``frecs`` with the properties of its annex key
+
+    Key properties are reported by ``git annex examinekey`` (``key``,
+    ``hashdirmixed``, etc.). If they cannot be determined for a record, an
+    exception is yielded instead of the properties. ``frecs`` is iterated
+    twice, anything but a collection is turned into a list first.
+    """
+    if not isinstance(frecs, Collection):
+        frecs = list(frecs)
+    if not len(frecs):
+        return
+    with _BatchProcess(
+            ['git', 'annex', 'examinekey', '--batch', '--json',
+             # this is what addurls does for an 'et:' key format
+             '--migrate-to-backend=MD5E'],
+            ds.path, consume_output=True) as examinekey:
+        # the key names go in, while key properties come out
+        examinekey.feed(
+            f"MD5-s{r.size}--{r.md5sum} {_posix(r.name)}\n"
+            for r in frecs
+        )
+        n = 0
+        for r, ek in zip(frecs, examinekey.iter_output()):
+            n += 1
+            try:
+                ek = json.loads(ek)
+            except Exception as e:
+                ek = e
+            yield r, ek
+    # examinekey died prematurely
+    for r in islice(frecs, n, None):
+        yield r, RuntimeError(
+            f'Could not determine annex key: {examinekey.stderr}')
+
+
+def get_symlink_target(name, ek):
+    """Return the symlink target for an annexed file
+
+    ``name`` is the (relative, platform-native) path of the file in the
+    dataset, and ``ek`` are the key properties reported by ``examinekey``.
+    The target is identical to the one git-annex would create.
+    """
+    depth = len(PurePath(name).parts) - 1
+    key = ek['key']
+    return '../' * depth \
+        + f".git/annex/objects/{ek['hashdirmixed']}{key}/{key}"
+
+
+def get_batch_errors(ds, *procs):
+    """Yield an error result for each batch process that failed"""
+    for p in procs:
+        if p.returncode:
+            yield get_status_dict(
+                action='addurls',
+                ds=ds,
+                status='error',
+                message=(
+                    "'%s' failed (exit code %i): %s",
+                    ' '.join(p.cmd), p.returncode, p.stderr),
+            )
+
+
+def _posix(name):
+    return PurePath(name).as_posix()
+
+
+class _BatchProcess:
+    """Long-running process with streamed input and output
+
+    Input can be fed from a background thread, and output that is not
+    consumed (``consume_output=False``) is drained in the background, such
+    that no pipe buffer can block either side.
+    """
+    def __init__(self, cmd, cwd, consume_output=False, encoding='utf-8'):
+        self.cmd = cmd
+        self.cwd = cwd
+        self.consume_output = consume_output
+        # None for binary I/O
+        self.encoding = encoding
+        self.returncode = None
+        self.stderr = ''
+        self._proc = None
+        self._threads = []
+        self._fed = False
+
+    def __enter__(self):
+        self._proc = subprocess.Popen(
+            self.cmd,
+            cwd=self.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding=self.encoding,
+        )
+        self._start(self._drain_stderr)
+        if not self.consume_output:
+            self._start(self._drain_stdout)
+        return self
+
+    def feed(self, lines):
+        """Write all ``lines`` to the process from a background thread"""
+        def _feed():
+            try:
+                for line in lines:
+                    self._proc.stdin.write(line)
+            except (BrokenPipeError, ValueError):
+                # the process died, or stdin was closed on exit
+                pass
+            finally:
+                self._close_stdin()
+        self._fed = True
+        self._start(_feed)
+
+    def write(self, line):
+        self._proc.stdin.write(line)
+
+    def iter_output(self):
+        for line in self._proc.stdout:
+            yield line.rstrip('\n' if self.encoding else b'\n')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.consume_output:
+            # whatever was not consumed, must not block the process
+            self._start(self._drain_stdout)
+        if not self._fed or exc_type is not None:
+            self._close_stdin()
+        self.returncode = self._proc.wait()
+        for t in self._threads:
+            t.join()
+
+    def _close_stdin(self):
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def _drain_stdout(self):
+        for line in self._proc.stdout:
+            pass
+
+    def _drain_stderr(self):
+        stderr = self._proc.stderr.read().strip()
+        self.stderr = stderr if self.encoding \
+            else stderr.decode('utf-8', errors='replace')
+
+    def _start(self, fn):
+        t = Thread(target=fn, daemon=True)
+        t.start()
+        self._threads.append(t)
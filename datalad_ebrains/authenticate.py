@@ -1,8 +1,10 @@
+import logging
 import sys
 
 from datalad import cfg as dlcfg
 from datalad_next.commands import (
     Interface,
+    Parameter,
     build_doc,
     generic_result_renderer,
     get_status_dict,
@@ -12,6 +14,9 @@ from datalad_next.exceptions import CapturedException
 from datalad_next.uis import ui_switcher as ui
 
 
+lgr = logging.getLogger('datalad.ext.ebrains.authenticate')
+
+
 @build_doc
 class Authenticate(Interface):
     """Obtain an EBRAINS authentication token
@@ -30,10 +35,33 @@ class Authenticate(Interface):
 
     which assigns the token to the ``KG_AUTH_TOKEN`` environment variable.
     This variable is, for example, honored by the ``ebrains-clone`` command.
+
+    In addition, the token is stored in DataLad's credential system,
+    together with a refresh token. When ``KG_AUTH_TOKEN`` is not set,
+    ``ebrains-clone`` uses the stored token, and renews it automatically
+    before it expires. Hence, authentication is only needed once, even for
+    clones that run for many hours.
     """
+    _params_ = dict(
+        credential=Parameter(
+            args=("--credential",),
+            metavar='NAME',
+            doc="""name of the credential to store the token under.
+            By default, the name configured in ``datalad.ebrains.credential``
+            is used.""",
+        ),
+        store=Parameter(
+            args=("--no-store",),
+            dest='store',
+            action='store_false',
+            doc="""do not store the token in DataLad's credential system,
+            only report it.""",
+        ),
+    )
+
     @staticmethod
     @eval_results
-    def __call__():
+    def __call__(credential=None, store=True):
         from kg_core.kg import kg
         k = kg()
 
@@ -64,6 +92,21 @@ class Authenticate(Interface):
                 exception=CapturedException(e),
             )
             return
+        if store:
+            from datalad_ebrains.token_store import store_token
+            credential = credential \
+                or dlcfg.obtain('datalad.ebrains.credential')
+            try:
+                refresh = _get_refresh_args(k._token_handler)
+            except RuntimeError as e:
+                lgr.warning('%s', CapturedException(e))
+                refresh = dict(refresh_token=None)
+            try:
+                store_token(credential, token, **refresh)
+            except Exception as e:
+                # the token itself is still useful
+                lgr.warning('Could not store token as credential %r: %s',
+                            credential, CapturedException(e))
         yield get_status_dict(
             action='ebrains-authenticate',
             status='ok',
@@ -83,6 +126,33 @@ class Authenticate(Interface):
         ui.message(res["token"])
 
 
+def _get_refresh_args(handler):
+    """Return what is needed to renew the token of a KG client token handler
+
+    Returns a dict with the ``refresh_token``, ``token_endpoint``, and
+    ``client_id`` arguments of ``store_token()``. Only the tokens of a
+    device flow can be renewed, for any other handler, the refresh token
+    is ``None``.
+    """
+    from kg_core.oauth import DeviceAuthenticationFlow
+    if not isinstance(handler, DeviceAuthenticationFlow):
+        return dict(refresh_token=None)
+    # kg-core keeps the refresh token of a device flow to itself, in
+    # private attributes (as of ebrains-kg-core 0.9)
+    private = '_DeviceAuthenticationFlow__'
+    try:
+        return {
+            name: getattr(handler, private + name)
+            for name in ('refresh_token', 'token_endpoint', 'client_id')
+        }
+    except AttributeError as e:
+        raise RuntimeError(
+            'Cannot obtain the refresh token from this version of '
+            'ebrains-kg-core, the access token will not be renewed '
+            "automatically, run 'datalad ebrains-authenticate' again "
+            'once it has expired') from e
+
+
 class _RedirectStdErr2StdOut:
     """Utility context manager to redirect stdout to stderr"""
     def __enter__(self):
@@ -0,0 +1,210 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from pathlib import Path
+from queue import Queue
+import re
+import warnings
+
+from datalad_next.commands import (
+    EnsureCommandParameterization,
+    ValidatedInterface,
+    Parameter,
+    build_doc,
+    eval_results,
+    get_status_dict,
+)
+from datalad_next.constraints import (
+    EnsureBool,
+    EnsureInt,
+    EnsureListOf,
+    EnsurePath,
+    EnsureRange,
+    EnsureStr,
+)
+from datalad_next.constraints.dataset import EnsureDataset
+from datalad_next.datasets import Dataset
+from datalad_next.exceptions import CapturedException
+
+from datalad_ebrains.checkpoint import has_checkpoint
+from datalad_ebrains.clone import uuid_regex
+
+lgr = logging.getLogger('datalad.ext.ebrains.bulk_clone')
+
+
+@build_doc
+class BulkClone(ValidatedInterface):
+    """Export many datasets from the EBRAINS Knowledge Graph at once
+
+    This command performs the equivalent of ``ebrains-clone`` for any number
+    of EBRAINS datasets (or dataset versions). Sources can be given as
+    arguments, and/or read from a file. Each source is cloned into a
+    subdirectory of ``--path``, named after the UUID in the source.
+
+    Sources are processed concurrently by a pool of workers. All workers
+    share the same Knowledge Graph client, authentication, and query
+    caches. Results are reported for each dataset individually, and a failure
+    to clone one dataset does not stop the processing of any other. Running
+    the same command again resumes the datasets whose clone was interrupted.
+
+    Please see the documentation of ``ebrains-clone`` for details on
+    authentication, performance, and the structure of the generated
+    datasets.
+
+    Examples
+    --------
+
+    Clone all datasets listed (one URL or UUID per line) in a text file,
+    four at a time::
+
+      datalad ebrains-bulk-clone --source-file ids.txt -J 4 --path mirror/
+
+    Bring all datasets in a mirror up-to-date::
+
+      datalad ebrains-bulk-clone --source-file ids.txt --update --path mirror/
+    """
+
+    _params_ = dict(
+        sources=Parameter(
+            args=("sources",),
+            metavar='URL',
+            nargs='*',
+            doc="""URLs including an ID of a dataset, or dataset version
+            in the EBRAINS knowledge graph (see ``ebrains-clone``).""",
+        ),
+        source_file=Parameter(
+            args=("--source-file",),
+            metavar='FILE',
+            doc="""file with additional sources, one URL or UUID per line.
+            Empty lines, and lines starting with '#' are ignored.""",
+        ),
+        path=Parameter(
+            args=("-p", "--path",),
+            metavar='PATH',
+            doc="""directory to clone into. Each dataset is placed into
+            a subdirectory named after its UUID. If no `path` is provided,
+            the current working directory is used."""),
+        jobs=Parameter(
+            args=("-J", "--jobs"),
+            metavar='NJOBS',
+            doc="""number of datasets to process concurrently.""",
+        ),
+        depth=Parameter(
+            args=("--depth",),
+            doc=""""Create shallow clones with histories truncated
+            to the specified number of version recorded in the knowledge
+            graph.""",
+        ),
+        update=Parameter(
+            args=("--update",),
+            action='store_true',
+            doc="""if a target dataset already exists, import only
+            dataset versions that are not yet present in it.""",
+        ),
+    )
+
+    _validator_ = EnsureCommandParameterization(dict(
+        sources=EnsureListOf(EnsureStr()),
+        source_file=EnsurePath(lexists=True),
+        path=EnsurePath(),
+        jobs=EnsureInt() & EnsureRange(min=1),
+        depth=EnsureInt() & EnsureRange(min=1),
+        update=EnsureBool(),
+    ))
+
+    @staticmethod
+    @eval_results
+    def __call__(sources=None, *, source_file=None, path=None, jobs=4,
+                 depth=None, update=False):
+        sources = list(sources or [])
+        if source_file:
+            sources.extend(
+                line.strip()
+                for line in Path(source_file).read_text().splitlines()
+                if line.strip() and not line.startswith('#')
+            )
+        parent = Path(path) if path else Path.cwd()
+
+        # deferred, loading fairgraph is expensive
+        from datalad_ebrains.fairgraph_query import FairGraphQuery
+        # one client, one cache, one token for all
+        fq = FairGraphQuery()
+
+        # results of all workers are funneled through this queue,
+        # `None` signals that a worker is done
+        results = Queue()
+
+        def _worker(source):
+            try:
+                for res in _clone(fq, source, parent, depth, update):
+                    results.put(res)
+            except Exception as e:
+                results.put(get_status_dict(
+                    action='ebrains_clone',
+                    path=str(parent),
+                    source=source,
+                    status='error',
+                    exception=CapturedException(e),
+                    logger=lgr,
+                ))
+            finally:
+                results.put(None)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for source in sources:
+                    executor.submit(_worker, source)
+                ndone = 0
+                while ndone < len(sources):
+                    res = results.get()
+                    if res is None:
+                        ndone += 1
+                        continue
+                    yield res
+
+
+def _clone(fq, source, parent, depth, update):
+    source_match = re.match(uuid_regex, source)
+    if not source_match:
+        yield get_status_dict(
+            action='ebrains_clone',
+            path=str(parent),
+            source=source,
+            status='impossible',
+            message=('No EBRAINS ID in source %r', source),
+            logger=lgr,
+        )
+        return
+    ebrains_id = source_match.group(1)
+    res_kwargs = dict(
+        logger=lgr,
+        action='ebrains_clone',
+        path=str(parent / ebrains_id),
+        source=source,
+    )
+    failed = False
+    try:
+        # like with ebrains-clone, an existing dataset is only acceptable
+        # for an update, or to resume an interrupted clone
+        resume = has_checkpoint(Dataset(parent / ebrains_id))
+        target_ds = EnsureDataset(
+            installed=None if update or resume else False)(
+                parent / ebrains_id).ds
+        res_kwargs.update(ds=target_ds)
+        for res in fq.bootstrap(ebrains_id, target_ds, depth=depth):
+            failed = failed or res.get('status') in ('impossible', 'error')
+            yield dict(res_kwargs, **res)
+    except Exception as e:
+        yield get_status_dict(
+            status='error',
+            exception=CapturedException(e),
+            **res_kwargs,
+        )
+        return
+    # per-dataset summary
+    yield get_status_dict(
+        type='dataset',
+        status='error' if failed else 'ok',
+        message='Failed to clone' if failed else 'Cloned',
+        **res_kwargs,
+    )
@@ -0,0 +1,63 @@
+"""Checkpoints of an ongoing import into a dataset
+
+An import records a checkpoint in the dataset's Git directory when it
+starts, and after each version it saved. The checkpoint is removed once
+all versions are imported. When an import fails, a rerun on the same
+dataset finds the checkpoint, discards whatever is left of the incomplete
+version, and continues with the first version that was not saved. File
+listings that were obtained before the failure are only reused from the
+query cache, if it is enabled (``datalad.ebrains.kg-cache``), and has not
+evicted or expired them in the meantime. Otherwise, they are retrieved
+again.
+"""
+
+import json
+import os
+
+
+CHECKPOINT_FILE = 'ebrains-clone-checkpoint.json'
+
+
+def get_checkpoint_path(ds):
+    """Return the path of the checkpoint of dataset ``ds``
+
+    The checkpoint is kept in the Git directory of the dataset, which
+    need not be ``.git`` in the worktree (e.g., for a submodule).
+    """
+    return ds.repo.dot_git / CHECKPOINT_FILE
+
+
+def has_checkpoint(ds):
+    """Whether an import into dataset ``ds`` is incomplete"""
+    return ds.is_installed() and get_checkpoint_path(ds).exists()
+
+
+def read_checkpoint(ds):
+    """Return the checkpoint of dataset ``ds``, or ``None``
+
+    A checkpoint is a mapping with the UUID of the KG dataset
+    (``ebrains_id``), and the ``commit`` and ``version`` identifier of the
+    last saved version (``version`` is ``None`` before the first one).
+    """
+    try:
+        return json.loads(get_checkpoint_path(ds).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(ds, ebrains_id, commit, version=None):
+    """Record a checkpoint for dataset ``ds``"""
+    cpath = get_checkpoint_path(ds)
+    tmp = cpath.with_suffix('.tmp')
+    tmp.write_text(json.dumps(dict(
+        ebrains_id=ebrains_id,
+        commit=commit,
+        version=version,
+    )))
+    # a checkpoint is complete, or not there
+    os.replace(tmp, cpath)
+
+
+def remove_checkpoint(ds):
+    """Remove the checkpoint of dataset ``ds``, if there is any"""
+    get_checkpoint_path(ds).unlink(missing_ok=True)
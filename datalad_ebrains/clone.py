@@ -11,15 +11,19 @@ from datalad_next.commands import (
     eval_results,
 )
 from datalad_next.constraints import (
+    EnsureBool,
     EnsureInt,
     EnsurePath,
     EnsureRange,
     EnsureURL,
 )
 from datalad_next.constraints.dataset import EnsureDataset
-from datalad_next.datasets import datasetmethod
+from datalad_next.datasets import (
+    Dataset,
+    datasetmethod,
+)
 
-from datalad_ebrains.fairgraph_query import FairGraphQuery
+from datalad_ebrains.checkpoint import has_checkpoint
 
 
 lgr = logging.getLogger('datalad.ext.ebrains.clone')
@@ -59,19 +63,117 @@ class Clone(ValidatedInterface):
     An access token has to be obtained and provided via the ``KG_AUTH_TOKEN``
     environment variable. Please see the `ebrain-authenticate` command
     for instructions on obtaining an access token.
+    Alternatively, when ``KG_AUTH_TOKEN`` is not set, a token stored by
+    `ebrains-authenticate` in DataLad's credential system is used
+    (credential name ``datalad.ebrains.credential``). Such a token is
+    renewed automatically before it expires.
 
     **Performance notes**
 
-    For each considered ``DatasetVersion`` two principal queries are performed.
-    The version query obtains essential metadata on that ``DatasetVersion``,
-    the second query retrieve a list of files registered for that
-    ``DatasetVersion``. The later query is slow, and takes ~30s per
+    A single query obtains the dataset, essential metadata on all its
+    ``DatasetVersion``s, and their file repositories. For each considered
+    ``DatasetVersion``, another query retrieves the list of files registered
+    for that ``DatasetVersion``. This query is slow, and takes ~30s per
     ``DatasetVersion``, regardless of the actual number of files registered.
     Consequently, cloning a dataset with any significant number of versions
     in the KG will take a considerable amount of time.
     This issue is known and tracked at
     https://github.com/HumanBrainProject/fairgraph/issues/57
 
+    Query responses are kept in a persistent cache (in DataLad's cache
+    directory), such that repeated clones of the same dataset need not
+    repeat these queries. The cache is keyed on the user identity associated
+    with the access token. Its behavior can be adjusted with the
+    configuration settings ``datalad.ebrains.kg-cache`` (set to ``no`` to
+    bypass the cache), ``datalad.ebrains.kg-cache-ttl`` (maximum age of a
+    cached response in seconds), and ``datalad.ebrains.kg-cache-maxsize``
+    (in MB, least recently used responses are evicted beyond this size).
+    The versions of a dataset are only taken from the cache for new clones
+    (a new version may hence go unnoticed for up to the cache TTL). When an
+    existing clone is updated or resumed, they are always queried again.
+
+    Independent queries, like those for the pages of a file listing, are
+    performed concurrently. The maximum number of
+    simultaneous requests can be set with ``datalad.ebrains.max-requests``
+    (for all prefetched listings, and all datasets of a bulk clone,
+    together).
+    File listings of upcoming ``DatasetVersion``s are retrieved in the
+    background, while the files of an earlier version are registered. The
+    number of versions to look ahead (and to hold listings in memory for)
+    is set with ``datalad.ebrains.prefetch-versions``.
+    The file listings of several consecutive ``DatasetVersion``s can also be
+    retrieved with a single query (``datalad.ebrains.listing-batch-size``).
+    When ``DatasetVersion``s share a ``FileRepository``, it is only listed
+    once.
+    Large file listings are retrieved in pages. By default, the number of
+    files is determined first, and pages are then requested concurrently
+    (``datalad.ebrains.parallel-pages``).
+    The page size starts at ``datalad.ebrains.page-size`` records, and
+    adapts to the observed request throughput and failures, up to
+    ``datalad.ebrains.max-page-size``. Chosen sizes are reported in the
+    debug log.
+    All requests share a pool of keep-alive connections, such that
+    connection setup is not repeated for each request. The number of
+    connections kept open is set with ``datalad.ebrains.http-pool-size``.
+
+    Files are registered via ``addurls`` by default. Setting
+    ``datalad.ebrains.register-backend`` to ``batch`` switches to a
+    substantially faster implementation that streams all annex keys and
+    URLs through long-running git-annex processes.
+
+    For new clones, the entire version history can also be written in
+    a single ``git fast-import`` run, instead of building each version in
+    the worktree. This is enabled by setting ``datalad.ebrains.engine`` to
+    ``fast-import``, and yields identical commits.
+
+    Large datasets can be split into subdatasets, one per top-level
+    directory with at least ``datalad.ebrains.shard-threshold`` files.
+    This keeps each repository's index and trees small. Subdatasets get
+    reproducible dataset IDs, and the commits and tags of each version.
+    Up to ``datalad.ebrains.shard-jobs`` of them are imported concurrently.
+
+    The file records of a version with more than
+    ``datalad.ebrains.spill-threshold`` files are not held in memory, but
+    kept in a temporary database in the dataset's ``.git`` directory while
+    the version is imported. Such versions are always registered with the
+    ``batch`` backend, because ``addurls`` collects all records in memory.
+    On adjusted branches (e.g., on crippled filesystems), where only
+    ``addurls`` is supported, memory is therefore not bounded.
+
+    **Timings**
+
+    The time spent in each stage of importing a ``DatasetVersion`` is
+    reported in seconds, in an ``ebrains_timings`` mapping in the ``save``
+    result of that version. Stages are ``listing`` (file listing queries,
+    possibly performed in the background), ``listing-wait`` (time the
+    import waited for a listing), ``cleanup`` (worktree preparation),
+    ``shards`` (the import into subdatasets, if any), ``registration``
+    (of files), and ``save``. With the ``fast-import`` engine,
+    registration and saving are reported together as ``import``. A final
+    result record summarizes the total of each stage in ``ebrains_timings``
+    (plus ``versions-query``, the time needed to determine all versions,
+    and the ``total`` runtime), and the timings of all versions in
+    ``ebrains_version_timings``.
+    A large ``listing-wait`` indicates that a clone is bound by the
+    Knowledge Graph, while large ``registration`` and ``save`` times point to
+    the local Git/git-annex operations. In Python, these records are
+    available like any other result, e.g., with
+    ``ebrains_clone(..., return_type='generator')``.
+
+    **Dry run**
+
+    With ``--dry-run``, only the metadata queries are performed: the
+    versions of the dataset are determined, and the files of each version
+    to be imported are listed. Nothing is created or modified on disk:
+    cached query responses are used, but no new ones are cached. Instead,
+    a result is reported for each version, with the number of files
+    (``ebrains_files``), their total size in bytes (``ebrains_size``), and
+    the type of its file repository (``ebrains_repository_type``, ``None``
+    if the repository is not supported). A final result has the totals
+    across all versions (``ebrains_versions``, ``ebrains_files``,
+    ``ebrains_size``). Results are reported as soon as the listing of a
+    version is complete.
+
     **Metadata validity**
 
     Metadata is always taken "as-is" from the EBRAINS KG. This can lead to
@@ -85,6 +187,28 @@ class Clone(ValidatedInterface):
     unconditionally uses ``DataLad-EBRAINS exporter <ebrains@datalad.org>``
     as author and committer identity for this reason.
 
+    **Updating an existing clone**
+
+    With ``--update``, the target dataset may already exist. In this case,
+    only ``DatasetVersion``s that come after the latest version already
+    present (as identified by its version tag) are imported. The existing
+    dataset must have been generated by ``ebrains-clone`` from the same
+    EBRAINS dataset, and must not have been modified since. The resulting
+    commits are identical to those of a fresh clone.
+
+    **Resuming an interrupted clone**
+
+    A checkpoint is recorded in the dataset after each imported version.
+    If a clone (or an update) fails, e.g., due to a network issue or an
+    expired token, running the same command again continues with the first
+    version that was not imported. Any partial state of the failed version
+    is discarded. The result is identical to that of an uninterrupted
+    clone. File listings that were already retrieved are taken from the
+    query cache, if it is enabled and has not evicted them in the meantime
+    (see ``datalad.ebrains.kg-cache``, ``datalad.ebrains.kg-cache-ttl``, and
+    ``datalad.ebrains.kg-cache-maxsize``). Otherwise, they are retrieved
+    again, and a resumed clone takes longer, but works all the same.
+
     **Reproducible dataset generation**
 
     Because no metadata modifications are performed and no local identity
@@ -116,6 +240,17 @@ class Clone(ValidatedInterface):
 
     UUIDs or URL can be used interchangably as an argument. In both cases,
     a UUID is extracted from the given argument.
+
+    Bring a previously cloned dataset up-to-date with all versions
+    that have been added to the EBRAINS Knowledge Graph since::
+
+      datalad ebrains-clone --update \
+          5a16d948-8d1c-400c-b797-8a7ad29944b2 julich-atlas
+
+    Report the number and size of the files of all versions, without
+    cloning anything::
+
+      datalad ebrains-clone --dry-run 5a16d948-8d1c-400c-b797-8a7ad29944b2
     """
 
     _params_ = dict(
@@ -148,6 +283,19 @@ class Clone(ValidatedInterface):
             to the specified number of version recorded in the knowledge
             graph.""",
         ),
+        update=Parameter(
+            args=("--update",),
+            action='store_true',
+            doc="""if the target dataset already exists, import only
+            dataset versions that are not yet present in it.""",
+        ),
+        dry_run=Parameter(
+            args=("--dry-run",),
+            action='store_true',
+            doc="""only query the knowledge graph, and report the number
+            and size of the files of each version that would be imported.
+            No dataset is created or modified.""",
+        ),
     )
 
     _validator_ = EnsureCommandParameterization(dict(
@@ -157,19 +305,31 @@ class Clone(ValidatedInterface):
         path=EnsurePath(),
         dataset=EnsureDataset(),
         depth=EnsureInt() & EnsureRange(min=1),
+        update=EnsureBool(),
+        dry_run=EnsureBool(),
     ))
 
     @staticmethod
     @datasetmethod(name='ebrains_clone')
     @eval_results
-    def __call__(source, path=None, *, dataset=None, depth=None):
+    def __call__(source, path=None, *, dataset=None, depth=None,
+                 update=False, dry_run=False):
         source_match = re.match(uuid_regex, source)
         ebrains_id = source_match.group(1)
         # this is ensured by the constraint
         assert ebrains_id
 
-        target_ds_param = EnsureDataset(installed=False)(path or Path.cwd())
-
+        # an existing dataset is only acceptable, if it is to be updated,
+        # or an interrupted clone is to be resumed
+        path = path or Path.cwd()
+        resume = has_checkpoint(Dataset(path))
+        target_ds_param = EnsureDataset(
+            installed=None if update or resume else False)(
+                path)
+
+        # deferred, loading fairgraph is expensive, and not needed for
+        # anything but actually running the command
+        from datalad_ebrains.fairgraph_query import FairGraphQuery
         fq = FairGraphQuery()
 
         res_kwargs = dict(
@@ -180,7 +340,7 @@ class Clone(ValidatedInterface):
 
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            for res in fq.bootstrap(
+            for res in (fq.plan if dry_run else fq.bootstrap)(
                     ebrains_id,
                     target_ds_param.ds,
                     depth=depth,
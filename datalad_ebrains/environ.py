@@ -0,0 +1,66 @@
+"""Agent environment of commits, with concurrent imports in one process
+
+The identity and date of a commit are passed to Git via environment
+variables. The process environment is shared by all concurrently running
+imports, hence it is never modified. Instead, the variables are added to
+the environment of the individual Git and git-annex calls for a particular
+dataset.
+"""
+
+from contextlib import contextmanager
+import os
+import sys
+
+from datalad.runner import (
+    GitRunner,
+    Runner,
+    StdOutErrCapture,
+)
+
+
+class AgentRunner(GitRunner):
+    """Git runner that adds the variables in ``agent_env`` to any call"""
+    def __init__(self, agent_env, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.agent_env = agent_env
+
+    def _get_adjusted_env(self, env=None, cwd=None, copy=True):
+        # always a copy for a Git runner
+        env = super()._get_adjusted_env(env=env, cwd=cwd, copy=copy)
+        env.update(self.agent_env)
+        return env
+
+
+@contextmanager
+def agent_environ(repo, env):
+    """Run Git and git-annex calls of ``repo`` with the variables in ``env``
+
+    This covers the commits made by DataLad's ``save``, which otherwise
+    hands the process environment to Git. ``repo`` must not be used by
+    another thread in the meantime.
+    """
+    runner = repo._git_runner
+    repo._git_runner = AgentRunner(env, cwd=runner.cwd, env=runner.env)
+    try:
+        yield
+    finally:
+        repo._git_runner = runner
+
+
+def create_dataset(path, env):
+    """Create a dataset at ``path``, with the variables in ``env``
+
+    There is no repository to run Git with before the dataset is created,
+    hence ``create`` runs in a child process with the variables set.
+    """
+    Runner(env=get_environ(env)).run(
+        # the 'datalad' command of this installation
+        [sys.executable, '-c', 'from datalad.cli.main import main; main()',
+         'create', str(path)],
+        protocol=StdOutErrCapture,
+    )
+
+
+def get_environ(env):
+    """Return a copy of the process environment, updated with ``env``"""
+    return dict(os.environ, **env)
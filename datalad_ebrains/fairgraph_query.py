@@ -1,21 +1,24 @@
-
+from collections import (
+    Counter,
+    deque,
+)
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
 from functools import partial
+from itertools import groupby
 import logging
 import os
-from pathlib import (
-    Path,
-    PurePosixPath,
-)
-from unittest.mock import patch
-from urllib.parse import (
-    quote,
-    urlparse,
-)
+import time
+from pathlib import Path
+from queue import Queue
 import uuid
 
 from fairgraph import KGClient
 import fairgraph.openminds.core as omcore
 
+from datalad import cfg as dlcfg
 from datalad_next.commands import get_status_dict
 from datalad_next.exceptions import (
     CapturedException,
@@ -24,34 +27,148 @@ from datalad_next.exceptions import (
 from datalad_next.datasets import Dataset
 from datalad_next.utils import log_progress
 
+from datalad_ebrains import (
+    checkpoint,
+    environ,
+    fast_import,
+    file_iris,
+    http_session,
+    kg_query,
+    token_store,
+)
+from datalad_ebrains.annex_batch import register_files
+from datalad_ebrains.kg_cache import KGQueryCache
+from datalad_ebrains.paging import AdaptivePageSize
+from datalad_ebrains.record_store import (
+    SpilledFileRecords,
+    collect_file_records,
+    iter_sorted_by_name,
+)
+from datalad_ebrains.records import (
+    FileRecord,
+    VersionInfo,
+)
+from datalad_ebrains.timing import (
+    StageTimer,
+    sum_timings,
+)
+
 
 lgr = logging.getLogger('datalad.ext.ebrains.fairgraph_query')
 
 
 class FairGraphQuery:
     def __init__(self):
-        # picks up token from KG_AUTH_TOKEN ;
-        # make sure to specify the url of the production server
+        # all KG requests share a pool of keep-alive connections
+        http_session.install()
+        # a token in KG_AUTH_TOKEN takes precedence, otherwise a token
+        # stored by `ebrains-authenticate` is used, and kept fresh
+        token = os.environ.get('KG_AUTH_TOKEN')
+        refresher = None
+        if not token:
+            refresher = token_store.get_refresher(
+                dlcfg.obtain('datalad.ebrains.credential'))
+            if refresher:
+                token = refresher.get_token()
+        # picks up token from KG_AUTH_TOKEN, if none is given ;
+        # make sure to specify the url of the production server by default
         # (KGClient uses the pre-production server by default,
         # which can cause unexpected downtime, see
         # https://github.com/datalad/datalad-ebrains/issues/58)
-        self.client = KGClient(host="core.kg.ebrains.eu")
+        self.client = KGClient(
+            token=token,
+            host=dlcfg.obtain('datalad.ebrains.kg-host'),
+        )
+        if refresher:
+            # all sub-clients share this config
+            self.client._kg_client.instances._kg_config.token_handler = \
+                refresher.get_token_handler()
+        # persistent cache for query responses, repeated clones of the
+        # same dataset need not wait for the KG again
+        self.cache = KGQueryCache.from_config(token)
+        # upper limit for requests to run concurrently
+        self.max_requests = dlcfg.obtain('datalad.ebrains.max-requests')
+        # number of versions to fetch file listings for ahead of time
+        self.prefetch_versions = dlcfg.obtain(
+            'datalad.ebrains.prefetch-versions')
+        # whether to retrieve pages of a file listing concurrently
+        self.parallel_pages = dlcfg.obtain('datalad.ebrains.parallel-pages')
+        # number of file repositories to list with a single query
+        self.listing_batch_size = dlcfg.obtain(
+            'datalad.ebrains.listing-batch-size')
+        # number of file records of a version to hold in memory at most
+        self.spill_threshold = dlcfg.obtain(
+            'datalad.ebrains.spill-threshold')
+        # the page size is large, because the per-request latency costs
+        # are enourmous
+        # https://github.com/HumanBrainProject/fairgraph/issues/57
+        # but it adapts to what the server can deliver
+        self.page_size = AdaptivePageSize(
+            dlcfg.obtain('datalad.ebrains.page-size'),
+            maximum=dlcfg.obtain('datalad.ebrains.max-page-size'),
+        )
+        # how to register annexed files
+        self.register_backend = dlcfg.obtain(
+            'datalad.ebrains.register-backend')
+        # how to build the version history
+        self.engine = dlcfg.obtain('datalad.ebrains.engine')
+        # number of files of a top-level directory from which on it is
+        # imported as a subdataset (0: never)
+        self.shard_threshold = dlcfg.obtain('datalad.ebrains.shard-threshold')
+        # number of subdatasets to import concurrently
+        self.shard_jobs = dlcfg.obtain('datalad.ebrains.shard-jobs')
+        # stage timings of each version, by version UUID
+        self._timers = {}
 
     def bootstrap(self, from_id: str, dl_ds: Dataset, depth=None):
+        start = time.perf_counter()
+        installed = dl_ds.is_installed()
+        # an existing dataset is updated with any versions released since,
+        # they must not be concealed by a cached version list
         kg_ds_uuid, kg_ds_versions = self.get_dataset_versions_from_id(
-            from_id, depth=depth)
-        # create datalad dataset
-        # TODO support existing datasets
-        try:
-            ds = self.create_ds(dl_ds, kg_ds_versions[0], kg_ds_uuid)
-        except IncompleteResultsError as e:
-            # make sure to communicate the error outside
-            yield from e.failed
-            return
+            from_id, depth=depth, refresh=installed)
+        versions_query = time.perf_counter() - start
+        if installed:
+            # update an existing dataset with any versions it is lacking
+            try:
+                if checkpoint.has_checkpoint(dl_ds):
+                    # continue an interrupted import
+                    self.restore_checkpoint(
+                        dl_ds, kg_ds_uuid, kg_ds_versions)
+                kg_ds_versions = self.get_missing_versions(
+                    dl_ds, kg_ds_uuid, kg_ds_versions)
+            except ValueError as e:
+                yield get_status_dict(
+                    status='impossible',
+                    action='ebrains-clone',
+                    exception=CapturedException(e),
+                )
+                return
+            if not kg_ds_versions:
+                checkpoint.remove_checkpoint(dl_ds)
+                yield get_status_dict(
+                    status='notneeded',
+                    action='ebrains-clone',
+                    message='Dataset has all known versions already',
+                )
+                return
+            ds = dl_ds
+            fresh = False
+        else:
+            # create datalad dataset
+            try:
+                ds = self.create_ds(dl_ds, kg_ds_versions[0], kg_ds_uuid)
+            except IncompleteResultsError as e:
+                # make sure to communicate the error outside
+                yield from e.failed
+                return
+            fresh = True
+        # from here on, a failed import can be resumed
+        checkpoint.write_checkpoint(
+            ds, kg_ds_uuid, ds.repo.get_hexsha())
 
-        # TODO support a starting version for the import
-        # TODO maybe derive starting version automatically from a tag?
         log_id = f'ebrains-{from_id}'
+        http_stats = http_session.get_stats()
         log_progress(
             lgr.info, log_id,
             'Querying dataset versions',
@@ -60,32 +177,255 @@ class FairGraphQuery:
             total=len(kg_ds_versions),
         )
         try:
-            for kg_dsver in kg_ds_versions:
-                yield from self.import_datasetversion(ds, kg_dsver)
+            if self.engine == 'fast-import' and fresh \
+                    and not self.shard_threshold \
+                    and not ds.repo.is_managed_branch():
+                published = True
+                for res in self.import_history(ds, kg_ds_versions, log_id):
+                    # any error leaves branch and tags untouched, and a
+                    # rerun can resume from the checkpoint. Versions of an
+                    # unsupported repository are imported empty, just like
+                    # without fast-import
+                    published = published and res.get('status') != 'error'
+                    yield res
+                if published:
+                    checkpoint.remove_checkpoint(ds)
+                yield self._get_timing_summary(
+                    ds, kg_ds_versions, start, versions_query)
+                return
+            # records of the version currently in the worktree
+            prev_frecs = None
+            # and of its subdatasets, by name
+            prev_parts = {}
+            for kg_dsver, frecs in self.iter_file_records(
+                    ds, kg_ds_versions):
+                try:
+                    # any time spent here, is time the import is
+                    # waiting for the KG
+                    with self._get_timer(kg_dsver)('listing-wait'):
+                        frecs = self._collect_file_records(ds, frecs)
+                except NotImplementedError as e:
+                    yield get_status_dict(
+                        status='impossible',
+                        action='ebrains-clone',
+                        exception=CapturedException(e),
+                    )
+                    # proceed with an empty version
+                    frecs = []
+                    prev_frecs = None
+                if self.shard_threshold:
+                    # records by subdataset, the dataset itself is `None`
+                    parts = self._split_shards(ds, frecs)
+                    frecs = parts.pop(None)
+                    shards = partial(
+                        self._import_shards, ds, kg_dsver, kg_ds_uuid,
+                        parts, {} if prev_frecs is None else prev_parts)
+                else:
+                    shards = None
+                failed = False
+                for res in self.import_datasetversion(
+                        ds, kg_dsver, frecs, prev_frecs, shards=shards):
+                    failed = failed \
+                        or res.get('status') in ('impossible', 'error')
+                    yield res
+                # after a failure, e.g. a file that could not be
+                # registered, the worktree may not match the records. The
+                # next version must then start from scratch
+                prev_frecs = None if failed else frecs
+                if shards:
+                    prev_parts = parts
+                self.write_checkpoint(ds, kg_ds_uuid, kg_dsver)
                 log_progress(lgr.info, log_id,
                              'Completed version', update=1, increment=True)
+            checkpoint.remove_checkpoint(ds)
+            yield self._get_timing_summary(
+                ds, kg_ds_versions, start, versions_query)
         finally:
             log_progress(lgr.info, log_id, "Done querying knowledge graph")
+            # a later import of the same versions must start from scratch
+            for v in kg_ds_versions:
+                self._timers.pop(v.uuid, None)
+            # other clones may run concurrently, hence this is only
+            # an indication
+            http_stats = {
+                k: v - http_stats[k]
+                for k, v in http_session.get_stats().items()
+            }
+            lgr.debug('%i HTTP requests, %i reused a connection, '
+                      '%i opened a new one',
+                      http_stats['requests'], http_stats['reused'],
+                      http_stats['new'])
+
+    def plan(self, from_id: str, dl_ds: Dataset, depth=None):
+        """Report what a ``bootstrap()`` would import, without importing
+
+        Only the metadata queries are performed: the version query, and
+        the file listings of the versions to be imported. A result is
+        yielded for each version as soon as its listing is complete, with
+        the number of files (``ebrains_files``), their total size in bytes
+        (``ebrains_size``), and the type of the file repository. A final
+        result summarizes all versions. Nothing is written to disk: the
+        query cache is used read-only, and listings are only counted, hence
+        never spilled.
+        """
+        # a plan must leave the filesystem untouched, the cache included,
+        # but this instance may still bootstrap later on
+        read_only = self.cache.read_only
+        self.cache.read_only = True
+        try:
+            yield from self._plan(from_id, dl_ds, depth)
+        finally:
+            self.cache.read_only = read_only
 
-    def create_ds(self, dl_ds, kg_ds_init_version, kg_ds_uuid):
+    def _plan(self, from_id, dl_ds, depth):
+        installed = dl_ds.is_installed()
+        kg_ds_uuid, kg_ds_versions = self.get_dataset_versions_from_id(
+            from_id, depth=depth, refresh=installed)
+        if installed:
+            try:
+                kg_ds_versions = self.get_missing_versions(
+                    dl_ds, kg_ds_uuid, kg_ds_versions)
+            except ValueError as e:
+                yield get_status_dict(
+                    status='impossible',
+                    action='ebrains-clone',
+                    exception=CapturedException(e),
+                )
+                return
+        # versions sharing a file repository need only one listing
+        summaries = {}
+
+        def _summarize(kg_dsver):
+            key = _get_listing_key(kg_dsver)
+            if key not in summaries:
+                summaries[key] = executor.submit(
+                    self._summarize_files, kg_dsver.repository_id)
+            return summaries[key]
+
+        total = Counter()
+        with ThreadPoolExecutor(
+                max_workers=max(1, min(self.prefetch_versions,
+                                       self.max_requests))) as executor:
+            # keep the lookahead filled, but bounded
+            pending = deque()
+            for kg_dsver in kg_ds_versions:
+                pending.append((kg_dsver, _summarize(kg_dsver)))
+                if len(pending) > self.prefetch_versions:
+                    yield self._get_version_plan(*pending.popleft(), total)
+            while pending:
+                yield self._get_version_plan(*pending.popleft(), total)
+            yield get_status_dict(
+                action='ebrains-clone',
+                type='dataset',
+                status='ok',
+                message=(
+                    '%i versions, %i files, %i bytes',
+                    len(kg_ds_versions), total['files'], total['size']),
+                ebrains_id=kg_ds_uuid,
+                ebrains_versions=len(kg_ds_versions),
+                ebrains_files=total['files'],
+                ebrains_size=total['size'],
+            )
+
+    def _summarize_files(self, dvr):
+        """Return the number and total size of the files in a repository"""
+        summary = Counter()
+        if dvr is None:
+            return summary
+        for iri, md5sum, size in self.iter_files(dvr):
+            summary['files'] += 1
+            if size is None:
+                summary['unknown-size'] += 1
+            else:
+                summary['size'] += size
+        return summary
+
+    def _get_version_plan(self, kg_dsver, summary, total):
+        res = dict(
+            action='ebrains-clone',
+            type='dataset',
+            ebrains_version=kg_dsver.version_identifier,
+            ebrains_version_id=kg_dsver.uuid,
+            ebrains_release_date=kg_dsver.release_date.isoformat()
+            if kg_dsver.release_date else None,
+            ebrains_repository=kg_dsver.repository_iri,
+            ebrains_repository_type=file_iris.get_repository_type(
+                kg_dsver.repository_iri or ''),
+        )
+        try:
+            summary = summary.result()
+        except Exception as e:
+            return get_status_dict(
+                status='error', exception=CapturedException(e), **res)
+        res.update(
+            ebrains_files=summary['files'],
+            ebrains_size=summary['size'],
+            ebrains_unknown_size=summary['unknown-size'],
+        )
+        if res['ebrains_repository_type'] is None:
+            return get_status_dict(
+                status='impossible',
+                message=(
+                    'Version %s: unrecognized file repository pointer %s',
+                    kg_dsver.version_identifier, kg_dsver.repository_iri),
+                **res)
+        # what a clone would import
+        total.update(files=summary['files'], size=summary['size'])
+        return get_status_dict(
+            status='ok',
+            message=(
+                'Version %s: %i files, %i bytes',
+                kg_dsver.version_identifier, summary['files'],
+                summary['size']),
+            **res)
+
+    def import_history(self, ds, kg_ds_versions, log_id):
+        """Import all versions in a single ``git fast-import`` run"""
+        def _iter_versions():
+            for kg_dsver, frecs in self.iter_file_records(
+                    ds, kg_ds_versions):
+                yield (
+                    frecs,
+                    self.get_agent_info(kg_dsver),
+                    kg_dsver.version_innovation,
+                    kg_dsver.version_identifier,
+                )
+                log_progress(lgr.info, log_id,
+                             'Completed version', update=1, increment=True)
+
+        # file registration and commits cannot be told apart here, the
+        # time between two versions is reported as 'import' stage
+        timers = {
+            v.version_identifier: self._get_timer(v) for v in kg_ds_versions
+        }
+        last = time.perf_counter()
+        for res in fast_import.import_history(
+                ds, _iter_versions(),
+                collect=partial(self._collect_file_records, ds)):
+            if res.get('action') == 'save' and res.get('version_tag') \
+                    in timers:
+                timer = timers[res['version_tag']]
+                now = time.perf_counter()
+                timer.add('import', now - last)
+                last = now
+                res['ebrains_timings'] = timer.as_dict()
+            yield res
+
+    def create_ds(self, dl_ds, kg_ds_init_version, kg_ds_uuid, shard=None):
         # create the dataset using the timestamp and agent of the
         # first version
-        with patch.dict(
-                os.environ,
-                self.get_agent_info(kg_ds_init_version)):
-            ds = dl_ds.create(result_renderer='disabled')
-            # we create a reproducible dataset ID from the KG dataset ID
-            # we are not reusing it directly, because we have two linked
-            # but different objects
+        return self._create_ds(
+            dl_ds, _get_dataset_id(kg_ds_uuid, shard), kg_ds_init_version)
+
+    def _create_ds(self, dl_ds, ds_id, kg_dsver):
+        env = self.get_agent_info(kg_dsver)
+        environ.create_dataset(dl_ds.pathobj, env)
+        ds = Dataset(dl_ds.pathobj)
+        with environ.agent_environ(ds.repo, env):
+            # reproducible dataset ID, derived from the KG dataset ID
             ds.config.set(
                 'datalad.dataset.id',
-                # create a DNS namespace UUID from 'datalad.org'
-                str(
-                    uuid.uuid5(
-                        uuid.uuid5(uuid.NAMESPACE_DNS, 'datalad.org'),
-                        kg_ds_uuid,
-                    )
-                ),
+                ds_id,
                 scope='branch',
             )
             # TODO establish meaningful gitattributes
@@ -93,48 +433,388 @@ class FairGraphQuery:
             ds.save(amend=True, result_renderer='disabled')
         return ds
 
-    def get_dataset_versions_from_id(self, id, depth=None):
+    def write_checkpoint(self, ds, kg_ds_uuid, kg_dsver):
+        """Record a checkpoint, if version ``kg_dsver`` has been saved"""
+        if not kg_dsver.version_identifier:
+            return
         try:
-            dv = omcore.DatasetVersion.from_id(id, self.client)
-            target_version = dv.uuid
-            # determine the Dataset from the DatasetVersion we got
-            ds = omcore.Dataset.list(self.client, versions=dv)[0]
-        except TypeError:
+            commit = ds.repo.get_hexsha(kg_dsver.version_identifier)
+        except ValueError:
+            # no tag, saving failed
+            return
+        checkpoint.write_checkpoint(
+            ds, kg_ds_uuid, commit, kg_dsver.version_identifier)
+
+    def restore_checkpoint(self, ds, kg_ds_uuid, kg_ds_versions):
+        """Bring a dataset back to the last saved version of an import
+
+        Anything an interrupted import left behind of an incomplete
+        version is discarded: commits, tags, and worktree changes, also
+        in subdatasets. Subdatasets created for the incomplete version are
+        removed. ``ValueError`` is raised if the checkpoint is that of a
+        different KG dataset, or the dataset is on an adjusted branch.
+        """
+        cp = checkpoint.read_checkpoint(ds)
+        if cp['ebrains_id'] != kg_ds_uuid:
+            raise ValueError(
+                f'{ds.path} has an interrupted clone of EBRAINS dataset '
+                f"{cp['ebrains_id']}")
+        repo = ds.repo
+        if repo.get_corresponding_branch():
+            raise ValueError(
+                f'Cannot resume an interrupted clone on an adjusted branch '
+                f'in {ds.path}')
+        tags = {t['name']: t['hexsha'] for t in repo.get_tags()}
+        # tags are only created by a successful save, the last one is
+        # more recent than the checkpoint, if recording it was interrupted
+        saved = [
+            v.version_identifier for v in kg_ds_versions
+            if v.version_identifier in tags
+        ]
+        commit = tags[saved[-1]] if saved else cp['commit']
+        lgr.info('Resuming interrupted clone of %s at version %s',
+                 ds.path, saved[-1] if saved else '(none)')
+        repo.call_git(['reset', '--hard', '--quiet', commit])
+        # also removes subdatasets that are not registered at this commit
+        repo.call_git(['clean', '-ffdq'])
+        for p in ds.subdatasets(
+                result_xfm='paths',
+                result_renderer='disabled',
+                return_type='generator'):
+            sub = Dataset(p)
+            if not sub.is_installed():
+                continue
+            recorded = repo.call_git_oneline(
+                ['rev-parse',
+                 f'{commit}:{Path(p).relative_to(ds.pathobj).as_posix()}'])
+            sub.repo.call_git(['reset', '--hard', '--quiet', recorded])
+            sub.repo.call_git(['clean', '-ffdq'])
+            for t in sub.repo.get_tags():
+                # tags of an incomplete version
+                if t['name'] not in tags:
+                    sub.repo.call_git(['tag', '-d', t['name']])
+        checkpoint.write_checkpoint(
+            ds, kg_ds_uuid, commit, saved[-1] if saved else None)
+
+    def get_missing_versions(self, ds, kg_ds_uuid, kg_ds_versions):
+        """Determine the versions an existing dataset is lacking
+
+        The dataset must have been created from the same KG dataset, and
+        the state of its (corresponding) branch must match the last known
+        version tag exactly. This ensures that importing the remaining
+        versions on top of it yields the same commits as a fresh clone.
+        ``ValueError`` is raised when this is not the case.
+        """
+        if ds.id != _get_dataset_id(kg_ds_uuid):
+            raise ValueError(
+                f'{ds.path} is not a clone of EBRAINS dataset {kg_ds_uuid}')
+        repo = ds.repo
+        branch = repo.get_corresponding_branch() or repo.get_active_branch()
+        head = repo.get_hexsha(branch)
+        tags = {t['name']: t['hexsha'] for t in repo.get_tags()}
+        present = [
+            i for i, v in enumerate(kg_ds_versions)
+            if v.version_identifier in tags
+        ]
+        if not present:
+            # nothing imported yet, but the dataset may just have been
+            # created, and nothing else
+            if list(repo.call_git_items_(
+                    ['rev-list', '--count', branch])) != ['1']:
+                raise ValueError(
+                    f'{ds.path} has no tag matching any known version')
+            return kg_ds_versions
+        last = kg_ds_versions[present[-1]]
+        if tags[last.version_identifier] != head:
+            raise ValueError(
+                f'{ds.path} has been modified since the import of version '
+                f'{last.version_identifier}')
+        return kg_ds_versions[present[-1] + 1:]
+
+    def get_dataset_versions_from_id(self, id, depth=None, refresh=False):
+        """Return the UUID of a KG dataset, and a list of its versions
+
+        ``id`` is the UUID of a ``Dataset``, or of one of its
+        ``DatasetVersion``s. In the latter case, no versions beyond the
+        given one are reported. The dataset, all its versions, and their
+        file repositories are retrieved with a single query that follows
+        the links in the KG (plus one, if ``id`` is that of a ``Dataset``).
+        With ``refresh``, the query is performed even if its response is
+        in the cache.
+        """
+        uri = self.client.uri_from_uuid(id)
+        ds = self._query_versions(version=uri, refresh=refresh)
+        target_version = id
+        if ds is None:
             # `id` might be the ID of a Dataset directly
-            ds = omcore.Dataset.from_id(id, self.client)
+            ds = self._query_versions(dataset=id, refresh=refresh)
             # all of them
             target_version = None
+        if ds is None:
+            raise ValueError(
+                f'No (accessible) EBRAINS dataset or dataset version {id}')
         # robust handling of single-version datasets
-        candidate_versions = (
-            ds.versions
-            if isinstance(ds.versions, list)
-            else [ds.versions]
-        )
+        candidate_versions = [
+            VersionInfo.from_query_record(v)
+            for v in _as_list(ds.get('versions'))
+        ]
         if depth:  # yes, we exclude zero too, makes no sense
             # the the last N
             candidate_versions = candidate_versions[-(depth):]
 
-        versions = []
-        for ver in candidate_versions:
-            # resolving upfront might be suboptimal, but we know we need it
-            # eventually, and it takes a fraction of the time to retrieve a
-            # version-file-listing
-            ver = ver.resolve(self.client)
-            versions.append(ver)
-            if ver.uuid == target_version:
-                # do not go beyond the requested version
-                break
-        return ds.uuid, versions
+        if target_version:
+            # do not go beyond the requested version
+            candidate_uuids = [v.uuid for v in candidate_versions]
+            if target_version in candidate_uuids:
+                candidate_versions = candidate_versions[
+                    :candidate_uuids.index(target_version) + 1]
+        return _uuid_from_uri(ds['@id']), candidate_versions
+
+    def _query_versions(self, dataset=None, version=None, refresh=False):
+        # the record of the dataset, or None if there is no match
+        return self.cache.cached(
+            'Dataset.versions',
+            dict(dataset=dataset, version=version),
+            lambda: next(kg_query.iter_query(
+                self.client,
+                kg_query.get_version_graph_query(version),
+                size=1,
+                params=dict(instanceId=dataset) if dataset else None,
+            ), None),
+            refresh=refresh,
+        )
+
+    def iter_file_records(self, ds, kg_ds_versions):
+        """Yield each version with an iterable of its file records
+
+        The file listing query is latency-bound, while processing a listing
+        is bound by local resources. Therefore the listings of up to
+        ``prefetch_versions`` subsequent versions are retrieved in the
+        background, while the listing of the current version is processed.
+        Moreover, the listings of up to ``listing_batch_size`` consecutive
+        versions are retrieved with a single query (see
+        ``get_file_records_batch()``).
+
+        Versions can share a file repository (e.g., when only metadata
+        changed). Such a repository is only listed once, and its records
+        are reused for all versions.
+        """
+        versions = list(kg_ds_versions)
+        # how many versions need the listing of a repository
+        uses = Counter(_get_listing_key(v) for v in versions)
+        saved = len(versions) - len(uses)
+        if saved:
+            lgr.info('Versions share file repositories, %i file listing(s) '
+                     'are reused rather than retrieved again', saved)
+        first_uses = {}
+        for kg_dsver in versions:
+            first_uses.setdefault(_get_listing_key(kg_dsver), kg_dsver)
+        batches = self._iter_listing_batches(first_uses.values())
+        # listings by repository, as long as another version needs them:
+        # (listings of a batch, index in batch)
+        sources = {}
+
+        def _get_source(key):
+            listings, i = sources[key]
+            uses[key] -= 1
+            if not uses[key]:
+                # no need to keep it around any longer
+                del sources[key]
+            return listings, i
+
+        if not self.prefetch_versions:
+            for kg_dsver in versions:
+                key = _get_listing_key(kg_dsver)
+                if key not in sources:
+                    # batches come in the order of first use
+                    batch = next(batches)
+                    if len(batch) == 1 and uses[key] == 1:
+                        # the records can be passed on as they arrive
+                        uses[key] -= 1
+                        yield kg_dsver, self._iter_timed_file_records(
+                            ds, kg_dsver)
+                        continue
+                    listings = self._list_batch(ds, batch)
+                    for i, v in enumerate(batch):
+                        sources[_get_listing_key(v)] = (listings, i)
+                yield kg_dsver, _PendingListing(*_get_source(key))
+            return
+
+        with ThreadPoolExecutor(
+                max_workers=min(self.prefetch_versions,
+                                self.max_requests)) as executor:
+
+            def _submit(upto):
+                # make sure the listings of all versions up to this index
+                # are underway
+                for v in versions[:upto]:
+                    key = _get_listing_key(v)
+                    if not uses[key] or key in sources:
+                        continue
+                    batch = next(batches)
+                    listings = executor.submit(self._list_batch, ds, batch)
+                    for i, b in enumerate(batch):
+                        sources[_get_listing_key(b)] = (listings, i)
+
+            try:
+                for n, kg_dsver in enumerate(versions):
+                    # keep the lookahead filled, but bounded
+                    _submit(n + 1 + self.prefetch_versions)
+                    yield kg_dsver, _PendingListing(
+                        *_get_source(_get_listing_key(kg_dsver)))
+            finally:
+                # do not wait for listings nobody will consume
+                for listings, i in sources.values():
+                    listings.cancel()
+
+    def _iter_listing_batches(self, kg_ds_versions):
+        """Yield lists of consecutive versions to be listed together
+
+        Versions with a listing in the cache are not batched.
+        """
+        batch = []
+        for kg_dsver in kg_ds_versions:
+            if self.listing_batch_size > 1 and kg_dsver.repository_id \
+                    and not self.cache.has(
+                        'File.listing',
+                        dict(file_repository=kg_dsver.repository_id)):
+                batch.append(kg_dsver)
+                if len(batch) >= self.listing_batch_size:
+                    yield batch
+                    batch = []
+                continue
+            if batch:
+                yield batch
+                batch = []
+            yield [kg_dsver]
+        if batch:
+            yield batch
+
+    def _list_batch(self, ds, batch):
+        """Return the file records of each version in ``batch``
+
+        An exception raised for an individual version of a batch is
+        returned in place of its records.
+        """
+        if len(batch) == 1:
+            return [self._collect_file_records(
+                ds, self._iter_timed_file_records(ds, batch[0]))]
+        start = time.perf_counter()
+        files = self.get_file_records_batch(
+            [v.repository_id for v in batch])
+        # the versions share the time of the query
+        duration = (time.perf_counter() - start) / len(batch)
+        listings = []
+        for kg_dsver in batch:
+            self._get_timer(kg_dsver).add('listing', duration)
+            try:
+                listings.append(self._collect_file_records(
+                    ds, self._iter_timed_file_records(
+                        ds, kg_dsver, files[kg_dsver.repository_id])))
+            except Exception as e:
+                listings.append(e)
+        return listings
+
+    def import_datasetversion(self, ds, kg_dsver, frecs=None,
+                              prev_frecs=None, shards=None):
+        """Import a version into the dataset, and save it
 
-    def import_datasetversion(self, ds, kg_dsver):
-        self.clean_ds_worktree(ds)
-        yield from self.import_files(ds, kg_dsver)
+        ``shards`` is a callable that imports the version into the
+        subdatasets of the dataset (yielding results). It is called after
+        the worktree of the dataset has been prepared.
+        """
+        timer = self._get_timer(kg_dsver)
+        with timer('cleanup'):
+            if prev_frecs is None:
+                self.clean_ds_worktree(ds)
+            else:
+                # only touch what is different from the previous version
+                frecs = self.transition_ds_worktree(ds, prev_frecs, frecs)
+        if shards:
+            yield from timer.time_iter('shards', shards())
+        yield from timer.time_iter(
+            'registration', self.import_files(ds, kg_dsver, frecs))
         self.import_metadata(ds, kg_dsver)
-        yield from self.save_ds_version(ds, kg_dsver)
+        for res in timer.time_iter(
+                'save', self.save_ds_version(ds, kg_dsver)):
+            if res.get('action') == 'save' and res.get('path') == ds.path:
+                res['ebrains_timings'] = timer.as_dict()
+            yield res
+
+    def _split_shards(self, ds, frecs):
+        """Return the file records of a version by subdataset
+
+        Top-level directories with at least ``shard_threshold`` files,
+        and any existing subdataset, are subdatasets. The records of a
+        subdataset have names relative to it. The records of the dataset
+        itself are reported under ``None``.
+        """
+        shards = {
+            Path(p).relative_to(ds.pathobj).as_posix()
+            for p in ds.subdatasets(
+                result_xfm='paths',
+                result_renderer='disabled',
+                return_type='generator',
+            )
+        }
+        counts = Counter(
+            d for d in map(_get_topdir, (r.name for r in frecs))
+            if d is not None)
+        shards.update(
+            d for d, n in counts.items() if n >= self.shard_threshold)
+        parts = {
+            None: self._collect_file_records(
+                ds, (r for r in frecs if _get_topdir(r.name) not in shards)),
+        }
+        # in the order of names, the records of a directory are adjacent
+        for d, dfrecs in groupby(
+                iter_sorted_by_name(frecs), key=lambda r: _get_topdir(r.name)):
+            if d in shards:
+                parts[d] = self._collect_file_records(ds, (
+                    FileRecord(r.url, r.name[len(d) + 1:], r.md5sum, r.size)
+                    for r in dfrecs
+                ))
+        for d in shards:
+            # any existing subdataset without files in this version
+            parts.setdefault(d, [])
+        return parts
+
+    def _import_shards(self, ds, kg_dsver, kg_ds_uuid, parts, prev_parts):
+        """Import a version into subdatasets of ``ds``, concurrently
+
+        ``parts`` are the file records of the version by subdataset name
+        (see ``_split_shards()``), ``prev_parts`` those of the version in
+        the worktree. Subdatasets are created as needed, with a
+        reproducible ID derived from the KG dataset ID and their name.
+        """
+        def _import(name):
+            shard = Dataset(ds.pathobj / name)
+            try:
+                if not shard.is_installed():
+                    # the directory of a former top-level directory of
+                    # the dataset itself is left with empty directories
+                    _remove_empty_dirs(shard.pathobj)
+                    self._create_ds(
+                        shard, _get_dataset_id(kg_ds_uuid, name), kg_dsver)
+                frecs = self.transition_ds_worktree(
+                    shard, prev_parts.get(name, []), parts[name])
+                yield from self.import_files(shard, kg_dsver, frecs)
+                self.import_metadata(shard, kg_dsver)
+                yield from self.save_ds_version(shard, kg_dsver)
+            except Exception as e:
+                yield get_status_dict(
+                    status='error',
+                    action='ebrains-clone',
+                    ds=shard,
+                    exception=CapturedException(e),
+                )
+
+        yield from _iter_concurrently(
+            [partial(_import, name) for name in sorted(parts)],
+            self.shard_jobs,
+        )
 
     def clean_ds_worktree(self, ds):
-        dldir = ds.pathobj / '.datalad'
-        exclude = (ds.pathobj / '.gitattributes',)
         # this is expensive, but theoretically there could be
         # numerous subdatasets, and they all need there content stripped
         for frec in ds.status(
@@ -145,17 +825,73 @@ class FairGraphQuery:
                 result_renderer='disabled',
                 return_type='generator',
         ):
+            if frec.get('type') == 'dataset':
+                # subdatasets themselves stay
+                continue
             p = Path(frec['path'])
-            if dldir in p.parents or p in exclude:
+            parent = Path(frec['parentds'])
+            if parent / '.datalad' in p.parents \
+                    or p == parent / '.gitattributes':
                 # we are not wiping out any configuration
                 continue
-            Path(frec['path']).unlink()
+            p.unlink()
+
+    def transition_ds_worktree(self, ds, prev_frecs, frecs):
+        """Turn a worktree with ``prev_frecs`` into one with ``frecs``
+
+        Files that are no longer present, or whose record changed (checksum,
+        size, or URL), are removed from the worktree. The records of all
+        changed or newly added files are returned for registration. Files
+        with identical records are left untouched.
+
+        Both versions are traversed in the order of file names, such that
+        no lookup of all previous records needs to be held in memory.
+        """
+        nremoved = 0
 
-    def import_files(self, ds, kg_dsver):
+        def _iter_register():
+            nonlocal nremoved
+            prev = iter_sorted_by_name(prev_frecs)
+            prev_r = next(prev, None)
+            for r in iter_sorted_by_name(frecs):
+                while prev_r is not None and prev_r.name < r.name:
+                    # no longer part of the version
+                    (ds.pathobj / prev_r.name).unlink()
+                    nremoved += 1
+                    prev_r = next(prev, None)
+                if prev_r is not None and prev_r.name == r.name:
+                    if prev_r == r:
+                        prev_r = next(prev, None)
+                        continue
+                    # retarget
+                    (ds.pathobj / r.name).unlink()
+                    prev_r = next(prev, None)
+                yield r
+            while prev_r is not None:
+                (ds.pathobj / prev_r.name).unlink()
+                nremoved += 1
+                prev_r = next(prev, None)
+
+        register = self._collect_file_records(ds, _iter_register())
+        lgr.debug('Worktree transition: %i files unchanged, %i removed, '
+                  '%i (re)registered',
+                  len(frecs) - len(register), nremoved, len(register))
+        return register
+
+    def import_files(self, ds, kg_dsver, frecs=None):
+        if frecs is None:
+            frecs = self.get_file_records(ds, kg_dsver)
         try:
+            # addurls collects all records in memory, which would defeat
+            # the purpose of spilling them
+            if (self.register_backend == 'batch'
+                    or isinstance(frecs, SpilledFileRecords)) \
+                    and not ds.repo.is_managed_branch():
+                yield from register_files(ds, frecs)
+                return
             yield from ds.addurls(
                 # Turn query into an iterable of dicts for addurls
-                urlfile=self.get_file_records(ds, kg_dsver),
+                urlfile=(r.asdict() for r in frecs),
                 urlformat='{url}',
                 filenameformat='{name}',
                 # construct annex key from EBRAINS supplied info
@@ -179,76 +915,225 @@ class FairGraphQuery:
                 exception=CapturedException(e),
             )
 
-    def get_file_records(self, ds, kg_dsver):
+    def get_file_records(self, ds, kg_dsver, files=None):
+        """Yield a ``FileRecord`` per file of a dataset version
+
+        ``files`` are the records of ``iter_files()`` for the version's file
+        repository. They are retrieved, if not given.
+        """
         # the file repo IRI provides the reference for creating relative
         # file paths
-        dvr = kg_dsver.repository.resolve(self.client)
-        # EBRAINS uses different file repositories that need slightly
-        # different handling
-        dvr_url_p = urlparse(dvr.iri.value)
-        if dvr_url_p.netloc == 'data-proxy.ebrains.eu' \
-                and dvr_url_p.path.startswith('/api/v1/public/buckets/'):
-            get_fname = _get_fname_dataproxy_v1_bucket
-        elif dvr_url_p.netloc == 'object.cscs.ch' \
-                and dvr_url_p.query.startswith('prefix='):
-            # get the repos base url by removing the query string
-            # input is like:
-            # https://example.com/<basepath>?prefix=MPM-collections/13/
-            # output is: https://example.com/<basepath>
-            # the prefix is part of the file IRIs again
-            dvr_prefix = dvr_url_p.query
-            # this is a prefix and there are no other variables
-            assert dvr_prefix.startswith('prefix=')
-            assert dvr_prefix.count('=') == 1
-            dvr_prefix = dvr_prefix[len('prefix='):]
-            get_fname = partial(
-                _get_fname_cscs_repo,
-                # baseurl
-                dvr_url_p._replace(query='').geturl(),
-                # filerepo prefix
-                dvr_prefix,
-            )
-        else:
-            raise NotImplementedError(
-                f'Unrecognized file repository pointer {dvr.iri.value}')
-
-        for f in self.iter_files(dvr):
-            # we presently cannot understand non-md5 hashes
-            assert f.hash.algorithm.lower() == 'md5'
-
-            f_url = _file_iri_to_url(f.iri.value)
-            fname = get_fname(f)
-            yield dict(
-                url=f_url,
-                name=str(fname),
-                md5sum=f.hash.digest,
-                # assumed to be in bytes
-                size=f.storage_size.value,
-            )
+        get_url_and_name = file_iris.get_url_and_name_getter(
+            kg_dsver.repository_iri or '')
+        if files is None:
+            files = self.iter_files(kg_dsver.repository_id)
+        for iri, md5sum, size in files:
+            url, name = get_url_and_name(iri)
+            yield FileRecord(url, name, md5sum, size)
+
+    def iter_files(self, dvr):
+        """Yield an ``(iri, md5sum, size)`` tuple per file
+
+        ``dvr`` is the ID of a file repository.
+        """
+        # page boundaries vary with the adaptive page size, hence complete
+        # listings are cached, rather than individual pages
+        yield from self.cache.cached_iter(
+            'File.listing',
+            dict(file_repository=dvr),
+            lambda: map(_get_file_record, self._iter_files(dvr)),
+        )
+
+    def get_file_records_batch(self, dvrs):
+        """Return the ``iter_files()`` records of several file repositories
+
+        ``dvrs`` are the IDs of file repositories. They are listed with a
+        single (paged) query, which avoids the substantial latency of a
+        query per repository. The records are returned in a dict, by
+        repository ID, and are cached like individual listings.
+        """
+        files = {dvr: [] for dvr in dvrs}
+        for rec in self._iter_files(sorted(files)):
+            for repo in _as_list(rec.get('repository')):
+                if repo.get('@id') in files:
+                    files[repo['@id']].append(_get_file_record(rec))
+        for dvr, recs in files.items():
+            # stored just like by iter_files()
+            deque(self.cache.cached_iter(
+                'File.listing',
+                dict(file_repository=dvr),
+                lambda recs=recs: recs,
+                refresh=True,
+            ), maxlen=0)
+        return files
 
-    # the chunk size is large, because the per-request latency costs
-    # are enourmous
-    # https://github.com/HumanBrainProject/fairgraph/issues/57
-    def iter_files(self, dvr, chunk_size=10000):
+    def _iter_files(self, dvr):
+        """Yield the query records of the files in one or more repositories
+
+        ``dvr`` is the ID of a file repository, or a list of IDs.
+        """
+        # the total number of files is only known for a single repository
+        if self.parallel_pages and self.max_requests > 1 \
+                and not isinstance(dvr, list):
+            yield from self._iter_files_parallel(dvr)
+            return
         cur_index = 0
         while True:
-            batch = omcore.File.list(
-                self.client,
-                file_repository=dvr,
-                size=chunk_size,
-                from_index=cur_index)
-            yield from batch
-            if len(batch) < chunk_size:
+            chunk_size = self.page_size.size
+            n = 0
+            # records are passed on while a page is still being received
+            for rec in self._iter_file_range(dvr, chunk_size, cur_index):
+                n += 1
+                yield rec
+            if n < chunk_size:
                 # there is no point in asking for another batch
                 return
-            cur_index += len(batch)
+            cur_index += n
+
+    def _iter_files_parallel(self, dvr):
+        try:
+            total = self.cache.cached(
+                'File.count',
+                dict(file_repository=dvr),
+                partial(self._count_files, dvr),
+            )
+        except Exception as e:
+            # we can still probe for the end of the listing
+            lgr.debug('Could not determine number of files in %s: %s',
+                      dvr, CapturedException(e))
+            total = None
+        # concurrent pages need fixed boundaries, but the size is still
+        # adjusted within a page, if needed
+        chunk_size = self.page_size.size
+        next_index = 0
+        pending = deque()
+        # listings of other versions or datasets may run at the same time,
+        # the process-wide request limit applies to all of them
+        with ThreadPoolExecutor(max_workers=self.max_requests) as executor:
+
+            def _fill():
+                nonlocal next_index
+                # beyond the expected end of the listing, we only
+                # probe one page at a time
+                while len(pending) < self.max_requests and (
+                        total is None or next_index < total
+                        or not pending):
+                    pending.append(executor.submit(
+                        self._list_files, dvr, chunk_size, next_index))
+                    next_index += chunk_size
+
+            _fill()
+            try:
+                while pending:
+                    # pages are consumed in order, to yield records in the
+                    # same order as a sequential listing
+                    batch = pending.popleft().result()
+                    yield from batch
+                    if len(batch) < chunk_size:
+                        # this was the last page
+                        return
+                    _fill()
+            finally:
+                for page in pending:
+                    page.cancel()
+
+    def _count_files(self, dvr):
+        """Return the number of files in a repository"""
+        with http_session.request_slot():
+            return omcore.File.count(self.client, file_repository=dvr)
+
+    def _list_files(self, dvr, size, from_index):
+        """Return ``size`` records starting at ``from_index``"""
+        return list(self._iter_file_range(dvr, size, from_index))
+
+    def _iter_file_range(self, dvr, size, from_index, max_failures=3):
+        """Yield ``size`` records starting at ``from_index``
+
+        Fewer records are yielded at the end of the listing. The range is
+        retrieved with as many requests as the adaptive page size requires.
+        Responses are parsed while they are received, and records are
+        yielded as soon as they are complete.
+        """
+        query = kg_query.get_file_listing_query(dvr)
+        count = 0
+        failures = 0
+        while count < size:
+            page_size = min(self.page_size.size, size - count)
+            # the time the consumer takes is no indication of throughput
+            timer = StageTimer()
+            n = 0
+            try:
+                for rec in timer.time_iter('page', kg_query.iter_query(
+                        self.client, query,
+                        from_index=from_index + count,
+                        size=page_size)):
+                    n += 1
+                    yield rec
+            except Exception as e:
+                # records passed on already are not requested again
+                count += n
+                failures += 1
+                if failures > max_failures \
+                        or page_size <= self.page_size.minimum:
+                    raise
+                self.page_size.failed(page_size, CapturedException(e))
+                continue
+            count += n
+            self.page_size.record(page_size, n, timer.as_dict()['page'])
+            if n < page_size:
+                break
+
+    def _collect_file_records(self, ds, frecs):
+        """Return file records as a sized, re-iterable collection
+
+        Large collections are spilled into a scratch database in the
+        dataset's ``.git`` directory.
+        """
+        if isinstance(frecs, _PendingListing):
+            frecs = frecs.result()
+        return collect_file_records(
+            frecs,
+            self.spill_threshold,
+            # no dataset when only listing
+            ds.repo.dot_git if ds is not None else None,
+        )
+
+    def _iter_timed_file_records(self, ds, kg_dsver, files=None):
+        yield from self._get_timer(kg_dsver).time_iter(
+            'listing', self.get_file_records(ds, kg_dsver, files))
+
+    def _get_timer(self, kg_dsver):
+        return self._timers.setdefault(kg_dsver.uuid, StageTimer())
+
+    def _get_timing_summary(self, ds, kg_ds_versions, start, versions_query):
+        version_timings = {
+            v.version_identifier: self._get_timer(v).as_dict()
+            for v in kg_ds_versions
+        }
+        timings = dict(
+            sum_timings(version_timings.values()),
+            **{
+                'versions-query': round(versions_query, 3),
+                'total': round(time.perf_counter() - start, 3),
+            }
+        )
+        return get_status_dict(
+            action='ebrains-clone',
+            ds=ds,
+            type='dataset',
+            status='ok',
+            message=('Imported %i version(s) in %.1fs',
+                     len(kg_ds_versions), timings['total']),
+            ebrains_timings=timings,
+            ebrains_version_timings=version_timings,
+        )
 
     def import_metadata(self, ds, kg_dsver):
         #(ds.pathobj / 'version').write_text(kg_dsver.version_identifier)
         pass
 
     def save_ds_version(self, ds, kg_dsver):
-        with patch.dict(os.environ, self.get_agent_info(kg_dsver)):
+        with environ.agent_environ(ds.repo, self.get_agent_info(kg_dsver)):
             yield from ds.save(
                 # TODO wrap the message?
                 # TODO there is no meaningful subject line for the changelog
@@ -281,36 +1166,117 @@ class FairGraphQuery:
         }
 
 
-def _get_fname_dataproxy_v1_bucket(f):
-    f_url_p = urlparse(f.iri.value)
-    assert f_url_p.netloc == 'data-proxy.ebrains.eu'
-    assert f_url_p.path.startswith('/api/v1/public/buckets/')
-    path = PurePosixPath(f_url_p.path)
-    # take everything past the bucket_id and turn into a Platform native path
-    return Path(*path.parts[6:])
-
-
-def _get_fname_cscs_repo(baseurl, prefix, f):
-    f_url = f.iri.value
-    # we presently have no better way to determine a relative file path
-    # than to "subtract" the base URL
-    assert f_url.startswith(baseurl)
-    fname = f_url[len(baseurl):].lstrip('/')
-    assert fname.startswith(prefix)
-    # strip file repository prefix
-    # TODO check https://github.com/datalad/datalad-ebrains/issues/39
-    # if that is desirable
-    # also strip any leading slash, any absolute path is invalid here
-    fname = fname[len(prefix):].lstrip('/')
-    # we have a relative posix path now
-    fname = PurePosixPath(fname)
-    # turn into a Platform native path
-    fname = Path(*fname.parts)
-    return fname
-
-
-def _file_iri_to_url(iri):
-    # the IRI is not a valid URL(?!), we must quote the path
-    # to make it such
-    f_url_p = urlparse(iri)
-    return f_url_p._replace(path=quote(f_url_p.path)).geturl()
+def _get_dataset_id(kg_ds_uuid, shard=None):
+    # we create a reproducible dataset ID from the KG dataset ID
+    # we are not reusing it directly, because we have two linked
+    # but different objects
+    ds_id = str(
+        uuid.uuid5(
+            # create a DNS namespace UUID from 'datalad.org'
+            uuid.uuid5(uuid.NAMESPACE_DNS, 'datalad.org'),
+            kg_ds_uuid,
+        )
+    )
+    if shard is None:
+        return ds_id
+    # the ID of a subdataset is derived from that of its superdataset,
+    # and its (POSIX) path in it
+    return str(uuid.uuid5(uuid.UUID(ds_id), shard))
+
+
+def _get_topdir(name):
+    # the top-level directory of a file name, None for a top-level file
+    topdir, sep, _ = name.partition(os.sep)
+    return topdir if sep else None
+
+
+def _remove_empty_dirs(path):
+    for root, dirs, _ in os.walk(path, topdown=False):
+        for d in dirs:
+            try:
+                (Path(root) / d).rmdir()
+            except OSError:
+                # not empty
+                pass
+
+
+def _iter_concurrently(fns, max_workers):
+    """Yield the items of the iterables returned by ``fns`` as they come
+
+    The callables ``fns`` are run in up to ``max_workers`` threads.
+    """
+    items = Queue()
+    done = object()
+
+    def _run(fn):
+        try:
+            for item in fn():
+                items.put(item)
+        finally:
+            items.put(done)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_run, fn) for fn in fns]
+        pending = len(futures)
+        while pending:
+            item = items.get()
+            if item is done:
+                pending -= 1
+                continue
+            yield item
+        for f in futures:
+            # raise any exception
+            f.result()
+
+
+def _get_file_record(rec):
+    # turn a record of a file listing query into a slim file record
+    hashes = rec.get('hash') or []
+    md5sums = [
+        h['digest'] for h in (hashes if isinstance(hashes, list) else [hashes])
+        if (h.get('algorithm') or '').lower() == 'md5'
+    ]
+    # we presently cannot understand non-md5 hashes
+    assert md5sums, f"No MD5 checksum for {rec['iri']}"
+    # a tuple is much smaller than a dict, listings can be huge
+    # (size is assumed to be in bytes)
+    return rec['iri'], md5sums[0], rec['size']
+
+
+def _get_listing_key(kg_dsver):
+    # versions with the same file repository have identical file records,
+    # a version without one is on its own
+    return kg_dsver.repository_id or kg_dsver.uuid
+
+
+def _uuid_from_uri(uri):
+    return uri.rstrip('/').rsplit('/', 1)[-1]
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class _PendingListing:
+    """The file records of a version, as listed by ``_list_batch()``
+
+    ``listings`` are the listings of a batch, or a ``Future`` of them.
+    Obtaining the records is deferred until they are consumed, such that
+    any exception raised while obtaining them surfaces at that time, just
+    like it would with a plain generator.
+    """
+    def __init__(self, listings, i):
+        self._listings = listings
+        self._i = i
+
+    def result(self):
+        listings = self._listings.result() \
+            if isinstance(self._listings, Future) else self._listings
+        if isinstance(listings[self._i], Exception):
+            raise listings[self._i]
+        return listings[self._i]
+
+    def __iter__(self):
+        return iter(self.result())
@@ -0,0 +1,292 @@
+"""Build the version history of a dataset with ``git fast-import``
+
+Rather than building each version in the worktree, registering its files,
+and saving it, the commits for all versions are written in a single
+``git fast-import`` stream. Trees contain the same annex symlinks, and
+commits carry the same identities, dates, and messages as those created by
+``addurls`` and ``save``. Hence the resulting commits are identical.
+"""
+
+from functools import partial
+import logging
+import subprocess
+import tempfile
+
+from datalad_next.commands import get_status_dict
+from datalad_next.exceptions import CapturedException
+
+from datalad_ebrains.annex_batch import (
+    _BatchProcess,
+    _posix,
+    get_batch_errors,
+    get_symlink_target,
+    iter_annex_keys,
+)
+from datalad_ebrains.environ import get_environ
+from datalad_ebrains.record_store import iter_sorted_by_name
+
+
+lgr = logging.getLogger('datalad.ext.ebrains.fast_import')
+
+# namespace of the refs an import writes to
+TMP_REFS = 'refs/ebrains-import/'
+# size of the file changes of a commit to hold in memory, in bytes
+SPOOL_SIZE = 1024 * 1024
+
+
+def import_history(ds, versions, collect=list):
+    """Commit a sequence of versions on top of the current branch
+
+    ``versions`` is an iterable of ``(frecs, env, message, tag)`` tuples,
+    with the file records of a version (a ``FileRecord`` for each file of
+    the version), a mapping of ``GIT_AUTHOR/COMMITTER_*`` environment
+    variables, a commit message, and a version tag. ``collect`` turns the
+    file records of a version into a sized, re-iterable collection.
+
+    The dataset must have been freshly created, and must not be on an
+    adjusted/managed branch. File URLs are registered in the git-annex
+    branch via a single ``git annex registerurl`` batch process. Commits and
+    tags are written to temporary refs, and only replace the branch and
+    version tags once ``fast-import`` and ``registerurl`` both succeeded,
+    and all files could be registered. The worktree is updated to the last
+    version at the end. On failure, branch, tags, and worktree remain
+    untouched. Only the records of two consecutive versions are needed at
+    a time, and they are traversed in order of file names, hence
+    ``collect`` determines the memory needed.
+
+    Yields result records for registered files and saved versions, just
+    like ``addurls`` and ``save`` would.
+    """
+    repo = ds.repo
+    branch = repo.get_active_branch()
+    parent = repo.get_hexsha(branch)
+    # leftovers of an earlier, interrupted run
+    _delete_refs(ds, TMP_REFS)
+    try:
+        yield from _import_history(ds, versions, collect, branch, parent)
+    finally:
+        _delete_refs(ds, TMP_REFS)
+
+
+def _import_history(ds, versions, collect, branch, parent):
+    ncommits = 0
+    file_errors = False
+    with _BatchProcess(
+            ['git', 'fast-import', '--quiet', '--date-format=raw'],
+            ds.path, encoding=None) as fast_import, \
+            _BatchProcess(
+                ['git', 'annex', 'registerurl', '--batch'],
+                ds.path) as registerurl:
+        # records of the files in the parent commit
+        # (we start from an empty dataset)
+        prev = []
+        for frecs, env, message, tag in versions:
+            try:
+                frecs = collect(frecs)
+            except NotImplementedError as e:
+                yield get_status_dict(
+                    status='impossible',
+                    action='ebrains-clone',
+                    exception=CapturedException(e),
+                )
+                # proceed with an empty version
+                frecs = []
+            # file changes of the commit, kept on disk for large versions
+            with tempfile.SpooledTemporaryFile(
+                    max_size=SPOOL_SIZE, dir=ds.repo.dot_git) as changes:
+                tree_changed = False
+
+                def _iter_register():
+                    nonlocal tree_changed
+                    for r, change in _iter_changes(prev, frecs):
+                        tree_changed = tree_changed or change != 'U'
+                        if change == 'D':
+                            changes.write(
+                                b'D ' + _quote(_posix(r.name)) + b'\n')
+                        else:
+                            yield r
+
+                for r, ek in iter_annex_keys(ds, collect(_iter_register())):
+                    fpath = ds.pathobj / r.name
+                    if isinstance(ek, Exception):
+                        file_errors = True
+                        yield get_status_dict(
+                            action='addurls',
+                            ds=ds,
+                            type='file',
+                            path=str(fpath),
+                            status='error',
+                            exception=CapturedException(ek),
+                        )
+                        continue
+                    key = ek['key']
+                    registerurl.write(f"{key} {r.url}\n")
+                    # a no-op for a file with a new URL only
+                    changes.write(
+                        b'M 120000 inline ' + _quote(_posix(r.name)) + b'\n'
+                        + _data(get_symlink_target(r.name, ek)))
+                    yield get_status_dict(
+                        action='addurls',
+                        ds=ds,
+                        type='file',
+                        path=str(fpath),
+                        key=key,
+                        status='ok',
+                        message='registered URL',
+                    )
+                status = 'notneeded'
+                if tree_changed:
+                    # like 'git commit' would do it, but without a worktree
+                    ncommits += 1
+                    author, committer = _get_idents(ds, env)
+                    fast_import.write(
+                        f'commit {TMP_REFS}heads/{branch}\n'
+                        f'mark :{ncommits}\n'
+                        f'author {author}\n'
+                        f'committer {committer}\n'.encode('utf-8')
+                        + _data(_get_commit_message(ds, message))
+                        + f'from {parent}\n'.encode('utf-8')
+                    )
+                    changes.seek(0)
+                    for chunk in iter(partial(changes.read, SPOOL_SIZE), b''):
+                        fast_import.write(chunk)
+                    fast_import.write(b'\n')
+                    parent = f':{ncommits}'
+                    status = 'ok'
+            res = get_status_dict(
+                action='save',
+                ds=ds,
+                type='dataset',
+                status=status,
+            )
+            if tag:
+                # lightweight tag, like 'save(version_tag=...)'
+                fast_import.write(
+                    f'reset {TMP_REFS}tags/{tag}\nfrom {parent}\n\n'.encode(
+                        'utf-8'))
+                res.update(status='ok', version_tag=tag)
+            yield res
+            prev = frecs
+    failed = list(get_batch_errors(ds, fast_import, registerurl))
+    if failed or file_errors:
+        # the temporary refs are discarded, nothing else was changed
+        yield from failed
+        return
+    _publish_refs(ds, TMP_REFS)
+    if ncommits:
+        # bring index and worktree up-to-date with the new branch state
+        ds.repo.call_git(['reset', '--hard', '--quiet'])
+
+
+def _iter_changes(prev, frecs):
+    """Yield a ``(record, change)`` tuple per file that differs in ``frecs``
+
+    ``change`` is ``'D'`` for a record of ``prev`` that is no longer
+    present, ``'M'`` for a new file or one with a changed content, and
+    ``'U'`` for a file whose URL changed only. Both versions are traversed
+    in the order of file names, such that no lookup of all previous
+    records needs to be held in memory.
+    """
+    prev = iter_sorted_by_name(prev)
+    prev_r = next(prev, None)
+    for r in iter_sorted_by_name(frecs):
+        while prev_r is not None and prev_r.name < r.name:
+            yield prev_r, 'D'
+            prev_r = next(prev, None)
+        if prev_r is not None and prev_r.name == r.name:
+            same_name, prev_r = prev_r, next(prev, None)
+            if same_name == r:
+                continue
+            if (same_name.md5sum, same_name.size) == (r.md5sum, r.size):
+                # same name and checksum, hence the same key
+                yield r, 'U'
+                continue
+        yield r, 'M'
+    while prev_r is not None:
+        yield prev_r, 'D'
+        prev_r = next(prev, None)
+
+
+def _publish_refs(ds, prefix):
+    """Move all refs under ``prefix`` to ``refs/``, in one transaction"""
+    refs = _get_refs(ds, prefix)
+    _update_refs(ds, [
+        f'update refs/{name[len(prefix):]} {sha}' for sha, name in refs
+    ] + [
+        f'delete {name} {sha}' for sha, name in refs
+    ])
+
+
+def _delete_refs(ds, prefix):
+    """Delete all refs under ``prefix``"""
+    _update_refs(ds, [
+        f'delete {name} {sha}' for sha, name in _get_refs(ds, prefix)
+    ])
+
+
+def _get_refs(ds, prefix):
+    return [
+        line.split(' ', 1)
+        for line in ds.repo.call_git_items_(
+            ['for-each-ref', '--format=%(objectname) %(refname)', prefix])
+    ]
+
+
+def _update_refs(ds, instructions):
+    if not instructions:
+        return
+    subprocess.run(
+        ['git', 'update-ref', '--stdin'],
+        cwd=ds.path,
+        input=''.join(f'{i}\n' for i in instructions).encode('utf-8'),
+        capture_output=True,
+        check=True,
+    )
+
+
+def _get_idents(ds, env):
+    # let Git determine the identities the same way 'git commit' would
+    # under this environment, including the parsing of dates
+    return [
+        subprocess.run(
+            ['git', 'var', var],
+            cwd=ds.path,
+            env=get_environ(env),
+            capture_output=True,
+            check=True,
+            encoding='utf-8',
+        ).stdout.strip()
+        for var in ('GIT_AUTHOR_IDENT', 'GIT_COMMITTER_IDENT')
+    ]
+
+
+def _get_commit_message(ds, message):
+    if not message:
+        # what 'save' uses when no message is given
+        message = '[DATALAD] Recorded changes'
+    # 'git commit -m' applies whitespace cleanup
+    message = subprocess.run(
+        ['git', 'stripspace'],
+        cwd=ds.path,
+        input=message.encode('utf-8'),
+        capture_output=True,
+        check=True,
+    ).stdout
+    if not message:
+        raise ValueError('Empty commit message after whitespace cleanup')
+    return message
+
+
+def _data(content):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return b'data %i\n' % len(content) + content + b'\n'
+
+
+def _quote(path):
+    path = path.encode('utf-8')
+    if path.startswith(b'"') or b'\n' in path:
+        # C-style quoting is mandatory for such paths
+        path = b'"' + path.replace(b'\\', b'\\\\').replace(
+            b'"', b'\\"').replace(b'\n', b'\\n') + b'"'
+    return path
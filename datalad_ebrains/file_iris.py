@@ -0,0 +1,162 @@
+"""Derivation of download URLs and file names from EBRAINS file IRIs
+
+The file name of a file in a dataset is its IRI relative to the IRI of the
+file repository it is part of. EBRAINS uses different types of file
+repositories that need slightly different handling.
+
+The reference implementation parses each IRI as a URL, and builds path
+objects for every file. For listings with millions of files, this is
+costly. The repository prefix is therefore checked once, and for any IRI
+that starts with it, URL and file name are derived by string slicing.
+IRIs that URL parsing or path normalization would treat specially, fall
+back on the reference implementation, hence the results are identical.
+"""
+
+from functools import partial
+import os
+from pathlib import (
+    Path,
+    PurePosixPath,
+)
+import re
+from urllib.parse import (
+    quote,
+    urlparse,
+)
+
+
+def get_repository_type(repository_iri):
+    """Return the type of a file repository, or ``None`` if unrecognized
+
+    Types are ``'dataproxy-bucket'`` (a bucket of the EBRAINS data proxy),
+    and ``'cscs-container'`` (a container in the CSCS object store, with
+    a prefix for the files of the repository).
+    """
+    dvr_url_p = urlparse(repository_iri)
+    if dvr_url_p.netloc == 'data-proxy.ebrains.eu' \
+            and dvr_url_p.path.startswith('/api/v1/public/buckets/'):
+        return 'dataproxy-bucket'
+    elif dvr_url_p.netloc == 'object.cscs.ch' \
+            and dvr_url_p.query.startswith('prefix='):
+        return 'cscs-container'
+    return None
+
+
+def get_url_and_name_getter(repository_iri):
+    """Return a function that derives ``(url, name)`` from a file IRI
+
+    ``repository_iri`` is the IRI of the file repository the files are
+    part of. The returned function raises ``AssertionError`` for an IRI
+    that does not belong to the repository. ``NotImplementedError`` is
+    raised for an unrecognized type of repository.
+    """
+    repository_type = get_repository_type(repository_iri)
+    if repository_type == 'dataproxy-bucket':
+        get_fname = _get_fname_dataproxy_v1_bucket
+        # the bucket is the last component of the repository IRI
+        prefix = repository_iri.rstrip('/') + '/'
+        if len(PurePosixPath(urlparse(prefix).path).parts) != 6:
+            prefix = None
+    elif repository_type == 'cscs-container':
+        dvr_url_p = urlparse(repository_iri)
+        # get the repos base url by removing the query string
+        # input is like:
+        # https://example.com/<basepath>?prefix=MPM-collections/13/
+        # output is: https://example.com/<basepath>
+        # the prefix is part of the file IRIs again
+        dvr_prefix = dvr_url_p.query
+        # this is a prefix and there are no other variables
+        assert dvr_prefix.startswith('prefix=')
+        assert dvr_prefix.count('=') == 1
+        dvr_prefix = dvr_prefix[len('prefix='):]
+        baseurl = dvr_url_p._replace(query='').geturl()
+        get_fname = partial(_get_fname_cscs_repo, baseurl, dvr_prefix)
+        prefix = None if dvr_prefix.startswith('/') else ''.join((
+            baseurl,
+            '' if baseurl.endswith('/') else '/',
+            dvr_prefix,
+            '' if not dvr_prefix or dvr_prefix.endswith('/') else '/',
+        ))
+    else:
+        raise NotImplementedError(
+            f'Unrecognized file repository pointer {repository_iri}')
+
+    def get_url_and_name(iri):
+        return _file_iri_to_url(iri), str(get_fname(iri))
+
+    if os.sep != '/' or prefix is None or not _is_plain_prefix(prefix):
+        # platform native paths are not plain, or the repository IRI
+        # needs the reference implementation
+        return get_url_and_name
+
+    url_prefix = _file_iri_to_url(prefix)
+    prefix_len = len(prefix)
+    needs_reference = _needs_reference.search
+    is_url_safe = _url_safe.fullmatch
+
+    def get_url_and_name_fast(iri):
+        if not iri.startswith(prefix):
+            return get_url_and_name(iri)
+        name = iri[prefix_len:]
+        if needs_reference(name):
+            return get_url_and_name(iri)
+        return url_prefix + (name if is_url_safe(name) else quote(name)), \
+            name
+
+    return get_url_and_name_fast
+
+
+# anything in a relative path that URL parsing or path normalization would
+# change: query, fragment, parameters, removed or stripped characters, and
+# empty, '.', or absolute path components
+_needs_reference = re.compile(
+    r'[?#;\t\r\n]|[\x00-\x20]\Z|\A\Z|\A/|/\Z|//|(?:\A|/)\.(?:/|\Z)')
+# what quote() leaves as is
+_url_safe = re.compile(r'[A-Za-z0-9_.~/-]*')
+
+
+def _is_plain_prefix(prefix):
+    # a prefix that URL parsing leaves as is, and that does not change the
+    # parsing of anything that is appended to it
+    p = urlparse(prefix)
+    return bool(p.scheme and p.netloc) \
+        and p.path.startswith('/') \
+        and p.path.endswith('/') \
+        and not (p.params or p.query or p.fragment) \
+        and p.geturl() == prefix \
+        and (p.path == '/' or not _needs_reference.search(p.path[1:-1]))
+
+
+def _get_fname_dataproxy_v1_bucket(iri):
+    f_url_p = urlparse(iri)
+    assert f_url_p.netloc == 'data-proxy.ebrains.eu'
+    assert f_url_p.path.startswith('/api/v1/public/buckets/')
+    path = PurePosixPath(f_url_p.path)
+    # take everything past the bucket_id and turn into a Platform native path
+    return Path(*path.parts[6:])
+
+
+def _get_fname_cscs_repo(baseurl, prefix, iri):
+    f_url = iri
+    # we presently have no better way to determine a relative file path
+    # than to "subtract" the base URL
+    assert f_url.startswith(baseurl)
+    fname = f_url[len(baseurl):].lstrip('/')
+    assert fname.startswith(prefix)
+    # strip file repository prefix
+    # TODO check https://github.com/datalad/datalad-ebrains/issues/39
+    # if that is desirable
+    # also strip any leading slash, any absolute path is invalid here
+    fname = fname[len(prefix):].lstrip('/')
+    # we have a relative posix path now
+    fname = PurePosixPath(fname)
+    # turn into a Platform native path
+    fname = Path(*fname.parts)
+    return fname
+
+
+def _file_iri_to_url(iri):
+    # the IRI is not a valid URL(?!), we must quote the path
+    # to make it such
+    f_url_p = urlparse(iri)
+    return f_url_p._replace(path=quote(f_url_p.path)).geturl()
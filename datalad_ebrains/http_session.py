@@ -0,0 +1,156 @@
+"""Process-wide pooled HTTP session for all Knowledge Graph requests
+
+The KG client library performs every request with a plain
+``requests.request()`` call, which sets up a new connection (including a
+TLS handshake) each time. Here, its requests are routed through a single
+``requests.Session`` instead, such that connections are kept alive and
+reused -- across requests, queries, and even ``FairGraphQuery`` instances.
+The number of requests running at the same time is limited process-wide,
+too.
+"""
+
+import logging
+import sys
+from threading import (
+    BoundedSemaphore,
+    Lock,
+)
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import (
+    HTTPConnectionPool,
+    HTTPSConnectionPool,
+)
+
+from datalad import cfg as dlcfg
+
+
+lgr = logging.getLogger('datalad.ext.ebrains.http_session')
+
+# the KG client module that performs the actual requests
+_kg_communication_module = 'kg_core.__communication'
+
+# seconds to wait for a connection, and for any data of a response; the
+# latter is no limit for the total duration of a (streamed) response
+TIMEOUT = (10, 300)
+
+_lock = Lock()
+_session = None
+_request_slots = None
+_stats = dict(requests=0, connections=0)
+
+
+def get_session():
+    """Return the shared session, create it on first use
+
+    The number of connections kept alive (per host) is determined by
+    ``datalad.ebrains.http-pool-size``. When more requests run
+    concurrently, additional connections are opened, but not kept.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            pool_size = dlcfg.obtain('datalad.ebrains.http-pool-size')
+            adapter = _CountingAdapter(
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def request_slot():
+    """Return the process-wide limit of concurrent KG requests
+
+    The returned semaphore has ``datalad.ebrains.max-requests`` slots, and
+    is shared by all threads, queries, and ``FairGraphQuery`` instances. A
+    request must hold a slot (``with request_slot(): ...``) until its
+    response has been consumed.
+    """
+    global _request_slots
+    with _lock:
+        if _request_slots is None:
+            _request_slots = BoundedSemaphore(
+                dlcfg.obtain('datalad.ebrains.max-requests'))
+        return _request_slots
+
+
+def install():
+    """Route all requests of the KG client through the shared session
+
+    Safe to call any number of times.
+    """
+    mod = sys.modules.get(_kg_communication_module)
+    if mod is None:
+        # make sure the KG client is loaded, such that it cannot replace
+        # the shim later on
+        import kg_core.kg  # noqa: F401
+        mod = sys.modules[_kg_communication_module]
+    if not isinstance(mod.requests, _SessionRequests):
+        mod.requests = _SessionRequests()
+
+
+def get_stats():
+    """Return the number of requests and connections so far
+
+    Returns a dict with the number of ``requests`` performed, the number
+    of ``new`` connections opened for them, and the number of requests that
+    ``reused`` an existing connection.
+    """
+    with _lock:
+        return dict(
+            requests=_stats['requests'],
+            new=_stats['connections'],
+            reused=max(0, _stats['requests'] - _stats['connections']),
+        )
+
+
+def _count(what):
+    with _lock:
+        _stats[what] += 1
+
+
+class _SessionRequests:
+    """Stand-in for the ``requests`` module, using the shared session"""
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', TIMEOUT)
+        return get_session().request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def __getattr__(self, name):
+        # anything else (exceptions, etc.) comes from the real thing
+        return getattr(requests, name)
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count('connections')
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count('connections')
+        return super()._new_conn()
+
+
+class _CountingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        _count('requests')
+        return super().send(request, **kwargs)
@@ -0,0 +1,334 @@
+"""Persistent on-disk cache for EBRAINS Knowledge Graph query responses"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import tempfile
+from threading import Lock
+import time
+
+from datalad import cfg as dlcfg
+
+from datalad_ebrains.token_store import get_token_claims
+
+
+lgr = logging.getLogger('datalad.ext.ebrains.kg_cache')
+
+# version of the format of cached values (plain query records, and tuples
+# derived from them), to be increased with any change of it, such that
+# entries of another format are never reused
+CACHE_FORMAT = 3
+
+
+class KGQueryCache:
+    """Cache for KG query responses, keyed by query kind, parameters, identity
+
+    Each entry is stored in an individual file in the cache directory, as
+    JSON lines: the creation time of the entry, which is used to enforce
+    the ``ttl``, followed by the value, or the individual items of an
+    iterable. Values must be JSON-serializable, and tuples are returned as
+    lists. Unlike pickles, a cache directory that is writable by others
+    cannot be used to execute code.
+
+    An entry's modification time is bumped on every cache hit, and is used
+    to determine the least recently used entries for eviction, whenever the
+    total cache size exceeds ``maxsize``. The total size is determined once,
+    and is then tracked as entries are written. Entries written by other
+    processes are only accounted for when the cache is evicted.
+
+    Parameters
+    ----------
+    path: Path
+      Directory to store cache entries in. Will be created if needed.
+    identity: str
+      Identifier of the user identity on whose behalf queries are performed.
+      Included in every cache key, because query responses depend on the
+      permissions of a user.
+    ttl: int
+      Maximum age of a cache entry in seconds.
+    maxsize: int
+      Maximum total size of all cache entries in bytes.
+    enabled: bool
+      If ``False``, the cache is bypassed entirely, and no entries are read
+      or written.
+    read_only: bool
+      If ``True``, entries are read, but the cache directory is never
+      modified: no entries are written or evicted, and the last-use time of
+      an entry is not updated on a cache hit.
+    """
+    def __init__(self, path: Path, identity: str, *,
+                 ttl: int, maxsize: int, enabled: bool = True,
+                 read_only: bool = False):
+        self.path = path
+        self.identity = identity
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.read_only = read_only
+        # total size of all entries, determined on the first write
+        self._size = None
+        self._size_lock = Lock()
+
+    @classmethod
+    def from_config(cls, token=None):
+        """Create a cache instance from the DataLad configuration
+
+        The ``token`` is used to determine the user identity to key cache
+        entries on, together with the KG host queried on its behalf.
+        """
+        return cls(
+            Path(dlcfg.obtain('datalad.locations.cache')) / 'ebrains' / 'kg',
+            '{}@{}'.format(
+                _get_token_identity(token),
+                dlcfg.obtain('datalad.ebrains.kg-host'),
+            ),
+            ttl=dlcfg.obtain('datalad.ebrains.kg-cache-ttl'),
+            maxsize=dlcfg.obtain('datalad.ebrains.kg-cache-maxsize')
+            * 1024 * 1024,
+            enabled=dlcfg.obtain('datalad.ebrains.kg-cache'),
+        )
+
+    def cached(self, kind: str, params: dict, fn, refresh: bool = False):
+        """Return a cached response, or call ``fn()`` and cache its result
+
+        ``kind`` names the type of query (e.g. ``'File.list'``), and
+        ``params`` is a JSON-serializable mapping with all parameters that
+        influence the response (e.g. instance ID, page size, offset).
+        Exceptions raised by ``fn`` are not cached. With ``refresh``, any
+        cached response is ignored, and replaced by the return value of
+        ``fn()``.
+        """
+        if not self.enabled:
+            return fn()
+        entry = self._get_entry_path(kind, params)
+        if not refresh:
+            try:
+                value = self._read(entry)
+                lgr.debug('Cache hit for %s %s', kind, params)
+                return value
+            except KeyError:
+                pass
+        value = fn()
+        if not self.read_only:
+            self._write(entry, value)
+        return value
+
+    def has(self, kind: str, params: dict) -> bool:
+        """Whether there is an entry for a query
+
+        This is cheap, but the entry may have expired already.
+        """
+        return self.enabled \
+            and self._get_entry_path(kind, params).exists()
+
+    def cached_iter(self, kind: str, params: dict, fn,
+                    refresh: bool = False):
+        """Like ``cached()``, but for a callable returning an iterable
+
+        Items are yielded as they are produced by ``fn()``, and are written
+        to the cache entry one at a time. They are never collected in
+        memory, neither when writing nor when reading an entry. The entry
+        only becomes visible once the iterable is exhausted. Iterables that
+        would take more than ``maxsize`` bytes in the cache are not cached.
+        """
+        if not self.enabled:
+            yield from fn()
+            return
+        entry = self._get_entry_path(kind, params)
+        items = None
+        if not refresh:
+            try:
+                items = self._read_iter(entry)
+                lgr.debug('Cache hit for %s %s', kind, params)
+            except KeyError:
+                pass
+        if items is not None:
+            yield from items
+            return
+        if self.read_only:
+            yield from fn()
+            return
+        yield from self._write_iter(entry, fn())
+
+    def _get_entry_path(self, kind, params):
+        key = json.dumps(
+            [self.identity, CACHE_FORMAT, kind, params],
+            sort_keys=True,
+        )
+        return self.path / hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _read(self, entry):
+        try:
+            with entry.open('rb') as f:
+                created = json.loads(f.readline())
+                value = json.loads(f.readline())
+        except FileNotFoundError as e:
+            raise KeyError(entry) from e
+        except Exception as e:
+            # a defunct entry is no different from a missing one
+            lgr.debug('Ignoring unreadable cache entry %s: %s', entry, e)
+            raise KeyError(entry) from e
+        if time.time() - created > self.ttl:
+            raise KeyError(entry)
+        self._touch(entry)
+        return value
+
+    def _read_iter(self, entry):
+        try:
+            f = entry.open('rb')
+        except FileNotFoundError as e:
+            raise KeyError(entry) from e
+        try:
+            created = json.loads(f.readline())
+        except Exception as e:
+            f.close()
+            lgr.debug('Ignoring unreadable cache entry %s: %s', entry, e)
+            raise KeyError(entry) from e
+        if time.time() - created > self.ttl:
+            f.close()
+            raise KeyError(entry)
+        self._touch(entry)
+        return _iter_lines(f)
+
+    def _touch(self, entry):
+        if not self.read_only:
+            # mark as recently used
+            os.utime(entry)
+
+    def _write(self, entry, value):
+        f = self._open_tmp()
+        try:
+            _write_line(f, time.time())
+            _write_line(f, value)
+        except Exception as e:
+            lgr.debug('Failed to write cache entry %s: %s', entry, e)
+            _discard(f)
+            return
+        self._commit(f, entry)
+
+    def _write_iter(self, entry, items):
+        f = self._open_tmp()
+        try:
+            _write_line(f, time.time())
+            for item in items:
+                if f is not None:
+                    try:
+                        _write_line(f, item)
+                    except Exception as e:
+                        lgr.debug('Failed to write cache entry %s: %s',
+                                  entry, e)
+                        f = _discard(f)
+                if f is not None and f.tell() > self.maxsize:
+                    # would only evict everything else, and itself
+                    lgr.debug('Not caching %s, exceeds the cache size', entry)
+                    f = _discard(f)
+                yield item
+            if f is not None:
+                self._commit(f, entry)
+                f = None
+        finally:
+            # consumption was aborted, or the iterable raised
+            if f is not None:
+                _discard(f)
+
+    def _open_tmp(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file and move into place, to never expose
+        # partial entries to concurrent readers
+        return tempfile.NamedTemporaryFile(
+            dir=self.path, prefix='.tmp', delete=False)
+
+    def _commit(self, f, entry):
+        try:
+            f.close()
+            delta = os.stat(f.name).st_size
+            try:
+                # an entry is replaced, e.g., an expired one
+                delta -= entry.stat().st_size
+            except FileNotFoundError:
+                pass
+            os.replace(f.name, entry)
+        except Exception as e:
+            lgr.debug('Failed to write cache entry %s: %s', entry, e)
+            _discard(f)
+            return
+        with self._size_lock:
+            if self._size is None:
+                # includes the new entry already
+                self._size = sum(size for mtime, size, p in self._scan())
+            else:
+                self._size += delta
+            if self._size > self.maxsize:
+                self._size = self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until within ``maxsize``
+
+        Returns the total size of the remaining entries.
+        """
+        entries = list(self._scan())
+        total = sum(size for mtime, size, p in entries)
+        if total <= self.maxsize:
+            return total
+        # least recently used first
+        entries.sort(key=lambda e: e[0])
+        for mtime, size, p in entries:
+            if total <= self.maxsize:
+                break
+            _unlink(p)
+            total -= size
+            lgr.debug('Evicted cache entry %s', p)
+        return total
+
+    def _scan(self):
+        # (mtime, size, path) of all entries
+        for p in self.path.iterdir():
+            if p.name.startswith('.tmp'):
+                continue
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                # removed concurrently
+                continue
+            yield st.st_mtime, st.st_size, p
+
+
+def _get_token_identity(token):
+    """Return an identifier for the user identity a token belongs to
+
+    EBRAINS tokens are JWTs, and the subject claim identifies the user
+    across token renewals. If the token cannot be decoded, its hash is used
+    instead, which is safe, but limits cache reuse to the lifetime of the
+    token.
+    """
+    if not token:
+        return 'anonymous'
+    try:
+        return get_token_claims(token)['sub']
+    except Exception:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def _write_line(f, value):
+    f.write(json.dumps(value, separators=(',', ':')).encode('utf-8') + b'\n')
+
+
+def _iter_lines(f):
+    with f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _discard(f):
+    f.close()
+    _unlink(Path(f.name))
+
+
+def _unlink(path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        # removed concurrently
+        pass
@@ -0,0 +1,327 @@
+"""Streaming queries of the EBRAINS Knowledge Graph
+
+fairgraph decodes a complete query response, and turns every record into
+an object, before the first record can be used. For large pages of a file
+listing, peak memory hence grows with the page size. Here, a response is
+parsed incrementally while it is received, and plain records are yielded as
+soon as they are complete.
+
+The query specifications only request the properties an import needs, and
+follow links in the KG, such that related instances are retrieved with a
+single request.
+"""
+
+import codecs
+import json
+import re
+
+from datalad_ebrains.http_session import (
+    TIMEOUT,
+    get_session,
+    request_slot,
+)
+
+
+# the vocabulary of property names in query specifications
+QUERY_VOCAB = 'https://core.kg.ebrains.eu/vocab/query/'
+
+
+def iter_query(client, query, *, from_index=0, size=None, params=None,
+               stage='RELEASED', chunk_size=64 * 1024):
+    """Yield the records of a KG query as they arrive
+
+    Parameters
+    ----------
+    client: KGClient
+      Provides the KG endpoint and the authentication token.
+    query: dict
+      Query specification.
+    from_index: int
+      Index of the first record to return.
+    size: int, optional
+      Maximum number of records to return. By default, all records
+      are returned.
+    params: dict, optional
+      Additional request parameters, e.g. values of filter parameters
+      of the query.
+    stage: {'RELEASED', 'IN_PROGRESS'}
+    chunk_size: int
+      Number of bytes to read from the response at a time.
+
+    The request occupies one of the process-wide request slots (see
+    ``http_session.request_slot()``) until all records have been consumed,
+    or the iteration is abandoned. A request that stalls for longer than
+    ``http_session.TIMEOUT`` fails with ``requests.Timeout``.
+    """
+    config = client._kg_client.instances._kg_config
+    request_params = dict(
+        params or {},
+        stage=stage,
+        returnTotalResults='false',
+        **{'from': from_index},
+    )
+    if size is not None:
+        request_params['size'] = size
+    # the slot is held while the response is received, which ends when
+    # the records are consumed
+    with request_slot():
+        for force_token_fetch in (False, True):
+            token = config.token_handler.get_token(force_token_fetch) \
+                if config.token_handler else None
+            response = get_session().post(
+                f'{config.endpoint}queries',
+                json=query,
+                params=request_params,
+                headers={'Authorization': f'Bearer {token}'} if token else {},
+                stream=True,
+                # a stalled request must not hold its slot forever
+                timeout=TIMEOUT,
+            )
+            if response.status_code != 401:
+                break
+            # like the KG client, try once more with a fresh token
+            response.close()
+        with response:
+            response.raise_for_status()
+            yield from iter_json_array(
+                response.iter_content(chunk_size=chunk_size), 'data')
+
+
+def get_version_graph_query(version_uri=None):
+    """Return a query for a dataset, its versions, and their file repositories
+
+    The record of a ``Dataset`` has its ``@id``, and its ``versions`` (a
+    record, or a list of them, in the order of the dataset's versions).
+    Each version has its ``@id``, ``versionIdentifier``,
+    ``versionInnovation``, ``releaseDate``, and ``repository`` (with
+    ``@id`` and ``iri``).
+
+    If ``version_uri`` is given, the query only matches the dataset with
+    this version. Otherwise, the dataset is to be selected by its ID, with
+    the ``instanceId`` request parameter.
+    """
+    import fairgraph.openminds.core as omcore
+    vocab = _get_vocab(omcore.Dataset)
+    structure = [
+        {'path': '@id'},
+        {
+            'path': f'{vocab}hasVersion',
+            'propertyName': 'versions',
+            'ensureOrder': True,
+            'structure': [
+                {'path': '@id'},
+                {'path': f'{vocab}versionIdentifier',
+                 'propertyName': 'versionIdentifier',
+                 'singleValue': 'FIRST'},
+                {'path': f'{vocab}versionInnovation',
+                 'propertyName': 'versionInnovation',
+                 'singleValue': 'FIRST'},
+                {'path': f'{vocab}releaseDate',
+                 'propertyName': 'releaseDate',
+                 'singleValue': 'FIRST'},
+                {
+                    'path': f'{vocab}repository',
+                    'propertyName': 'repository',
+                    'singleValue': 'FIRST',
+                    'structure': [
+                        {'path': '@id'},
+                        {'path': f'{vocab}IRI',
+                         'propertyName': 'iri',
+                         'singleValue': 'FIRST'},
+                    ],
+                },
+            ],
+        },
+    ]
+    if version_uri:
+        structure.append({
+            'path': f'{vocab}hasVersion',
+            'propertyName': 'Qversion',
+            'required': True,
+            'structure': [{
+                'path': '@id',
+                'filter': {'op': 'EQUALS', 'value': version_uri},
+            }],
+        })
+    return _get_query(omcore.Dataset, 'Versions of a dataset', structure)
+
+
+def get_file_listing_query(repository_id):
+    """Return a query for the files of one or more file repositories
+
+    Records are slim, with the file's ``iri``, its ``hash`` (a record with
+    ``algorithm`` and ``digest``, or a list of them), its ``size``, and its
+    ``repository`` (a record with ``@id``). They are sorted by IRI, to give
+    stable page boundaries.
+
+    ``repository_id`` is the ID of a file repository, or a list of IDs.
+    """
+    import fairgraph.openminds.core as omcore
+    vocab = _get_vocab(omcore.File)
+    if isinstance(repository_id, str):
+        repository_filter = {'op': 'EQUALS', 'value': repository_id}
+    else:
+        # the UUIDs at the end of the IDs contain no special characters
+        repository_filter = {
+            'op': 'REGEX',
+            'value': '({})$'.format('|'.join(
+                i.rstrip('/').rsplit('/', 1)[-1] for i in repository_id)),
+        }
+    return _get_query(
+        omcore.File,
+        'File listing of a file repository',
+        [
+            {
+                'path': f'{vocab}IRI',
+                'propertyName': 'iri',
+                'required': True,
+                'singleValue': 'FIRST',
+                'sort': True,
+            },
+            {
+                'path': f'{vocab}hash',
+                'propertyName': 'hash',
+                'structure': [
+                    {'path': f'{vocab}algorithm',
+                     'propertyName': 'algorithm'},
+                    {'path': f'{vocab}digest',
+                     'propertyName': 'digest'},
+                ],
+            },
+            {
+                'path': [f'{vocab}storageSize', f'{vocab}value'],
+                'propertyName': 'size',
+                'singleValue': 'FIRST',
+            },
+            {
+                'path': f'{vocab}fileRepository',
+                'propertyName': 'repository',
+                'required': True,
+                'structure': [{
+                    'path': '@id',
+                    'filter': repository_filter,
+                }],
+            },
+        ],
+    )
+
+
+def _get_query(cls, description, structure):
+    type_ = cls.type_
+    if isinstance(type_, (list, tuple)):
+        type_ = type_[0]
+    return {
+        '@context': {
+            '@vocab': QUERY_VOCAB,
+            'propertyName': {'@id': 'propertyName', '@type': '@id'},
+            'path': {'@id': 'path', '@type': '@id'},
+        },
+        'meta': {
+            'type': type_,
+            'description': description,
+        },
+        'structure': structure,
+    }
+
+
+def _get_vocab(cls):
+    # the openMINDS vocabulary of the installed fairgraph
+    return cls.context.get('@vocab') or cls.context.get('vocab')
+
+
+def iter_json_array(chunks, key):
+    """Yield the items of array ``key`` of a JSON object given in ``chunks``
+
+    ``chunks`` is an iterable of UTF-8 encoded bytes, that together form a
+    JSON object. Only a single item of the array is held in memory at a
+    time, all other members of the object are skipped.
+
+    >>> chunks = [b'{"total": 2, "da', b'ta": [1, {"a"', b': 2}]}']
+    >>> list(iter_json_array(chunks, 'data'))
+    [1, {'a': 2}]
+    """
+    reader = _JSONReader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        member = reader.value()
+        reader.expect(':')
+        if member == key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            reader.value()
+        if reader.expect(',}') == '}':
+            return
+
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+# what may follow a complete value
+_delimiters = ' \t\n\r,:]}'
+_decoder = json.JSONDecoder()
+
+
+class _JSONReader:
+    """Reads a JSON document from chunks, one value at a time"""
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder('utf-8')().decode
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            text = self._decode(b'', final=True)
+        else:
+            text = self._decode(chunk)
+        # drop everything that has been consumed already
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character, without consuming it"""
+        while True:
+            self._pos = _whitespace.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON document')
+
+    def expect(self, chars):
+        """Consume and return the next character, must be one of ``chars``"""
+        c = self.peek()
+        if c not in chars:
+            raise ValueError(
+                f'Expected one of {chars!r} in JSON document, got {c!r}')
+        self._pos += 1
+        return c
+
+    def value(self):
+        """Consume and return the next JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+                # a number may continue in the next chunk, it is only
+                # complete when followed by a delimiter
+                if self._eof or (end < len(self._buf)
+                                 and self._buf[end] in _delimiters):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
@@ -0,0 +1,93 @@
+"""Adaptive page sizing for paginated Knowledge Graph queries"""
+
+import logging
+from threading import Lock
+
+
+lgr = logging.getLogger('datalad.ext.ebrains.paging')
+
+
+class AdaptivePageSize:
+    """Page size that adapts to the measured throughput of requests
+
+    The per-request latency of KG queries is substantial, hence large pages
+    are preferable -- up to the point where the server struggles to produce
+    them. Starting from ``initial``, the page size is doubled as long as the
+    throughput (records per second) of full pages improves, and halved
+    whenever a request fails (e.g., due to a timeout or a server error), or
+    the throughput drops substantially. A size that led to a failure is not
+    tried again, until ``retry_after`` requests at a smaller size have
+    succeeded. The page size is always kept within ``[minimum, maximum]``.
+    An ``initial`` or ``maximum`` size below ``minimum`` lowers the
+    minimum accordingly.
+
+    Instances are thread-safe, and can be shared by concurrent requests.
+    """
+    # relative throughput change that is considered a real difference,
+    # rather than noise
+    tolerance = 0.1
+    # number of successful requests after which a previously failed page
+    # size is considered again
+    retry_after = 10
+
+    def __init__(self, initial: int = 10000, *,
+                 minimum: int = 500, maximum: int = 100000):
+        # a smaller configured size must be honored
+        self.minimum = min(minimum, initial, maximum)
+        self.maximum = maximum
+        self._size = min(max(initial, self.minimum), self.maximum)
+        # best throughput observed at the current size, or below
+        self._best = None
+        # smallest size known to have failed, and the number of successful
+        # requests since
+        self._ceiling = None
+        self._successes = 0
+        self._lock = Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def record(self, size: int, n_records: int, duration: float):
+        """Report a completed request for ``size`` records"""
+        if n_records < size or duration <= 0:
+            # a partial (last) page says nothing about the throughput
+            # of the requested size
+            return
+        throughput = n_records / duration
+        with self._lock:
+            if size != self._size:
+                # outdated measurement, the size has changed since
+                return
+            if self._ceiling is not None:
+                self._successes += 1
+                if self._successes >= self.retry_after:
+                    self._ceiling = None
+            if self._best is None \
+                    or throughput > self._best * (1 + self.tolerance):
+                self._best = throughput
+                if self._ceiling is None or size * 2 < self._ceiling:
+                    self._set_size(size * 2, 'throughput improved to %.0f '
+                                   'records/s' % throughput)
+            elif throughput < self._best * (1 - self.tolerance):
+                self._best = None
+                self._set_size(size // 2, 'throughput dropped to %.0f '
+                               'records/s' % throughput)
+
+    def failed(self, size: int, reason):
+        """Report a failed request for ``size`` records"""
+        with self._lock:
+            self._best = None
+            self._ceiling = size if self._ceiling is None \
+                else min(self._ceiling, size)
+            self._successes = 0
+            self._set_size(min(self._size, size // 2),
+                           'request failed: %s' % reason)
+
+    def _set_size(self, size, reason):
+        size = min(max(size, self.minimum), self.maximum)
+        if size == self._size:
+            return
+        lgr.debug('Changing page size %i -> %i (%s)',
+                  self._size, size, reason)
+        self._size = size
@@ -0,0 +1,145 @@
+"""Disk-backed collections of file records
+
+Some steps of an import need all file records of a version at once, e.g.,
+to determine the changes from the previous version, or to match records
+with the annex keys reported for them. For the largest EBRAINS file
+repositories, tens of millions of records do not fit into memory. Beyond a
+threshold, records are hence spilled into a scratch SQLite database, and
+are read back in batches whenever they are needed.
+"""
+
+from collections.abc import Collection
+from itertools import (
+    chain,
+    islice,
+)
+from operator import attrgetter
+import os
+from pathlib import Path
+import sqlite3
+import tempfile
+import weakref
+
+from datalad_ebrains.records import FileRecord
+
+
+def collect_file_records(frecs, threshold, dirpath=None):
+    """Return the records in ``frecs`` as a sized and re-iterable collection
+
+    Up to ``threshold`` records are returned as a list. Beyond that, all
+    records are stored in a ``SpilledFileRecords`` database in directory
+    ``dirpath`` (a temporary directory by default). At most ``threshold``
+    records are held in memory at any time. A collection is returned as is.
+    """
+    if isinstance(frecs, Collection):
+        return frecs
+    frecs = iter(frecs)
+    head = list(islice(frecs, threshold))
+    if len(head) < threshold:
+        return head
+    nxt = list(islice(frecs, 1))
+    if not nxt:
+        return head
+    return SpilledFileRecords(chain(head, nxt, frecs), dirpath)
+
+
+def iter_sorted_by_name(frecs):
+    """Yield the records of a collection, sorted by name"""
+    if isinstance(frecs, SpilledFileRecords):
+        return frecs.iter_sorted()
+    return iter(sorted(frecs, key=attrgetter('name')))
+
+
+class SpilledFileRecords(Collection):
+    """File records stored in a scratch SQLite database
+
+    Iteration yields ``FileRecord``s in the original order. The database
+    file is removed when the collection is closed or garbage collected.
+    Any number of iterations may run at the same time, also in different
+    threads, each reads via its own connection.
+    """
+    # number of records to write or read at a time
+    batch_size = 10000
+
+    def __init__(self, frecs, dirpath=None):
+        fd, path = tempfile.mkstemp(
+            prefix='ebrains-records-', suffix='.sqlite', dir=dirpath)
+        os.close(fd)
+        self.path = Path(path)
+        self._finalizer = weakref.finalize(self, _unlink, self.path)
+        self._len = 0
+        con = sqlite3.connect(self.path)
+        try:
+            # scratch data, nothing to recover after a crash
+            con.execute('PRAGMA journal_mode=OFF')
+            con.execute('PRAGMA synchronous=OFF')
+            con.execute(
+                'CREATE TABLE records '
+                '(url TEXT, name TEXT, md5sum TEXT, size INTEGER)')
+            frecs = iter(frecs)
+            while True:
+                rows = [
+                    (r.url, r.name, r.md5sum, r.size)
+                    for r in islice(frecs, self.batch_size)
+                ]
+                if not rows:
+                    break
+                con.executemany(
+                    'INSERT INTO records VALUES (?, ?, ?, ?)', rows)
+                self._len += len(rows)
+            # SQLite compares UTF-8 bytes, which gives the same order as
+            # Python's comparison of code points
+            con.execute('CREATE INDEX by_name ON records (name)')
+            con.commit()
+        except BaseException:
+            con.close()
+            self.close()
+            raise
+        con.close()
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return self._iter_query('SELECT * FROM records ORDER BY rowid')
+
+    def iter_sorted(self):
+        """Yield all records, sorted by name"""
+        return self._iter_query('SELECT * FROM records ORDER BY name')
+
+    def __contains__(self, frec):
+        if not isinstance(frec, FileRecord):
+            return False
+        con = sqlite3.connect(self.path)
+        try:
+            return con.execute(
+                'SELECT 1 FROM records '
+                'WHERE name = ? AND url = ? AND md5sum = ? AND size = ?',
+                (frec.name, frec.url, frec.md5sum, frec.size),
+            ).fetchone() is not None
+        finally:
+            con.close()
+
+    def close(self):
+        """Remove the database"""
+        self._finalizer()
+
+    def _iter_query(self, sql):
+        con = sqlite3.connect(self.path)
+        try:
+            cur = con.execute(sql)
+            while True:
+                rows = cur.fetchmany(self.batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield FileRecord(*row)
+        finally:
+            con.close()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path}, {self._len} records)'
+
+
+def _unlink(path):
+    path.unlink(missing_ok=True)
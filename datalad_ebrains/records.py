@@ -0,0 +1,92 @@
+"""Compact records of dataset versions and files
+
+An import holds the records of all versions for the whole run, and the
+records of all files of (at least) one version at a time. With millions
+of files, the overhead of a ``dict`` per record dominates memory. These
+types have no per-instance ``__dict__``, and carry only what an import
+needs.
+"""
+
+from datetime import date
+
+
+class VersionInfo:
+    """The properties of a ``DatasetVersion`` that an import needs
+
+    ``release_date`` is a ``datetime.date``, or ``None`` if unknown.
+    """
+    __slots__ = ('id', 'version_identifier', 'version_innovation',
+                 'release_date', 'repository_id', 'repository_iri')
+
+    def __init__(self, id, version_identifier, version_innovation,
+                 release_date, repository_id, repository_iri):
+        self.id = id
+        self.version_identifier = version_identifier
+        self.version_innovation = version_innovation
+        self.release_date = release_date
+        self.repository_id = repository_id
+        self.repository_iri = repository_iri
+
+    @property
+    def uuid(self):
+        return self.id.rstrip('/').rsplit('/', 1)[-1]
+
+    @classmethod
+    def from_query_record(cls, rec):
+        """Create from a version record of the version graph query"""
+        repo = rec.get('repository') or {}
+        try:
+            release_date = date.fromisoformat(rec['releaseDate'][:10])
+        except (KeyError, TypeError, ValueError):
+            # https://github.com/HumanBrainProject/fairgraph/issues/62
+            release_date = None
+        return cls(
+            id=rec['@id'],
+            version_identifier=rec.get('versionIdentifier'),
+            version_innovation=rec.get('versionInnovation'),
+            release_date=release_date,
+            repository_id=repo.get('@id'),
+            repository_iri=repo.get('iri'),
+        )
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.version_identifier!r})'
+
+
+class FileRecord:
+    """A file of a dataset version, as it is to be registered
+
+    ``name`` is the file's (platform native) path relative to the dataset
+    root, ``url`` its download URL, ``md5sum`` its MD5 checksum, and
+    ``size`` its size in bytes. Records with equal fields compare equal.
+    """
+    __slots__ = ('url', 'name', 'md5sum', 'size')
+
+    def __init__(self, url, name, md5sum, size):
+        self.url = url
+        self.name = name
+        self.md5sum = md5sum
+        self.size = size
+
+    def asdict(self):
+        """Return the fields as a ``dict``, e.g., for ``addurls``"""
+        return dict(
+            url=self.url,
+            name=self.name,
+            md5sum=self.md5sum,
+            size=self.size,
+        )
+
+    def _astuple(self):
+        return self.url, self.name, self.md5sum, self.size
+
+    def __eq__(self, other):
+        if not isinstance(other, FileRecord):
+            return NotImplemented
+        return self._astuple() == other._astuple()
+
+    def __hash__(self):
+        return hash(self._astuple())
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.name!r})'
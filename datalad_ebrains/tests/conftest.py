@@ -6,6 +6,8 @@ from unittest.mock import patch
 def authenticate():
     from datalad.api import ebrains_authenticate
     token = ebrains_authenticate(
+        # tests must not leave credentials behind
+        store=False,
         result_renderer='disabled',
         return_type='item-or-list',
     ).get('token')
@@ -0,0 +1,117 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+from datalad_ebrains.annex_batch import (
+    _BatchProcess,
+    get_batch_errors,
+    get_symlink_target,
+    iter_annex_keys,
+    register_files,
+)
+from datalad_ebrains.records import FileRecord
+
+
+needs_annex = pytest.mark.skipif(
+    shutil.which('git-annex') is None, reason='git-annex is not installed')
+
+
+def _get_records():
+    names = [
+        'README',
+        'sub-01/anat/sub-01_T1w.nii.gz',
+        'with space/and+plus.tar.bz2',
+        'ünicode/€.txt',
+        'noext',
+        'dotted.name.with.many.dots.json',
+    ]
+    return [
+        FileRecord(
+            f'https://example.com/{i}',
+            n.replace('/', os.sep),
+            f'{i:032x}',
+            i * 1000,
+        )
+        for i, n in enumerate(names)
+    ]
+
+
+def test_get_symlink_target():
+    ek = dict(key='MD5E-s1--abc.txt', hashdirmixed='Xy/Zw/')
+    assert get_symlink_target('f.txt', ek) == \
+        '.git/annex/objects/Xy/Zw/MD5E-s1--abc.txt/MD5E-s1--abc.txt'
+    assert get_symlink_target(os.path.join('a', 'b', 'f.txt'), ek) == \
+        '../../.git/annex/objects/Xy/Zw/MD5E-s1--abc.txt/MD5E-s1--abc.txt'
+
+
+def test_batch_process_error(tmp_path):
+    with _BatchProcess(
+            [sys.executable, '-c',
+             'import sys; sys.stdin.read(); '
+             'sys.stderr.write("oops\\n"); sys.exit(3)'],
+            tmp_path) as proc:
+        proc.write('some input\n')
+    assert proc.returncode == 3
+    assert proc.stderr == 'oops'
+    errors = list(get_batch_errors(None, proc))
+    assert len(errors) == 1
+    assert errors[0]['status'] == 'error'
+    assert errors[0]['message'][1:] == (' '.join(proc.cmd), 3, 'oops')
+    # a successful process reports nothing
+    with _BatchProcess([sys.executable, '-c', 'pass'], tmp_path) as proc:
+        pass
+    assert proc.returncode == 0
+    assert not list(get_batch_errors(None, proc))
+
+
+@needs_annex
+def test_iter_annex_keys(tmp_path):
+    from datalad.api import Dataset
+    ds = Dataset(tmp_path).create(result_renderer='disabled')
+    frecs = _get_records()
+    keys = list(iter_annex_keys(ds, iter(frecs)))
+    assert [r for r, ek in keys] == frecs
+    for r, ek in keys:
+        # MD5E keys, with git-annex's choice of extension
+        assert ek['key'].startswith(f'MD5E-s{r.size}--{r.md5sum}')
+    assert list(iter_annex_keys(ds, [])) == []
+
+
+@needs_annex
+def test_register_files_like_addurls(tmp_path):
+    from datalad.api import Dataset
+    frecs = _get_records()
+    batch = Dataset(tmp_path / 'batch').create(result_renderer='disabled')
+    res = list(register_files(batch, frecs))
+    assert [r['status'] for r in res] == ['ok'] * len(frecs)
+    addurls = Dataset(tmp_path / 'addurls').create(result_renderer='disabled')
+    addurls.addurls(
+        urlfile=[r.asdict() for r in frecs],
+        urlformat='{url}',
+        filenameformat='{name}',
+        key='et:MD5-s{size}--{md5sum}',
+        exclude_autometa='*',
+        fast=True,
+        save=False,
+        result_renderer='disabled',
+    )
+    # identical symlinks, staged identically
+    for r in frecs:
+        assert os.readlink(batch.pathobj / r.name) \
+            == os.readlink(addurls.pathobj / r.name), r.name
+    ls_files = ['ls-files', '--stage', '--'] + [r.name for r in frecs]
+    assert batch.repo.call_git(ls_files) == addurls.repo.call_git(ls_files)
+    assert len(batch.repo.call_git(ls_files).splitlines()) == len(frecs)
+    # the same keys, with the same URLs
+    keys = [
+        sorted(ds.repo.call_annex_items_(
+            ['find', '--include=*', '--format=${key} ${file}\\n']))
+        for ds in (batch, addurls)
+    ]
+    assert keys[0] == keys[1]
+    assert len(keys[0]) == len(frecs)
+    for r in frecs:
+        for ds in (batch, addurls):
+            assert ds.repo.get_urls(r.name) == [r.url]
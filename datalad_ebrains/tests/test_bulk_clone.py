@@ -0,0 +1,78 @@
+from datalad_next.tests.utils import (
+    assert_in_results,
+    assert_result_count,
+)
+
+
+def test_bulk_clone(tmp_path):
+    from datalad.api import (
+        Dataset,
+        ebrains_bulk_clone,
+    )
+    v1 = 'fd303d56-e1aa-46a2-9d0c-7e5215aeb7ca'
+    v2 = '4ac9f0bc-560d-47e0-8916-7b24da9bb0ce'
+    srcfile = tmp_path / 'sources.txt'
+    srcfile.write_text(
+        f'# some comment\n\nhttps://search.kg.ebrains.eu/instances/{v2}\n')
+    res = ebrains_bulk_clone(
+        [v1, 'no-id-in-here'],
+        source_file=srcfile,
+        path=tmp_path / 'mirror',
+        jobs=2,
+        on_failure='ignore',
+        result_renderer='disabled',
+    )
+    # the invalid source did not prevent the others
+    assert_in_results(
+        res, action='ebrains_clone', source='no-id-in-here',
+        status='impossible')
+    # one summary per dataset
+    assert_result_count(
+        res, 2, action='ebrains_clone', type='dataset', status='ok')
+    dsv1 = Dataset(tmp_path / 'mirror' / v1)
+    dsv2 = Dataset(tmp_path / 'mirror' / v2)
+    check_branch = dsv1.repo.get_corresponding_branch() \
+        or dsv1.repo.get_active_branch()
+    log_cmd = ['log', '--oneline', check_branch]
+    # same result as individual clones
+    assert list(dsv1.repo.call_git_items_(log_cmd)) \
+        == list(dsv2.repo.call_git_items_(log_cmd))[1:]
+    # with several jobs, the commits of each dataset are bit-identical
+    # to those of an individual clone
+    from datalad.api import ebrains_clone
+    dsv2_single = ebrains_clone(
+        f'https://search.kg.ebrains.eu/instances/{v2}',
+        tmp_path / 'single',
+        result_xfm='datasets',
+        result_renderer='disabled',
+    )[-1]
+    assert list(dsv2_single.repo.call_git_items_(log_cmd)) \
+        == list(dsv2.repo.call_git_items_(log_cmd))
+
+
+def test_bulk_clone_resume(tmp_path):
+    from datalad.api import Dataset
+    from datalad_ebrains.bulk_clone import _clone
+    from datalad_ebrains.checkpoint import write_checkpoint
+
+    class FakeQuery:
+        def __init__(self):
+            self.calls = []
+
+        def bootstrap(self, from_id, dl_ds, depth=None):
+            self.calls.append(dl_ds.path)
+            return []
+
+    ebrains_id = 'fd303d56-e1aa-46a2-9d0c-7e5215aeb7ca'
+    ds = Dataset(tmp_path / ebrains_id).create(
+        annex=False, result_renderer='disabled')
+    fq = FakeQuery()
+    # an existing dataset is not touched, without being asked to
+    res = list(_clone(fq, ebrains_id, tmp_path, None, False))
+    assert_in_results(res, status='error')
+    assert not fq.calls
+    # but an interrupted clone is resumed
+    write_checkpoint(ds, ebrains_id, ds.repo.get_hexsha())
+    res = list(_clone(fq, ebrains_id, tmp_path, None, False))
+    assert_in_results(res, type='dataset', status='ok')
+    assert fq.calls == [ds.path]
@@ -0,0 +1,104 @@
+import subprocess
+
+import pytest
+
+from datalad_ebrains.checkpoint import (
+    get_checkpoint_path,
+    has_checkpoint,
+    read_checkpoint,
+    remove_checkpoint,
+    write_checkpoint,
+)
+
+
+def test_checkpoint(tmp_path):
+    from datalad.api import Dataset
+    ds = Dataset(tmp_path)
+    # nothing to resume without a dataset
+    assert not has_checkpoint(ds)
+    ds.create(annex=False, result_renderer='disabled')
+    dot_git = sorted(p.name for p in (tmp_path / '.git').iterdir())
+    assert not has_checkpoint(ds)
+    assert read_checkpoint(ds) is None
+    write_checkpoint(ds, 'abc', '0123')
+    assert has_checkpoint(ds)
+    assert read_checkpoint(ds) == dict(
+        ebrains_id='abc', commit='0123', version=None)
+    write_checkpoint(ds, 'abc', '4567', 'v1')
+    assert read_checkpoint(ds) == dict(
+        ebrains_id='abc', commit='4567', version='v1')
+    # nothing but the checkpoint
+    assert sorted(p.name for p in (tmp_path / '.git').iterdir()) == sorted(
+        dot_git + [get_checkpoint_path(ds).name])
+    remove_checkpoint(ds)
+    assert not has_checkpoint(ds)
+    # no error without a checkpoint
+    remove_checkpoint(ds)
+
+
+def test_checkpoint_gitdir(tmp_path):
+    from datalad.api import Dataset
+    # a worktree with a .git file, as for a submodule
+    subprocess.run(
+        ['git', 'init', '--quiet', '--separate-git-dir',
+         str(tmp_path / 'gitdir'), str(tmp_path / 'ds')],
+        check=True,
+    )
+    ds = Dataset(tmp_path / 'ds')
+    write_checkpoint(ds, 'abc', '0123')
+    assert get_checkpoint_path(ds).parent == tmp_path / 'gitdir'
+    assert has_checkpoint(ds)
+    assert (tmp_path / 'ds' / '.git').is_file()
+
+
+def test_restore_checkpoint(tmp_path):
+    from datalad.api import Dataset
+    from datalad_ebrains.fairgraph_query import (
+        FairGraphQuery,
+        _get_dataset_id,
+    )
+    from datalad_ebrains.records import VersionInfo
+
+    kg_ds_uuid = '5a16d948-8d1c-400c-b797-8a7ad29944b2'
+    versions = [
+        VersionInfo(f'https://kg.ebrains.eu/api/instances/{v}', v, v,
+                    None, None, None)
+        for v in ('v1', 'v2', 'v3')
+    ]
+    fq = FairGraphQuery.__new__(FairGraphQuery)
+    ds = Dataset(tmp_path / 'ds').create(
+        annex=False, result_renderer='disabled')
+    ds.config.set('datalad.dataset.id', _get_dataset_id(kg_ds_uuid),
+                  scope='branch')
+    ds.save(amend=True, result_renderer='disabled')
+    write_checkpoint(ds, kg_ds_uuid, ds.repo.get_hexsha())
+    # v1 was saved, with a subdataset
+    sub = ds.create('sub', annex=False, result_renderer='disabled')
+    (sub.pathobj / 'f1').write_text('1')
+    sub.save(version_tag='v1', result_renderer='disabled')
+    (ds.pathobj / 'f1').write_text('1')
+    ds.save(version_tag='v1', result_renderer='disabled')
+    v1 = ds.repo.get_hexsha()
+    v1_sub = sub.repo.get_hexsha()
+    # but v2 failed halfway: a saved subdataset, a new one, and
+    # uncommitted changes
+    (sub.pathobj / 'f2').write_text('2')
+    sub.save(version_tag='v2', result_renderer='disabled')
+    ds.create('sub2', annex=False, result_renderer='disabled')
+    (ds.pathobj / 'f2').write_text('2')
+    (ds.pathobj / 'f1').unlink()
+    fq.restore_checkpoint(ds, kg_ds_uuid, versions)
+    assert ds.repo.get_hexsha() == v1
+    assert sub.repo.get_hexsha() == v1_sub
+    assert [t['name'] for t in sub.repo.get_tags()] == ['v1']
+    assert not (ds.pathobj / 'sub2').exists()
+    assert not (ds.pathobj / 'f2').exists()
+    assert (ds.pathobj / 'f1').read_text() == '1'
+    assert read_checkpoint(ds) == dict(
+        ebrains_id=kg_ds_uuid, commit=v1, version='v1')
+    # the remaining versions can be imported
+    assert fq.get_missing_versions(ds, kg_ds_uuid, versions) == versions[1:]
+    # but not into a clone of another dataset
+    with pytest.raises(ValueError):
+        fq.restore_checkpoint(
+            ds, 'd07f9305-1e75-4548-a348-b155fb323d31', versions)
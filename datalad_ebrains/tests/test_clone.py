@@ -35,6 +35,83 @@ def test_clone_reproducibility(tmp_path):
     assert v1_history == v2_history[1:]
 
 
+def test_clone_update(tmp_path):
+    clone_kwargs = dict(
+        result_renderer='disabled',
+    )
+    from datalad.api import (
+        Dataset,
+        ebrains_clone,
+    )
+    # first version only
+    ebrains_clone(
+        'https://search.kg.ebrains.eu/instances/fd303d56-e1aa-46a2-9d0c-7e5215aeb7ca',
+        tmp_path / 'upd',
+        **clone_kwargs
+    )
+    # an existing dataset is not updated without being asked to
+    with pytest.raises(ValueError):
+        ebrains_clone(
+            'https://search.kg.ebrains.eu/instances/4ac9f0bc-560d-47e0-8916-7b24da9bb0ce',
+            tmp_path / 'upd',
+            **clone_kwargs
+        )
+    # update to the second version
+    ebrains_clone(
+        'https://search.kg.ebrains.eu/instances/4ac9f0bc-560d-47e0-8916-7b24da9bb0ce',
+        tmp_path / 'upd',
+        update=True,
+        **clone_kwargs
+    )
+    # nothing left to do
+    assert_in_results(
+        ebrains_clone(
+            'https://search.kg.ebrains.eu/instances/4ac9f0bc-560d-47e0-8916-7b24da9bb0ce',
+            tmp_path / 'upd',
+            update=True,
+            **clone_kwargs
+        ),
+        status='notneeded',
+    )
+    # fresh clone of both versions
+    ebrains_clone(
+        'https://search.kg.ebrains.eu/instances/4ac9f0bc-560d-47e0-8916-7b24da9bb0ce',
+        tmp_path / 'fresh',
+        **clone_kwargs
+    )
+    repos = [Dataset(tmp_path / p).repo for p in ('upd', 'fresh')]
+    check_branch = repos[0].get_corresponding_branch() \
+        or repos[0].get_active_branch()
+    log_cmd = ['log', '--oneline', check_branch]
+    # updated and fresh clone must be bit-identical
+    assert list(repos[0].call_git_items_(log_cmd)) \
+        == list(repos[1].call_git_items_(log_cmd))
+
+
+def test_clone_fast_import(tmp_path):
+    from datalad import cfg as dlcfg
+    from datalad.api import (
+        Dataset,
+        ebrains_clone,
+    )
+    source = 'https://search.kg.ebrains.eu/instances/4ac9f0bc-560d-47e0-8916-7b24da9bb0ce'
+    ebrains_clone(source, tmp_path / 'datalad', result_renderer='disabled')
+    dlcfg.set('datalad.ebrains.engine', 'fast-import', scope='override')
+    try:
+        ebrains_clone(source, tmp_path / 'fast', result_renderer='disabled')
+    finally:
+        dlcfg.unset('datalad.ebrains.engine', scope='override')
+    repos = [Dataset(tmp_path / p).repo for p in ('datalad', 'fast')]
+    check_branch = repos[0].get_corresponding_branch() \
+        or repos[0].get_active_branch()
+    for cmd in (['log', '--oneline', check_branch], ['tag']):
+        # both engines must yield bit-identical histories
+        assert list(repos[0].call_git_items_(cmd)) \
+            == list(repos[1].call_git_items_(cmd))
+    # and a clean worktree
+    assert not list(repos[1].call_git_items_(['status', '--porcelain']))
+
+
 def test_unsupported_filerepo(tmp_path):
     from datalad.api import ebrains_clone
     res = ebrains_clone(
@@ -85,6 +162,24 @@ def test_ebrains_clone(tmp_path):
         tmp_path)
 
 
+def test_clone_dry_run(tmp_path):
+    from datalad.api import ebrains_clone
+    res = ebrains_clone(
+        'https://search.kg.ebrains.eu/instances/900a1c2d-4914-42d5-a316-5472afca0d90',
+        tmp_path / 'plan',
+        depth=1,
+        dry_run=True,
+        result_renderer='disabled',
+    )
+    # nothing was created
+    assert not (tmp_path / 'plan').exists()
+    # a single version, and the summary
+    assert_result_count(res, 2)
+    # EBRAIN landing page states: 1678 files -- we must match that number
+    assert_result_count(res, 2, ebrains_files=1678)
+    assert_result_count(res, 1, ebrains_versions=1)
+
+
 def test_clone_invalid_call(tmp_path):
     # make sure the parameter validation is working
     from datalad.api import ebrains_clone
@@ -0,0 +1,59 @@
+import os
+import shutil
+
+import pytest
+
+from datalad_ebrains.environ import (
+    agent_environ,
+    create_dataset,
+    get_environ,
+)
+
+
+ENV = {
+    'GIT_AUTHOR_NAME': 'exporter',
+    'GIT_AUTHOR_EMAIL': 'exporter@example.com',
+    'GIT_AUTHOR_DATE': '2020-01-01T00:00:00',
+    'GIT_COMMITTER_NAME': 'exporter',
+    'GIT_COMMITTER_EMAIL': 'exporter@example.com',
+    'GIT_COMMITTER_DATE': '2020-01-02T00:00:00',
+}
+AGENT = 'exporter exporter@example.com 2020-01-01 ' \
+    'exporter exporter@example.com 2020-01-02'
+
+
+def _get_agent(ds):
+    return ds.repo.call_git_oneline(
+        ['log', '-1', '--format=%an %ae %ad %cn %ce %cd', '--date=short'])
+
+
+def test_agent_environ(tmp_path, monkeypatch):
+    from datalad.api import Dataset
+    monkeypatch.delenv('GIT_AUTHOR_DATE', raising=False)
+    ds = Dataset(tmp_path / 'ds').create(
+        annex=False, result_renderer='disabled')
+    other = Dataset(tmp_path / 'other').create(
+        annex=False, result_renderer='disabled')
+    runner = ds.repo._git_runner
+    with agent_environ(ds.repo, ENV):
+        (ds.pathobj / 'f').write_text('f')
+        ds.save(result_renderer='disabled')
+        # other datasets and the process are not affected
+        (other.pathobj / 'f').write_text('f')
+        other.save(result_renderer='disabled')
+        assert 'GIT_AUTHOR_DATE' not in os.environ
+    assert _get_agent(ds) == AGENT
+    assert 'exporter' not in _get_agent(other)
+    assert ds.repo._git_runner is runner
+    assert get_environ(ENV)['GIT_AUTHOR_DATE'] == '2020-01-01T00:00:00'
+    assert 'GIT_AUTHOR_DATE' not in os.environ
+
+
+@pytest.mark.skipif(
+    shutil.which('git-annex') is None, reason='git-annex is not installed')
+def test_create_dataset(tmp_path):
+    from datalad.api import Dataset
+    create_dataset(tmp_path / 'ds', ENV)
+    ds = Dataset(tmp_path / 'ds')
+    assert ds.is_installed()
+    assert _get_agent(ds) == AGENT
@@ -0,0 +1,239 @@
+from functools import partial
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from datalad_ebrains.fairgraph_query import (
+    FairGraphQuery,
+    _get_dataset_id,
+    _iter_concurrently,
+)
+from datalad_ebrains.record_store import SpilledFileRecords
+from datalad_ebrains.records import (
+    FileRecord,
+    VersionInfo,
+)
+
+
+def test_shard_ids():
+    kg_ds_uuid = '5a16d948-8d1c-400c-b797-8a7ad29944b2'
+    ds_id = _get_dataset_id(kg_ds_uuid)
+    assert _get_dataset_id(kg_ds_uuid, None) == ds_id
+    # reproducible, and distinct
+    shard_ids = [_get_dataset_id(kg_ds_uuid, s) for s in ('sub-01', 'sub-02')]
+    assert shard_ids == [
+        _get_dataset_id(kg_ds_uuid, s) for s in ('sub-01', 'sub-02')]
+    assert len(set(shard_ids + [ds_id])) == 3
+
+
+def test_split_shards(tmp_path):
+    fq = FairGraphQuery.__new__(FairGraphQuery)
+    fq.spill_threshold = 1000
+    fq.shard_threshold = 2
+    # a dataset with an existing subdataset
+    ds = SimpleNamespace(
+        pathobj=tmp_path,
+        repo=SimpleNamespace(dot_git=tmp_path),
+        subdatasets=lambda **kwargs: [str(tmp_path / 'd')],
+    )
+
+    def _rec(name):
+        name = name.replace('/', os.sep)
+        return FileRecord(f'https://example.com/{name}', name, 'md5', 1)
+
+    parts = fq._split_shards(ds, [
+        _rec('b/1'), _rec('README'), _rec('a/x/1'), _rec('c/1'),
+        _rec('a/2'), _rec('b/2'), _rec('a-b/1'), _rec('a/1'),
+    ])
+    assert sorted(parts, key=str) == [None, 'a', 'b', 'd']
+    assert [r.name for r in parts[None]] == ['README', 'c/1', 'a-b/1']
+    assert [r.name for r in parts['a']] == [
+        '1', '2', 'x/1'.replace('/', os.sep)]
+    assert [r.url for r in parts['a']] == [
+        'https://example.com/a/1', 'https://example.com/a/2',
+        _rec('a/x/1').url]
+    assert [r.name for r in parts['b']] == ['1', '2']
+    # existing subdatasets remain, even without files
+    assert parts['d'] == []
+    assert fq._split_shards(ds, []) == {None: [], 'd': []}
+
+
+def test_transition_ds_worktree(tmp_path):
+    fq = FairGraphQuery.__new__(FairGraphQuery)
+    fq.spill_threshold = 1000
+    ds = SimpleNamespace(
+        pathobj=tmp_path,
+        repo=SimpleNamespace(dot_git=tmp_path),
+    )
+
+    def _rec(name, md5sum='md5', url=None):
+        return FileRecord(
+            url or f'https://example.com/{name}', name, md5sum, 1)
+
+    prev = [_rec('keep'), _rec('gone'), _rec('modified'), _rec('moved')]
+    cur = [
+        _rec('new'), _rec('moved', url='https://example.com/elsewhere'),
+        _rec('modified', md5sum='other'), _rec('keep'),
+    ]
+    for as_spilled in (False, True):
+        wt = tmp_path / str(as_spilled)
+        wt.mkdir()
+        ds.pathobj = wt
+        for r in prev:
+            (wt / r.name).write_text(r.name)
+        register = fq.transition_ds_worktree(
+            ds,
+            SpilledFileRecords(prev, tmp_path) if as_spilled else prev,
+            SpilledFileRecords(cur, tmp_path) if as_spilled else cur,
+        )
+        # changed and new files, in the order of names
+        assert list(register) == [cur[2], cur[1], cur[0]]
+        # only unchanged files remain
+        assert sorted(p.name for p in wt.iterdir()) == ['keep']
+
+
+def test_bootstrap_after_failure(tmp_path):
+    from datalad.api import Dataset
+
+    kg_ds_uuid = '5a16d948-8d1c-400c-b797-8a7ad29944b2'
+    versions = [
+        VersionInfo(f'https://kg.ebrains.eu/api/instances/{v}', v, v,
+                    None, None, None)
+        for v in ('v1', 'v2', 'v3')
+    ]
+    frecs = {
+        v.uuid: [FileRecord(f'https://example.com/{v.uuid}', v.uuid, 'md5', 1)]
+        for v in versions
+    }
+    ds = Dataset(tmp_path / 'ds').create(
+        annex=False, result_renderer='disabled')
+    ds.config.set('datalad.dataset.id', _get_dataset_id(kg_ds_uuid),
+                  scope='branch')
+    ds.save(amend=True, result_renderer='disabled')
+
+    fq = FairGraphQuery.__new__(FairGraphQuery)
+    fq.engine = 'datalad'
+    fq.shard_threshold = 0
+    fq.spill_threshold = 1000
+    fq._timers = {}
+    fq.get_dataset_versions_from_id = \
+        lambda id, depth=None, refresh=False: (kg_ds_uuid, versions)
+    fq.iter_file_records = \
+        lambda ds, versions: ((v, frecs[v.uuid]) for v in versions)
+    # the previous records each version is imported on top of
+    imported = []
+
+    def _import(ds, kg_dsver, frecs, prev_frecs=None, shards=None):
+        imported.append((kg_dsver.uuid, prev_frecs))
+        if kg_dsver.uuid == 'v1':
+            # a file could not be registered
+            yield dict(action='addurls', status='error', path='v1')
+    fq.import_datasetversion = _import
+
+    list(fq.bootstrap(kg_ds_uuid, ds))
+    assert imported == [
+        ('v1', None),
+        # not on top of a worktree that may lack files of v1
+        ('v2', None),
+        ('v3', frecs['v2']),
+    ]
+
+
+def test_concurrent_agent_environments(tmp_path):
+    from datetime import datetime
+    from datalad.api import Dataset
+
+    fq = FairGraphQuery.__new__(FairGraphQuery)
+    # a plain Git dataset is enough to check the commits
+    datasets = [
+        Dataset(tmp_path / str(i)).create(
+            annex=False, result_renderer='disabled')
+        for i in range(6)
+    ]
+
+    def _import(i):
+        # each dataset has its own release dates
+        versions = [
+            VersionInfo(f'https://kg.ebrains.eu/api/instances/{i}-{v}',
+                        f'v{v}', f'version {v}', datetime(2000 + i, 1, v + 1),
+                        None, None)
+            for v in range(5)
+        ]
+        ds = datasets[i]
+        for v in versions:
+            (ds.pathobj / 'file').write_text(v.version_identifier)
+            list(fq.save_ds_version(ds, v))
+        yield ds, versions
+
+    # several datasets save at the same time
+    results = list(_iter_concurrently(
+        [partial(_import, i) for i in range(len(datasets))], 3))
+    assert len(results) == len(datasets)
+    for ds, versions in results:
+        dates = list(ds.repo.call_git_items_(
+            ['log', '-5', '--format=%ad %cd', '--date=short']))
+        assert dates == [
+            f'{v.release_date:%Y-%m-%d} {v.release_date:%Y-%m-%d}'
+            for v in reversed(versions)
+        ]
+    # the process environment was not touched
+    assert 'GIT_AUTHOR_DATE' not in os.environ
+
+
+def test_import_spilled_files(tmp_path, monkeypatch):
+    from datalad_ebrains import fairgraph_query
+    registered = []
+    monkeypatch.setattr(
+        fairgraph_query, 'register_files',
+        lambda ds, frecs: registered.append(frecs) or iter([]))
+
+    def _addurls(**kwargs):
+        # would collect all records in memory
+        raise AssertionError('addurls was used')
+
+    fq = FairGraphQuery.__new__(FairGraphQuery)
+    fq.register_backend = 'addurls'
+    ds = SimpleNamespace(
+        repo=SimpleNamespace(is_managed_branch=lambda: False),
+        addurls=_addurls,
+    )
+    frecs = SpilledFileRecords(
+        [FileRecord('https://example.com/f', 'f', 'a' * 32, 1)], tmp_path)
+    try:
+        assert list(fq.import_files(ds, None, frecs)) == []
+    finally:
+        frecs.close()
+    assert registered == [frecs]
+
+
+def test_iter_concurrently():
+    def _iter(n):
+        yield from range(n)
+    assert sorted(_iter_concurrently(
+        [lambda n=n: _iter(n) for n in range(5)], 2)) == sorted(
+            i for n in range(5) for i in range(n))
+
+    def _fail():
+        yield 1
+        raise RuntimeError('boom')
+    with pytest.raises(RuntimeError):
+        list(_iter_concurrently([_fail, lambda: _iter(3)], 2))
+
+
+def test_plan_read_only_cache():
+    fq = FairGraphQuery.__new__(FairGraphQuery)
+    fq.cache = SimpleNamespace(read_only=False)
+
+    def _plan(from_id, dl_ds, depth):
+        yield fq.cache.read_only
+        if from_id == 'fail':
+            raise RuntimeError('query failed')
+
+    fq._plan = _plan
+    assert list(fq.plan('id', None)) == [True]
+    # a later bootstrap can write to the cache again
+    assert fq.cache.read_only is False
+    with pytest.raises(RuntimeError):
+        list(fq.plan('fail', None))
+    assert fq.cache.read_only is False
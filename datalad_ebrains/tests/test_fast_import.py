@@ -0,0 +1,117 @@
+import shutil
+
+import pytest
+
+from datalad_ebrains import fast_import
+from datalad_ebrains.fast_import import (
+    TMP_REFS,
+    _delete_refs,
+    _iter_changes,
+    _publish_refs,
+    import_history,
+)
+from datalad_ebrains.records import FileRecord
+
+
+def test_publish_refs(tmp_path):
+    from datalad.api import Dataset
+    ds = Dataset(tmp_path).create(annex=False, result_renderer='disabled')
+    repo = ds.repo
+    branch = repo.get_active_branch()
+    head = repo.get_hexsha()
+    (ds.pathobj / 'f').write_text('f')
+    ds.save(result_renderer='disabled')
+    new = repo.get_hexsha()
+    # as a failed import would leave it behind
+    repo.call_git(['reset', '--hard', '--quiet', head])
+    repo.call_git(['update-ref', f'{TMP_REFS}heads/{branch}', new])
+    repo.call_git(['update-ref', f'{TMP_REFS}tags/v1', new])
+    _delete_refs(ds, TMP_REFS)
+    assert repo.get_hexsha(branch) == head
+    assert not repo.get_tags()
+    assert not list(repo.call_git_items_(['for-each-ref', TMP_REFS]))
+    # a successful one
+    repo.call_git(['update-ref', f'{TMP_REFS}heads/{branch}', new])
+    repo.call_git(['update-ref', f'{TMP_REFS}tags/v1', new])
+    _publish_refs(ds, TMP_REFS)
+    assert repo.get_hexsha(branch) == new
+    assert [(t['name'], t['hexsha']) for t in repo.get_tags()] \
+        == [('v1', new)]
+    assert not list(repo.call_git_items_(['for-each-ref', TMP_REFS]))
+    # nothing to do
+    _publish_refs(ds, TMP_REFS)
+    _delete_refs(ds, TMP_REFS)
+
+
+needs_annex = pytest.mark.skipif(
+    shutil.which('git-annex') is None, reason='git-annex is not installed')
+
+ENV = {
+    'GIT_AUTHOR_NAME': 'a', 'GIT_AUTHOR_EMAIL': 'a@example.com',
+    'GIT_AUTHOR_DATE': '2020-01-01T00:00:00',
+    'GIT_COMMITTER_NAME': 'a', 'GIT_COMMITTER_EMAIL': 'a@example.com',
+    'GIT_COMMITTER_DATE': '2020-01-01T00:00:00',
+}
+
+
+def test_iter_changes():
+    def _rec(name, md5sum='a', url=None):
+        return FileRecord(url or f'https://example.com/{name}', name,
+                          md5sum, 1)
+
+    prev = [_rec('c'), _rec('a'), _rec('b'), _rec('e')]
+    cur = [_rec('d'), _rec('a'), _rec('b', 'b'), _rec('c', url='u')]
+    assert [(r.name, c) for r, c in _iter_changes(prev, cur)] == [
+        ('b', 'M'), ('c', 'U'), ('d', 'M'), ('e', 'D')]
+    assert [(r.name, c) for r, c in _iter_changes([], cur)] == [
+        ('a', 'M'), ('b', 'M'), ('c', 'M'), ('d', 'M')]
+    assert [(r.name, c) for r, c in _iter_changes(cur, [])] == [
+        ('a', 'D'), ('b', 'D'), ('c', 'D'), ('d', 'D')]
+    assert not list(_iter_changes(cur, list(reversed(cur))))
+
+
+@needs_annex
+def test_import_history(tmp_path):
+    from datalad.api import Dataset
+    ds = Dataset(tmp_path).create(result_renderer='disabled')
+    frecs = [
+        FileRecord(f'https://example.com/{i}', f'f{i}.txt', f'{i:032x}', i)
+        for i in range(3)
+    ]
+    res = list(import_history(ds, [
+        (frecs[:2], ENV, 'first', 'v1'),
+        (frecs[1:], ENV, 'second', 'v2'),
+    ]))
+    assert [r['version_tag'] for r in res if r['action'] == 'save'] \
+        == ['v1', 'v2']
+    assert sorted(t['name'] for t in ds.repo.get_tags()) == ['v1', 'v2']
+    # worktree and index match the last version
+    assert not list(ds.repo.call_git_items_(['status', '--porcelain']))
+    assert sorted(p.name for p in ds.pathobj.glob('f*')) \
+        == ['f1.txt', 'f2.txt']
+    assert not list(ds.repo.call_git_items_(['for-each-ref', TMP_REFS]))
+
+
+@needs_annex
+def test_import_history_file_error(tmp_path, monkeypatch):
+    from datalad.api import Dataset
+    ds = Dataset(tmp_path).create(result_renderer='disabled')
+    head = ds.repo.get_hexsha()
+    iter_annex_keys = fast_import.iter_annex_keys
+
+    def _fail_one(ds, frecs):
+        for r, ek in iter_annex_keys(ds, frecs):
+            yield r, RuntimeError('no key') if r.name == 'f1.txt' else ek
+
+    monkeypatch.setattr(fast_import, 'iter_annex_keys', _fail_one)
+    frecs = [
+        FileRecord(f'https://example.com/{i}', f'f{i}.txt', f'{i:032x}', i)
+        for i in range(3)
+    ]
+    res = list(import_history(ds, [(frecs, ENV, 'first', 'v1')]))
+    assert [r['path'] for r in res if r['status'] == 'error'] \
+        == [str(ds.pathobj / 'f1.txt')]
+    # nothing was published, a rerun imports the version again
+    assert ds.repo.get_hexsha() == head
+    assert not ds.repo.get_tags()
+    assert not list(ds.repo.call_git_items_(['for-each-ref', TMP_REFS]))
@@ -0,0 +1,96 @@
+import pytest
+
+from datalad_ebrains.file_iris import (
+    _file_iri_to_url,
+    _get_fname_cscs_repo,
+    _get_fname_dataproxy_v1_bucket,
+    get_repository_type,
+    get_url_and_name_getter,
+)
+
+
+# relative paths within a repository, including everything that URL parsing
+# and path normalization treat specially
+names = [
+    'sub-01/anat/sub-01_T1w.nii.gz',
+    'README',
+    'with space/and+plus.txt',
+    'ünicode/€𝄞.txt',
+    'percent%20encoded%/file',
+    'query?a=b',
+    'fragment#part',
+    'params;x=1/file',
+    'double//slash',
+    'dot/./file',
+    'dotdot/../file',
+    '.hidden/..dots/.',
+    'trailing/',
+    '/leading',
+    'tab\tin/name',
+    'newline\nin/name',
+    'trailing space ',
+    '',
+    "quote's & (brackets) [x] {y} @!$*,=:",
+]
+
+
+def _check(repository_iri, iris, get_fname):
+    get_url_and_name = get_url_and_name_getter(repository_iri)
+    for iri in iris:
+        try:
+            expected = _file_iri_to_url(iri), str(get_fname(iri))
+        except AssertionError:
+            with pytest.raises(AssertionError):
+                get_url_and_name(iri)
+        else:
+            assert get_url_and_name(iri) == expected, iri
+
+
+def test_dataproxy_bucket():
+    assert get_repository_type(
+        'https://data-proxy.ebrains.eu/api/v1/public/buckets/my-bucket') \
+        == 'dataproxy-bucket'
+    for repo in (
+            'https://data-proxy.ebrains.eu/api/v1/public/buckets/my-bucket',
+            'https://data-proxy.ebrains.eu/api/v1/public/buckets/my-bucket/'):
+        _check(
+            repo,
+            ['https://data-proxy.ebrains.eu/api/v1/public/buckets/my-bucket/'
+             + n for n in names]
+            + [
+                'https://data-proxy.ebrains.eu/api/v1/public/buckets/other/f',
+                'https://data-proxy.ebrains.eu/api/v1/public/buckets/my-bucket',
+                'https://example.com/api/v1/public/buckets/my-bucket/f',
+            ],
+            _get_fname_dataproxy_v1_bucket,
+        )
+
+
+def test_cscs_repo():
+    assert get_repository_type(
+        'https://object.cscs.ch/v1/AUTH_4791e0a3/hbp-d000001_data'
+        '?prefix=MPM/13/') == 'cscs-container'
+    for baseurl in (
+            'https://object.cscs.ch/v1/AUTH_4791e0a3/hbp-d000001_data',
+            'https://object.cscs.ch/v1/AUTH_4791e0a3/hbp-d000001_data/'):
+        for prefix in ('MPM/13/', 'MPM/13', ''):
+            _check(
+                f'{baseurl}?prefix={prefix}',
+                [f'{baseurl.rstrip("/")}/{prefix}{n}' for n in names]
+                + [
+                    f'{baseurl.rstrip("/")}/MPM/13/{n}' for n in names[:3]
+                ] + [
+                    f'{baseurl.rstrip("/")}/other/{prefix}file',
+                    f'{baseurl.rstrip("/")}//{prefix}file',
+                    f'https://object.cscs.ch/v1/AUTH_other/{prefix}file',
+                ],
+                lambda iri: _get_fname_cscs_repo(baseurl, prefix, iri),
+            )
+
+
+def test_unknown_repo():
+    assert get_repository_type('https://example.com/files') is None
+    with pytest.raises(NotImplementedError):
+        get_url_and_name_getter('https://example.com/files')
+    with pytest.raises(NotImplementedError):
+        get_url_and_name_getter('')
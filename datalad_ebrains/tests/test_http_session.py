@@ -0,0 +1,36 @@
+import sys
+
+from datalad_ebrains import http_session
+from datalad_ebrains.tests.utils import (
+    JSONRequestHandler,
+    serve,
+)
+
+
+class _Handler(JSONRequestHandler):
+    def do_GET(self):
+        self.respond(200, {'data': []})
+
+
+def test_http_session_reuse():
+    with serve(_Handler) as host:
+        http_session.install()
+        # idempotent
+        http_session.install()
+        kg_requests = sys.modules[http_session._kg_communication_module] \
+            .requests
+        assert isinstance(kg_requests, http_session._SessionRequests)
+        before = http_session.get_stats()
+        for i in range(5):
+            # the way the KG client does it
+            r = kg_requests.request(
+                method='GET',
+                url=f'http://{host}/',
+                stream=True,
+            )
+            assert r.json() == {'data': []}
+        after = http_session.get_stats()
+        assert after['requests'] - before['requests'] == 5
+        # one connection for all of them
+        assert after['new'] - before['new'] == 1
+        assert after['reused'] - before['reused'] == 4
@@ -0,0 +1,230 @@
+import json
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from datalad_ebrains import kg_cache
+from datalad_ebrains.kg_cache import (
+    KGQueryCache,
+    _get_token_identity,
+)
+
+
+class Counter:
+    def __init__(self):
+        self.n = 0
+
+    def __call__(self):
+        self.n += 1
+        return ['response', self.n]
+
+
+def test_kg_cache(tmp_path):
+    cache = KGQueryCache(tmp_path, 'me', ttl=3600, maxsize=1024 * 1024)
+    fn = Counter()
+    assert not cache.has('File.list', dict(id='a'))
+    assert cache.cached('File.list', dict(id='a'), fn) == ['response', 1]
+    assert cache.has('File.list', dict(id='a'))
+    # second call is served from the cache
+    assert cache.cached('File.list', dict(id='a'), fn) == ['response', 1]
+    assert fn.n == 1
+    # different parameters, kind, or identity do not match
+    cache.cached('File.list', dict(id='b'), fn)
+    cache.cached('resolve', dict(id='a'), fn)
+    KGQueryCache(tmp_path, 'you', ttl=3600, maxsize=1024 * 1024).cached(
+        'File.list', dict(id='a'), fn)
+    assert fn.n == 4
+
+
+def test_kg_cache_refresh(tmp_path):
+    cache = KGQueryCache(tmp_path, 'me', ttl=3600, maxsize=1024 * 1024)
+    fn = Counter()
+    cache.cached('Dataset.versions', dict(id='a'), fn)
+    # the query is performed again, and its response replaces the entry
+    assert cache.cached(
+        'Dataset.versions', dict(id='a'), fn, refresh=True) == ['response', 2]
+    assert cache.cached('Dataset.versions', dict(id='a'), fn) \
+        == ['response', 2]
+    assert fn.n == 2
+
+
+def test_kg_cache_read_only(tmp_path):
+    cache = KGQueryCache(tmp_path / 'kg', 'me', ttl=3600,
+                         maxsize=1024 * 1024, read_only=True)
+    fn = Counter()
+    cache.cached('File.list', dict(id='a'), fn)
+    assert list(cache.cached_iter(
+        'File.listing', dict(id='a'), lambda: _iter_listing(3))) \
+        == list(_iter_listing(3))
+    # nothing was written
+    assert not (tmp_path / 'kg').exists()
+    # existing entries are used, but left untouched
+    cache.read_only = False
+    cache.cached('File.list', dict(id='a'), fn)
+    entry, = (tmp_path / 'kg').iterdir()
+    os.utime(entry, (1000, 1000))
+    cache.read_only = True
+    assert cache.cached('File.list', dict(id='a'), fn) == ['response', 2]
+    assert fn.n == 2
+    assert entry.stat().st_mtime == 1000
+
+
+def test_kg_cache_format(tmp_path, monkeypatch):
+    cache = KGQueryCache(tmp_path, 'me', ttl=3600, maxsize=1024 * 1024)
+    fn = Counter()
+    cache.cached('File.list', dict(id='a'), fn)
+    # entries of another format are not reused
+    monkeypatch.setattr(kg_cache, 'CACHE_FORMAT', kg_cache.CACHE_FORMAT + 1)
+    assert not cache.has('File.list', dict(id='a'))
+    cache.cached('File.list', dict(id='a'), fn)
+    assert fn.n == 2
+
+
+def test_kg_cache_ttl_bypass(tmp_path):
+    fn = Counter()
+    cache = KGQueryCache(tmp_path, 'me', ttl=0, maxsize=1024 * 1024)
+    cache.cached('File.list', dict(id='a'), fn)
+    time.sleep(0.01)
+    # expired
+    cache.cached('File.list', dict(id='a'), fn)
+    assert fn.n == 2
+    cache = KGQueryCache(tmp_path, 'me', ttl=3600, maxsize=1024 * 1024,
+                         enabled=False)
+    cache.cached('File.list', dict(id='a'), fn)
+    assert fn.n == 3
+
+
+def test_kg_cache_lru_eviction(tmp_path):
+    fn = Counter()
+    cache = KGQueryCache(tmp_path, 'me', ttl=3600, maxsize=0)
+    cache.cached('File.list', dict(id='a'), fn)
+    # nothing is retained with a zero size limit
+    assert not os.listdir(tmp_path)
+    cache.maxsize = 1024 * 1024
+    for i in range(3):
+        cache.cached('File.list', dict(id=i), fn)
+    # give each entry a distinct last-use time
+    entries = sorted(tmp_path.iterdir())
+    for i, p in enumerate(entries):
+        os.utime(p, (1000 + i, 1000 + i))
+    # limit the cache to two entries, the oldest one must go
+    cache.maxsize = sum(p.stat().st_size for p in entries[1:])
+    cache._evict()
+    assert sorted(tmp_path.iterdir()) == sorted(entries[1:])
+
+
+def test_kg_cache_size_tracking(tmp_path, monkeypatch):
+    fn = Counter()
+    cache = KGQueryCache(tmp_path, 'me', ttl=3600, maxsize=1024 * 1024)
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, '_scan', lambda: scans.append(1) or scan())
+    for i in range(5):
+        cache.cached('File.list', dict(id=i), fn)
+    # the cache directory is only scanned once
+    assert len(scans) == 1
+    assert cache._size == sum(p.stat().st_size for p in tmp_path.iterdir())
+    # replacing an entry does not inflate the size
+    cache.cached('File.list', dict(id=0), fn, refresh=True)
+    assert cache._size == sum(p.stat().st_size for p in tmp_path.iterdir())
+    # exceeding the limit evicts
+    cache.maxsize = cache._size
+    cache.cached('File.list', dict(id=5), fn)
+    assert len(scans) == 2
+    assert len(os.listdir(tmp_path)) == 5
+    assert cache._size == sum(p.stat().st_size for p in tmp_path.iterdir())
+
+
+def test_kg_cache_json(tmp_path):
+    cache = KGQueryCache(tmp_path, 'me', ttl=3600, maxsize=1024 * 1024)
+    cache.cached('File.count', dict(id='a'), lambda: 3)
+    list(cache.cached_iter(
+        'File.listing', dict(id='a'), lambda: _iter_listing(2)))
+    # entries are JSON lines, and never unpickled
+    for p in tmp_path.iterdir():
+        for line in p.read_text().splitlines():
+            json.loads(line)
+    assert cache.cached('File.count', dict(id='a'), lambda: 0) == 3
+    # tuples come back as lists
+    assert list(cache.cached_iter(
+        'File.listing', dict(id='a'), lambda: _iter_listing(2))) \
+        == _as_lists(_iter_listing(2))
+    # a defunct entry is a cache miss
+    for p in tmp_path.iterdir():
+        p.write_bytes(b'\x80\x04garbage\n')
+    assert cache.cached('File.count', dict(id='a'), lambda: 4) == 4
+
+
+def _iter_listing(n):
+    for i in range(n):
+        yield (f'https://example.com/files/{i}', f'{i:032x}', i)
+
+
+def _as_lists(items):
+    return [list(i) for i in items]
+
+
+def test_kg_cache_iter(tmp_path):
+    cache = KGQueryCache(tmp_path, 'me', ttl=3600, maxsize=1024 * 1024)
+    calls = []
+
+    def _fn():
+        calls.append(1)
+        return _iter_listing(10)
+
+    assert list(cache.cached_iter('File.listing', dict(id='a'), _fn)) \
+        == list(_iter_listing(10))
+    assert list(cache.cached_iter('File.listing', dict(id='a'), _fn)) \
+        == _as_lists(_iter_listing(10))
+    assert len(calls) == 1
+    # an incompletely consumed listing is not cached
+    next(cache.cached_iter('File.listing', dict(id='b'), _fn))
+    assert not cache.has('File.listing', dict(id='b'))
+    # neither is one that failed
+
+    def _fail():
+        yield from _iter_listing(2)
+        raise RuntimeError('connection lost')
+
+    with pytest.raises(RuntimeError):
+        list(cache.cached_iter('File.listing', dict(id='c'), _fail))
+    assert not cache.has('File.listing', dict(id='c'))
+    # nothing left behind
+    assert len(os.listdir(tmp_path)) == 1
+    # a listing larger than the cache is not cached
+    cache.maxsize = 1024
+    assert len(list(cache.cached_iter(
+        'File.listing', dict(id='d'), lambda: _iter_listing(100)))) == 100
+    assert not cache.has('File.listing', dict(id='d'))
+
+
+def test_kg_cache_iter_memory(tmp_path):
+    n = 100000
+    cache = KGQueryCache(tmp_path, 'me', ttl=3600, maxsize=1024 ** 3)
+    tracemalloc.start()
+    try:
+        for i in range(2):
+            # cache miss, then cache hit
+            tracemalloc.reset_peak()
+            count = 0
+            for item in cache.cached_iter(
+                    'File.listing', dict(id='a'), lambda: _iter_listing(n)):
+                count += 1
+            assert count == n
+            _, peak = tracemalloc.get_traced_memory()
+            # the listing alone would take >10MB in memory
+            assert peak < 1024 * 1024
+    finally:
+        tracemalloc.stop()
+    assert cache.has('File.listing', dict(id='a'))
+
+
+def test_get_token_identity():
+    assert _get_token_identity(None) == 'anonymous'
+    # header.payload.signature, with payload {"sub":"someone"}
+    assert _get_token_identity(
+        'e30.eyJzdWIiOiJzb21lb25lIn0.sig') == 'someone'
+    # anything else is hashed
+    assert len(_get_token_identity('bogus')) == 64
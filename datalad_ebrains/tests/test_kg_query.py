@@ -0,0 +1,150 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+from threading import (
+    BoundedSemaphore,
+    Lock,
+)
+import time
+from types import SimpleNamespace
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
+import pytest
+
+from datalad_ebrains import http_session
+from datalad_ebrains.kg_query import (
+    iter_json_array,
+    iter_query,
+)
+from datalad_ebrains.tests.utils import (
+    JSONRequestHandler,
+    serve,
+)
+
+
+def test_iter_json_array():
+    doc = json.dumps({
+        'total': 5,
+        'data': [
+            {'iri': 'https://example.com/ü€𝄞', 'size': 12345},
+            [1, 2],
+            12.5e3,
+            -1,
+            None,
+        ],
+        'size': 5,
+    }, ensure_ascii=False).encode('utf-8')
+    # any chunking, even within numbers and multi-byte characters
+    for n in (1, 3, 7, len(doc)):
+        assert list(iter_json_array(
+            [doc[i:i + n] for i in range(0, len(doc), n)], 'data')) == [
+                {'iri': 'https://example.com/ü€𝄞', 'size': 12345},
+                [1, 2],
+                12500.0,
+                -1,
+                None,
+        ]
+    assert list(iter_json_array([b'{}'], 'data')) == []
+    assert list(iter_json_array([b'{"data": []}'], 'data')) == []
+    assert list(iter_json_array([b'{"data": null}'], 'data')) == []
+    assert list(iter_json_array([b'{"error": {"code": 1}}'], 'data')) == []
+    # truncated document
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"data": [1, {"a": 2'], 'data'))
+
+
+class _Handler(JSONRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        # the token endpoint lookup of the KG client
+        self.respond(200, {'data': {'endpoint': 'http://localhost/token'}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        payload = json.loads(self.read_body())
+        self.requests.append(
+            (url.path, parse_qs(url.query), payload,
+             self.headers.get('Authorization')))
+        params = parse_qs(url.query)
+        start = int(params['from'][0])
+        size = int(params['size'][0])
+        self.respond(200, {
+            'data': [{'iri': f'file{i}'}
+                     for i in range(start, min(start + size, 5))],
+            'total': 5,
+        })
+
+
+def _get_client(host):
+    from kg_core.kg import kg
+    # all that is used of a fairgraph KGClient
+    return SimpleNamespace(
+        _kg_client=kg(host).with_token('secret').build())
+
+
+def test_iter_query():
+    with serve(_Handler) as host:
+        client = _get_client(host)
+        query = {'meta': {'type': 'File'}, 'structure': []}
+        assert list(iter_query(
+            client, query, from_index=3, size=10,
+            params=dict(repo='abc'))) == [
+                {'iri': 'file3'}, {'iri': 'file4'}]
+        path, params, payload, auth = _Handler.requests[-1]
+        assert path.endswith('/queries')
+        assert params['from'] == ['3']
+        assert params['size'] == ['10']
+        assert params['repo'] == ['abc']
+        assert params['stage'] == ['RELEASED']
+        assert payload == query
+        assert auth == 'Bearer secret'
+
+
+class _SlowHandler(_Handler):
+    lock = Lock()
+    running = 0
+    max_running = 0
+
+    def do_POST(self):
+        cls = self.__class__
+        with cls.lock:
+            cls.running += 1
+            cls.max_running = max(cls.max_running, cls.running)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.running -= 1
+        super().do_POST()
+
+
+def test_iter_query_request_limit(monkeypatch):
+    monkeypatch.setattr(http_session, '_request_slots', BoundedSemaphore(2))
+    with serve(_SlowHandler) as host:
+        client = _get_client(host)
+        query = {'meta': {'type': 'File'}, 'structure': []}
+        # many more concurrent queries than there are request slots,
+        # e.g. from several pools of several datasets
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            listings = list(executor.map(
+                lambda i: list(iter_query(client, query, size=5)),
+                range(8)))
+        assert all(len(r) == 5 for r in listings)
+        assert _SlowHandler.max_running == 2
+
+
+def test_iter_query_timeout(monkeypatch):
+    import requests
+    from datalad_ebrains import kg_query
+    slots = BoundedSemaphore(1)
+    monkeypatch.setattr(http_session, '_request_slots', slots)
+    # shorter than the delay of the response
+    monkeypatch.setattr(kg_query, 'TIMEOUT', (5, 0.01))
+    with serve(_SlowHandler) as host:
+        client = _get_client(host)
+        query = {'meta': {'type': 'File'}, 'structure': []}
+        with pytest.raises(requests.Timeout):
+            list(iter_query(client, query, size=5))
+        # the request slot is available again
+        assert slots.acquire(blocking=False)
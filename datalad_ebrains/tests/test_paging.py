@@ -0,0 +1,40 @@
+from datalad_ebrains.paging import AdaptivePageSize
+
+
+def test_adaptive_page_size():
+    ps = AdaptivePageSize(100, minimum=10, maximum=1000)
+    assert ps.size == 100
+    # first full page establishes a baseline and grows
+    ps.record(100, 100, 1.0)
+    assert ps.size == 200
+    # better throughput grows further
+    ps.record(200, 200, 1.0)
+    assert ps.size == 400
+    # similar throughput keeps the size
+    ps.record(400, 400, 1.95)
+    assert ps.size == 400
+    # partial pages and outdated measurements are ignored
+    ps.record(400, 10, 0.001)
+    ps.record(200, 200, 0.001)
+    assert ps.size == 400
+    # a substantial drop in throughput shrinks
+    ps.record(400, 400, 10.0)
+    assert ps.size == 200
+    # a failure shrinks, and the failed size is not tried again soon
+    ps.failed(200, 'timeout')
+    assert ps.size == 100
+    ps.record(100, 100, 1.0)
+    assert ps.size == 100
+    # ... but eventually it is
+    for i in range(ps.retry_after):
+        ps.record(100, 100, 1.0 / (i + 2))
+    assert ps.size == 200
+    # bounds are respected
+    for i in range(10):
+        ps.failed(ps.size, 'timeout')
+    assert ps.size == 10
+    assert AdaptivePageSize(1000000, maximum=1000).size == 1000
+    # configured sizes below the default minimum are honored
+    assert AdaptivePageSize(100).size == 100
+    assert AdaptivePageSize(100).minimum == 100
+    assert AdaptivePageSize(1000, maximum=200).size == 200
@@ -0,0 +1,54 @@
+from datalad_ebrains.record_store import (
+    SpilledFileRecords,
+    collect_file_records,
+    iter_sorted_by_name,
+)
+from datalad_ebrains.records import FileRecord
+
+
+def _get_records(n):
+    # not in the order of names
+    return [
+        FileRecord(f'https://example.com/{i}', f'd{i % 3}/ü{i}', f'md5{i}', i)
+        for i in range(n)
+    ]
+
+
+def test_collect_file_records(tmp_path):
+    frecs = _get_records(10)
+    # at or below the threshold, records stay in memory
+    assert collect_file_records(iter(frecs), 10, tmp_path) == frecs
+    assert collect_file_records(iter(frecs[:3]), 10, tmp_path) == frecs[:3]
+    assert collect_file_records(iter([]), 10, tmp_path) == []
+    assert not list(tmp_path.iterdir())
+    # collections are taken as they are
+    assert collect_file_records(frecs, 1, tmp_path) is frecs
+
+    spilled = collect_file_records(iter(frecs), 9, tmp_path)
+    assert isinstance(spilled, SpilledFileRecords)
+    assert spilled.path.parent == tmp_path
+    assert len(spilled) == 10
+    assert list(spilled) == frecs
+    # re-iterable, also concurrently
+    assert list(zip(spilled, spilled)) == list(zip(frecs, frecs))
+    assert frecs[3] in spilled
+    assert FileRecord('https://example.com/3', 'd0/ü3', 'md53', 4) \
+        not in spilled
+    assert collect_file_records(spilled, 1, tmp_path) is spilled
+    spilled.close()
+    assert not spilled.path.exists()
+
+
+def test_iter_sorted_by_name(tmp_path):
+    frecs = _get_records(25)
+    expected = sorted(frecs, key=lambda r: r.name)
+    assert list(iter_sorted_by_name(frecs)) == expected
+    spilled = SpilledFileRecords(iter(frecs), tmp_path)
+    # small batches
+    spilled.batch_size = 4
+    assert list(spilled.iter_sorted()) == expected
+    assert list(iter_sorted_by_name(spilled)) == expected
+    assert list(spilled) == frecs
+    path = spilled.path
+    del spilled
+    assert not path.exists()
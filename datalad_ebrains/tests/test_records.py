@@ -0,0 +1,46 @@
+from datetime import date
+import pickle
+
+import pytest
+
+from datalad_ebrains.records import (
+    FileRecord,
+    VersionInfo,
+)
+
+
+def test_version_info():
+    v = VersionInfo.from_query_record({
+        '@id': 'https://kg.ebrains.eu/api/instances/0a1b-2c3d/',
+        'versionIdentifier': 'v1.0',
+        'versionInnovation': 'First release',
+        'releaseDate': '2023-01-31T00:00:00',
+        'repository': {'@id': 'repo-id', 'iri': 'https://example.com/repo'},
+    })
+    assert v.uuid == '0a1b-2c3d'
+    assert v.version_identifier == 'v1.0'
+    assert v.version_innovation == 'First release'
+    assert v.release_date == date(2023, 1, 31)
+    assert v.repository_id == 'repo-id'
+    assert v.repository_iri == 'https://example.com/repo'
+    assert repr(v) == "VersionInfo('v1.0')"
+    # incomplete metadata
+    v = VersionInfo.from_query_record({'@id': 'abc', 'releaseDate': None})
+    assert v.release_date is None
+    assert v.repository_id is None
+    # compact
+    assert not hasattr(v, '__dict__')
+    with pytest.raises(AttributeError):
+        v.other = 1
+
+
+def test_file_record():
+    r = FileRecord('https://example.com/a%20b', 'a b', '0123abcd', 5)
+    assert r.asdict() == dict(
+        url='https://example.com/a%20b', name='a b', md5sum='0123abcd',
+        size=5)
+    assert r == FileRecord(**r.asdict())
+    assert r != FileRecord('https://example.com/a%20b', 'a b', '0123abcd', 6)
+    assert len({r, FileRecord(**r.asdict())}) == 1
+    assert pickle.loads(pickle.dumps(r)) == r
+    assert not hasattr(r, '__dict__')
@@ -0,0 +1,42 @@
+import time
+
+from datalad_ebrains.timing import (
+    StageTimer,
+    sum_timings,
+)
+
+
+def test_stage_timer():
+    timer = StageTimer()
+    with timer('cleanup'):
+        time.sleep(0.01)
+    # durations add up
+    with timer('cleanup'):
+        time.sleep(0.01)
+    timer.add('save', 1.5)
+
+    def _produce():
+        time.sleep(0.01)
+        yield 1
+        time.sleep(0.01)
+        yield 2
+
+    consumed = []
+    for i in timer.time_iter('registration', _produce()):
+        # the consumer's time is not included
+        time.sleep(0.05)
+        consumed.append(i)
+    assert consumed == [1, 2]
+    timings = timer.as_dict()
+    assert list(timings) == ['cleanup', 'save', 'registration']
+    assert 0.02 <= timings['cleanup'] < 0.05
+    assert timings['save'] == 1.5
+    assert 0.02 <= timings['registration'] < 0.05
+
+
+def test_sum_timings():
+    assert sum_timings([
+        dict(save=1.0, listing=0.5),
+        dict(save=2.0, cleanup=0.25),
+    ]) == dict(save=3.0, listing=0.5, cleanup=0.25)
+    assert sum_timings([]) == {}
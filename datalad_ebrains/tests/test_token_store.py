@@ -0,0 +1,175 @@
+from base64 import urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+from urllib.parse import parse_qs
+
+import pytest
+
+from datalad_ebrains import http_session
+from datalad_ebrains.tests.utils import (
+    JSONRequestHandler,
+    serve,
+)
+from datalad_ebrains.token_store import (
+    TokenRefresher,
+    get_token_claims,
+    store_token,
+)
+
+
+def _make_token(**claims):
+    def _enc(d):
+        return urlsafe_b64encode(
+            json.dumps(d).encode()).decode().rstrip('=')
+    return f'{_enc(dict(alg="none"))}.{_enc(claims)}.'
+
+
+class _Credman:
+    # minimal in-memory stand-in with the CredentialManager get/set API
+    def __init__(self):
+        self.creds = {}
+
+    def get(self, name):
+        return self.creds.get(name)
+
+    def set(self, name, **kwargs):
+        cred = self.creds.setdefault(name, {})
+        for k, v in kwargs.items():
+            if v is None:
+                cred.pop(k, None)
+            else:
+                cred[k] = v
+
+
+def test_token_claims():
+    token = _make_token(sub='someone', exp=123)
+    assert get_token_claims(token) == dict(sub='someone', exp=123)
+
+
+class _TokenHandler(JSONRequestHandler):
+    # a token endpoint, responding after ``delay`` seconds
+    delay = 0
+
+    def do_POST(self):
+        data = parse_qs(self.read_body().decode())
+        self.requests.append(data)
+        time.sleep(self.delay)
+        self.respond(200, dict(
+            access_token=_make_token(sub='me', n=len(self.requests)),
+            refresh_token=f'refresh{len(self.requests)}',
+            expires_in=300,
+        ))
+
+
+def _get_refresher(host):
+    credman = _Credman()
+    # an access token that is about to expire
+    store_token(
+        'ebrains',
+        _make_token(sub='me', exp=int(time.time()) + 10),
+        'refresh0',
+        token_endpoint=f'http://{host}/token',
+        client_id='someclient',
+        credman=credman,
+    )
+    return TokenRefresher.from_credential('ebrains', credman), credman
+
+
+def test_token_refresh():
+    class _Handler(_TokenHandler):
+        requests = []
+
+    requests = _Handler.requests
+    with serve(_Handler) as host:
+        refresher, credman = _get_refresher(host)
+        assert credman.get('ebrains-refresh')['secret'] == 'refresh0'
+        assert refresher.can_refresh
+        # renewed on access
+        token = refresher.get_token()
+        assert get_token_claims(token)['n'] == 1
+        assert requests == [dict(
+            grant_type=['refresh_token'],
+            client_id=['someclient'],
+            refresh_token=['refresh0'],
+        )]
+        # the new tokens are stored, the refresh token has been rotated
+        assert credman.get('ebrains')['secret'] == token
+        assert credman.get('ebrains-refresh')['secret'] == 'refresh1'
+        # still valid, no renewal
+        assert refresher.get_token() == token
+        assert len(requests) == 1
+        # unless the token was rejected
+        token = refresher.get_token(force_refresh=True)
+        assert get_token_claims(token)['n'] == 2
+        assert requests[-1]['refresh_token'] == ['refresh1']
+        # background renewal, shortly before expiration
+        refresher.refresh_margin = 300
+        refresher.retry_interval = 0.1
+        refresher.start()
+        for i in range(50):
+            if len(requests) > 3:
+                break
+            time.sleep(0.1)
+        refresher.stop()
+        assert len(requests) > 3
+
+
+def test_token_refresh_concurrent():
+    class _Handler(_TokenHandler):
+        requests = []
+        delay = 0.2
+
+    with serve(_Handler) as host:
+        refresher, credman = _get_refresher(host)
+        token = refresher._token
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            # several renewals of the same expiring token
+            futures = [executor.submit(refresher.refresh, token)
+                       for i in range(4)]
+            for f in futures:
+                f.result()
+        # one renewal for all of them, the refresh token is used once
+        assert len(_Handler.requests) == 1
+        assert credman.get('ebrains-refresh')['secret'] == 'refresh1'
+        assert get_token_claims(refresher._token)['n'] == 1
+
+
+def test_token_refresh_timeout(monkeypatch):
+    import requests
+
+    class _Handler(_TokenHandler):
+        requests = []
+        delay = 0.5
+
+    monkeypatch.setattr(http_session, 'TIMEOUT', (5, 0.01))
+    with serve(_Handler) as host:
+        refresher, credman = _get_refresher(host)
+        token = refresher._token
+        with pytest.raises(requests.Timeout):
+            refresher.refresh()
+        # the token is unchanged, and can be renewed again
+        assert refresher._token == token
+        assert refresher._renewal is None
+
+
+def test_get_refresh_args():
+    from kg_core.oauth import (
+        DeviceAuthenticationFlow,
+        SimpleToken,
+    )
+    from datalad_ebrains.authenticate import _get_refresh_args
+    assert _get_refresh_args(SimpleToken('token')) == dict(refresh_token=None)
+    flow = DeviceAuthenticationFlow.__new__(DeviceAuthenticationFlow)
+    flow._DeviceAuthenticationFlow__refresh_token = 'refresh'
+    flow._DeviceAuthenticationFlow__token_endpoint = 'http://localhost/token'
+    flow._DeviceAuthenticationFlow__client_id = 'someclient'
+    assert _get_refresh_args(flow) == dict(
+        refresh_token='refresh',
+        token_endpoint='http://localhost/token',
+        client_id='someclient',
+    )
+    # a kg-core version that keeps them elsewhere
+    del flow._DeviceAuthenticationFlow__client_id
+    with pytest.raises(RuntimeError, match='ebrains-kg-core'):
+        _get_refresh_args(flow)
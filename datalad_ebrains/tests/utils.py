@@ -0,0 +1,68 @@
+"""Local HTTP servers standing in for EBRAINS services in tests"""
+
+from contextlib import contextmanager
+import http.server
+import json
+import sys
+from threading import Thread
+
+
+class JSONRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Request handler that responds with JSON documents
+
+    Subclasses implement ``do_GET()``/``do_POST()`` with ``respond()``.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def respond(self, code, body):
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients may hang up early, e.g., after a timeout
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_server(handler):
+    """Serve requests with ``handler`` on a free local port
+
+    Requests are handled in background threads, until ``stop_server()``
+    is called. The ``host:port`` of the server is ``get_host(server)``.
+    """
+    server = _Server(('localhost', 0), handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+def get_host(server):
+    return f'localhost:{server.server_port}'
+
+
+@contextmanager
+def serve(handler):
+    """Context manager version of ``start_server()``, yields the host"""
+    server = start_server(handler)
+    try:
+        yield get_host(server)
+    finally:
+        stop_server(server)
@@ -0,0 +1,65 @@
+"""Wall-clock timing of the stages of a dataset import"""
+
+from contextlib import contextmanager
+from threading import Lock
+import time
+
+
+class StageTimer:
+    """Accumulates the durations of named stages
+
+    Durations are in seconds. A stage can be timed any number of times,
+    and durations add up. Instances are thread-safe.
+
+    >>> timer = StageTimer()
+    >>> with timer('save'):
+    ...     pass
+    >>> list(timer.as_dict())
+    ['save']
+    """
+    def __init__(self):
+        self._durations = {}
+        self._lock = Lock()
+
+    def add(self, stage: str, duration: float):
+        with self._lock:
+            self._durations[stage] = self._durations.get(stage, 0.0) \
+                + duration
+
+    @contextmanager
+    def __call__(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def time_iter(self, stage: str, iterable):
+        """Yield from ``iterable``, timing only the production of items
+
+        Time spent by the consumer of the items is not included.
+        """
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def as_dict(self) -> dict:
+        """Return all durations (rounded to milliseconds), by stage"""
+        with self._lock:
+            return {k: round(v, 3) for k, v in self._durations.items()}
+
+
+def sum_timings(timings) -> dict:
+    """Return the total duration of each stage across ``timings`` dicts"""
+    total = {}
+    for t in timings:
+        for k, v in t.items():
+            total[k] = round(total.get(k, 0.0) + v, 3)
+    return total
@@ -0,0 +1,263 @@
+"""Persistent EBRAINS access tokens with automatic refresh
+
+Tokens obtained by ``ebrains-authenticate`` are stored in DataLad's
+credential system: the access token as credential ``<name>``, and the
+refresh token as credential ``<name>-refresh``. Access tokens are short-lived.
+They are renewed with the refresh token in the background, shortly before
+they expire, such that long-running clones are not interrupted.
+"""
+
+from base64 import urlsafe_b64decode
+import json
+import logging
+from threading import (
+    Event,
+    Lock,
+    Thread,
+)
+import time
+
+from datalad import cfg as dlcfg
+from datalad_next.credman import CredentialManager
+from datalad_next.exceptions import CapturedException
+
+from datalad_ebrains import http_session
+
+
+lgr = logging.getLogger('datalad.ext.ebrains.token_store')
+
+_lock = Lock()
+# one refresher per credential, for the entire process
+_refreshers = {}
+
+
+def store_token(name, access_token, refresh_token=None, *,
+                expires_in=None, token_endpoint=None, client_id=None,
+                credman=None):
+    """Store an access token, and optionally its refresh token
+
+    The expiration time is determined from ``expires_in`` (seconds), or
+    from the token itself.
+    """
+    credman = credman or CredentialManager(dlcfg)
+    expires = _get_expiration(access_token, expires_in)
+    credman.set(
+        name,
+        type='token',
+        secret=access_token,
+        expires=None if expires is None else str(int(expires)),
+        **{
+            'token-endpoint': token_endpoint,
+            'client-id': client_id,
+        }
+    )
+    if refresh_token:
+        credman.set(
+            f'{name}-refresh',
+            type='token',
+            secret=refresh_token,
+        )
+
+
+def get_refresher(name):
+    """Return the refresher for a stored token, or ``None``
+
+    ``None`` is returned, if no access token is stored under ``name``.
+    The refresher is shared by all callers in a process. Background
+    renewal is started on first access.
+    """
+    with _lock:
+        if name not in _refreshers:
+            refresher = TokenRefresher.from_credential(name)
+            if refresher is None:
+                return None
+            refresher.start()
+            _refreshers[name] = refresher
+        return _refreshers[name]
+
+
+class TokenRefresher:
+    """Access token that is renewed before it expires
+
+    Renewal requires a refresh token, a token endpoint, and a client ID.
+    Without them, the stored token is used as-is, until it expires.
+    """
+    # seconds before expiration at which a token is renewed
+    refresh_margin = 60
+    # seconds to wait before retrying a failed renewal
+    retry_interval = 30
+
+    def __init__(self, name, access_token, expires=None, *,
+                 refresh_token=None, token_endpoint=None, client_id=None,
+                 credman=None):
+        self.name = name
+        self._token = access_token
+        self._expires = expires
+        self._refresh_token = refresh_token
+        self._token_endpoint = token_endpoint
+        self._client_id = client_id
+        self._credman = credman
+        self._lock = Lock()
+        # set once an ongoing renewal completes
+        self._renewal = None
+        self._stop = Event()
+        self._thread = None
+
+    @classmethod
+    def from_credential(cls, name, credman=None):
+        credman = credman or CredentialManager(dlcfg)
+        cred = credman.get(name)
+        if not cred or not cred.get('secret'):
+            return None
+        refresh_cred = credman.get(f'{name}-refresh') or {}
+        expires = cred.get('expires')
+        return cls(
+            name,
+            cred['secret'],
+            float(expires) if expires else None,
+            refresh_token=refresh_cred.get('secret'),
+            token_endpoint=cred.get('token-endpoint'),
+            client_id=cred.get('client-id'),
+            credman=credman,
+        )
+
+    @property
+    def can_refresh(self):
+        return bool(
+            self._refresh_token and self._token_endpoint and self._client_id)
+
+    def get_token(self, force_refresh=False):
+        """Return a valid access token, renew it if needed"""
+        token = self._token
+        if self.can_refresh and (force_refresh or (
+                self._expires is not None
+                and time.time() >= self._expires - self.refresh_margin)):
+            try:
+                self.refresh(token)
+            except Exception as e:
+                # a still-valid token may work nevertheless
+                lgr.warning(
+                    'Could not renew EBRAINS access token, run '
+                    "'datalad ebrains-authenticate' again: %s",
+                    CapturedException(e))
+        return self._token
+
+    def refresh(self, token=None):
+        """Obtain a new access token with the refresh token, and store it
+
+        If ``token`` is given, the renewal is skipped if this token has
+        been replaced already (e.g., by a concurrent renewal). Only one
+        renewal is performed at a time, concurrent callers wait for its
+        completion, because it may rotate the refresh token.
+        """
+        with self._lock:
+            if token is not None and token != self._token:
+                return
+            renewal = self._renewal
+            if renewal is None:
+                self._renewal = Event()
+                refresh_token = self._refresh_token
+        if renewal is not None:
+            # bounded by the timeout of the request
+            renewal.wait()
+            return
+        try:
+            # the current token remains available during the request
+            r = http_session.get_session().post(
+                self._token_endpoint,
+                data={
+                    'grant_type': 'refresh_token',
+                    'client_id': self._client_id,
+                    'refresh_token': refresh_token,
+                },
+                timeout=http_session.TIMEOUT,
+            )
+            r.raise_for_status()
+            tokens = r.json()
+            with self._lock:
+                self._token = tokens['access_token']
+                self._expires = _get_expiration(
+                    self._token, tokens.get('expires_in'))
+                # refresh tokens may be rotated
+                self._refresh_token = tokens.get(
+                    'refresh_token', self._refresh_token)
+            store_token(
+                self.name,
+                self._token,
+                self._refresh_token,
+                expires_in=tokens.get('expires_in'),
+                token_endpoint=self._token_endpoint,
+                client_id=self._client_id,
+                credman=self._credman,
+            )
+            lgr.debug('Renewed EBRAINS access token %r', self.name)
+        finally:
+            with self._lock:
+                renewal, self._renewal = self._renewal, None
+            renewal.set()
+
+    def start(self):
+        """Start renewing the token in the background"""
+        if not self.can_refresh or self._thread is not None:
+            return
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_token_handler(self):
+        """Return a KG client token handler that uses this refresher"""
+        from kg_core.kg import CallableTokenHandler
+
+        refresher = self
+
+        class _Handler(CallableTokenHandler):
+            def get_token(self, force_fetch=False):
+                # a forced fetch follows a rejected token
+                return refresher.get_token(force_refresh=force_fetch)
+
+        return _Handler(self.get_token)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._expires is None:
+                # nothing to schedule against
+                return
+            delay = self._expires - self.refresh_margin - time.time()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            try:
+                self.refresh()
+                if self._expires is not None and time.time() \
+                        < self._expires - self.refresh_margin:
+                    continue
+                # tokens live shorter than the margin, do not spin
+            except Exception as e:
+                lgr.debug('Failed to renew EBRAINS access token: %s',
+                          CapturedException(e))
+            if self._stop.wait(self.retry_interval):
+                return
+
+
+def get_token_claims(token):
+    """Return the claims of an EBRAINS access token (a JWT)
+
+    Raises an exception, if the token cannot be decoded.
+    """
+    payload = token.split('.')[1]
+    # restore stripped padding
+    payload += '=' * (-len(payload) % 4)
+    return json.loads(urlsafe_b64decode(payload))
+
+
+def _get_expiration(token, expires_in=None):
+    if expires_in:
+        return time.time() + float(expires_in)
+    try:
+        return float(get_token_claims(token)['exp'])
+    except Exception:
+        return None